@@ -12,6 +12,17 @@ DATA_DIR = PROJECT_ROOT / 'data'
 RAW_DATA_DIR = DATA_DIR / 'raw'
 PROCESSED_DATA_DIR = DATA_DIR / 'processed'
 EXTERNAL_DATA_DIR = DATA_DIR / 'external'
+SNAPSHOT_DIR = PROCESSED_DATA_DIR / 'snapshot'  # Parquetスナップショット
+FEATURE_STORE_DIR = PROCESSED_DATA_DIR / 'features'  # レースごとの特徴量（特徴量セットのバージョンごと）
+
+# キャッシュ設定
+CACHE_DIR = PROJECT_ROOT / 'cache'
+HTTP_CACHE_DIR = CACHE_DIR / 'http'  # 取得したページのキャッシュ
+HTTP_CACHE_MAX_MB = 2048  # これを超えたら最終利用が古いものから削除
+HTTP_CACHE_IMMUTABLE_AFTER_DAYS = 1  # この日数以上前の日付のページは再取得しない
+PAGE_ARCHIVE_DIR = RAW_DATA_DIR / 'pages'  # 取得した全ページの追記専用アーカイブ（再パース用）
+PAGE_ARCHIVE_SEGMENT_MB = 256  # セグメントファイル1つの上限
+PAGE_ARCHIVE_CODEC = 'zstd'  # zstandardがなければzlib
 
 # ログ設定
 LOG_DIR = PROJECT_ROOT / 'logs'
@@ -20,14 +31,45 @@ LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
 # データベース設定
 DATABASE_PATH = PROJECT_ROOT / 'data' / 'oi_keiba.db'
+DATABASE_TIMEOUT = 30.0  # ロック待ちの最大秒数
+DATABASE_PRAGMAS = {
+    'journal_mode': 'WAL',       # 書き込み中も読み取りをブロックしない
+    'synchronous': 'NORMAL',     # WALモードでは NORMAL で十分な耐久性
+    'cache_size': -64000,        # ページキャッシュ 約64MB（負値はKB単位）
+    'mmap_size': 268435456,      # 256MBまでメモリマップで読み取り
+    'temp_store': 'MEMORY',
+    'busy_timeout': 30000,       # ミリ秒
+}
+BULK_INSERT_BATCH_SIZE = 5000  # executemanyで一度に書き込む行数
+QUERY_CACHE_MAX_MB = 256  # 読み取り結果キャッシュの上限（0で無効）
 
 # スクレイピング設定
 SCRAPING_DELAY = 1.0  # 秒
+SCRAPING_MAX_WORKERS = 4  # 同時に処理するリクエスト数
+SCRAPING_RATE_PER_HOST = 1.0 / SCRAPING_DELAY  # ホストごとの1秒あたりのリクエスト数
+SCRAPING_BURST = 1  # ホストごとに連続して送れるリクエスト数
+SCRAPING_MIN_RATE_PER_HOST = 0.1  # 応答が遅い・エラーが続くときに下げるレートの下限
+# 応答が速いときに基準レートの何倍まで上げるか（1.0では基準レートを超えない。1.0より大きくするのはサイトの許可がある場合だけ）
+SCRAPING_MAX_RATE_FACTOR = 1.0
+SCRAPING_TARGET_LATENCY = 2.0  # 秒（応答時間の移動平均がこれを超えたらレートを下げる）
+SCRAPING_CONNECT_TIMEOUT = 10.0  # 秒
+SCRAPING_READ_TIMEOUT = 30.0  # 秒
+SCRAPING_MAX_RETRIES = 3  # 一時的なエラー（接続エラー・タイムアウト・429/5xx）の再試行回数
+SCRAPING_BACKOFF_BASE = 1.0  # 秒（再試行ごとに2倍）
+SCRAPING_BACKOFF_MAX = 60.0  # 秒
+SCRAPING_RETRY_PASSES = 1  # 失敗したレースをまとめて取り直す回数
+CIRCUIT_BREAKER_WINDOW = 20  # エラー率を見る直近のリクエスト数
+CIRCUIT_BREAKER_THRESHOLD = 0.5  # このエラー率を超えたらリクエストを止める
+CIRCUIT_BREAKER_COOLDOWN = 60.0  # 秒（止めてから試しに再開するまで）
+PIPELINE_PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # HTMLパースのプロセス数
+PIPELINE_QUEUE_SIZE = 64  # 段の間のキューの上限（超えると前の段が待つ）
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 
 # netkeiba.com設定
 NETKEIBA_BASE_URL = 'https://db.netkeiba.com'
 OI_COURSE_CODE = '30'  # 大井競馬場のコード
+# 月ごとの開催カレンダー（base_urlからの相対パス）
+RACE_CALENDAR_PATH = '/top/calendar.html?year={year}&month={month}&jyo_cd={course}'
 
 # モデル設定
 MODEL_DIR = PROJECT_ROOT / 'models'
@@ -43,6 +85,12 @@ LIGHTGBM_PARAMS = {
     'bagging_freq': 5,
     'verbose': 0
 }
+# 出現回数がこれ未満の名前は訓練時から未知のカテゴリとして扱う（列ごと、指定がなければ1）
+CATEGORICAL_MIN_COUNTS = {
+    'jockey_name': 5,
+    'trainer_name': 5,
+}
+LIGHTGBM_NATIVE_CATEGORICAL = False  # Trueではカテゴリ列をLightGBMのカテゴリカル特徴量として渡す
 
 # 予想設定
 MIN_CONFIDENCE = 0.6  # 最小予想信頼度
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+開催日時点の成績特徴量のベンチマークスクリプト
+数百万行の合成履歴でAsOfFeatureEngineの処理時間を計測し、
+行ごとに過去のレースを絞り込む素朴な実装と一部の行で結果が一致することを確認する
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# プロジェクトルートを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.feature_engineering.point_in_time import AsOfFeatureEngine, ENTITIES
+from src.utils.logger import setup_logger
+
+
+def synthetic_history(rows, runners=12, races_per_day=12, seed=0):
+    """合成の出走履歴（馬はおよそ25走、騎手・調教師は数百人）"""
+    rng = np.random.default_rng(seed)
+    races = max(1, rows // runners)
+    race_index = np.repeat(np.arange(races), runners)[:rows]
+    day_index = race_index // races_per_day
+    dates = pd.Timestamp('2010-01-01') + pd.to_timedelta(day_index, unit='D')
+
+    horses = max(1, rows // 25)
+    return pd.DataFrame({
+        'race_id': race_index.astype('int64'),
+        'race_date': dates.strftime('%Y-%m-%d'),
+        'horse_id': rng.integers(0, horses, rows, dtype='int32'),
+        'jockey_id': rng.integers(0, 400, rows, dtype='int32'),
+        'trainer_id': rng.integers(0, 300, rows, dtype='int32'),
+        'finish_position': np.tile(np.arange(1, runners + 1, dtype='int8'), races)[:rows],
+    })
+
+
+def naive_as_of(history, rows):
+    """行ごとに同じエンティティのその日より前の出走を絞り込んで集計（確認用）"""
+    records = []
+    for _, row in rows.iterrows():
+        record = {}
+        for entity in ENTITIES:
+            key = f'{entity}_id'
+            past = history[(history[key] == row[key]) & (history['race_date'] < row['race_date'])]
+            starts = len(past)
+            record[f'{entity}_starts'] = starts
+            record[f'{entity}_avg_position'] = past['finish_position'].mean() if starts else np.nan
+            record[f'{entity}_win_rate'] = (past['finish_position'] == 1).mean() if starts else 0.0
+            record[f'{entity}_place_rate'] = (past['finish_position'] <= 3).mean() if starts else 0.0
+        records.append(record)
+    return pd.DataFrame(records, index=rows.index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='開催日時点の成績特徴量の計算速度を計測します')
+    parser.add_argument('--rows', type=int, default=3_000_000, help='合成履歴の行数（デフォルト: 300万）')
+    parser.add_argument('--check', type=int, default=200, help='素朴な実装と比較する行数（0で比較しない）')
+    parser.add_argument('--repeat', type=int, default=3, help='繰り返し回数（最速の回を採用）')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    args = parser.parse_args()
+
+    logger = setup_logger(__name__)
+
+    history = synthetic_history(args.rows, seed=args.seed)
+    logger.info(
+        f"合成履歴: {len(history):,}行 / 馬 {history['horse_id'].nunique():,}頭 / "
+        f"{history['race_date'].nunique():,}日 ({history.memory_usage(deep=True).sum() / 1024 / 1024:.0f}MB)"
+    )
+
+    engine = AsOfFeatureEngine()
+    best = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        features = engine.fit_transform(history)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    logger.info(f"開催日時点の特徴量: {best:.2f}秒 ({len(history) / best:,.0f} 行/秒, {features.shape[1]}列)")
+
+    # 予測時: 1レース分の出走馬に最後の状態を引く
+    race = history.tail(16)
+    start = time.perf_counter()
+    engine.transform_latest(race)
+    logger.info(f"最後の状態からの特徴量（16頭）: {(time.perf_counter() - start) * 1000:.2f}ミリ秒")
+
+    if args.check:
+        sample = history.sample(min(args.check, len(history)), random_state=args.seed)
+        start = time.perf_counter()
+        expected = naive_as_of(history, sample)
+        naive_elapsed = time.perf_counter() - start
+        logger.info(
+            f"素朴な実装: {args.check}行で {naive_elapsed:.2f}秒 "
+            f"(全行なら約 {naive_elapsed / len(sample) * len(history) / 3600:.1f}時間)"
+        )
+        actual = features.loc[sample.index, expected.columns]
+        if not np.allclose(actual.to_numpy(dtype='float64'), expected.to_numpy(dtype='float64'), equal_nan=True):
+            logger.error("素朴な実装と結果が一致しません")
+            return 1
+        logger.info("素朴な実装と結果が一致しました")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
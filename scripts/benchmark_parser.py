@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+HTMLパーサーのベンチマークスクリプト
+保存済みのページ（HTTPキャッシュまたはHTMLファイルのディレクトリ）を
+BeautifulSoup版とlxml版でパースし、処理速度と出力の一致を確認する
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# プロジェクトルートを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import HTTP_CACHE_DIR, NETKEIBA_BASE_URL
+from src.data_collection import parsers
+from src.data_collection.http_cache import HttpCache
+from src.data_collection.replay import synthetic_result_page
+from src.utils.logger import setup_logger
+
+RACE_RESULT_URL_PATTERN = r'/race/\d+/$'
+RACE_LIST_URL_PATTERN = r'/race/list/'
+
+
+def load_corpus(args):
+    """(種類, 本文)のリストを作成（種類は 'result' または 'list'）"""
+    corpus = []
+    if args.html_dir:
+        for path in sorted(Path(args.html_dir).glob('*.html')):
+            content = path.read_bytes()
+            corpus.append(('result' if b'race_table_01' in content else 'list', content))
+    elif Path(args.cache_dir).exists():
+        cache = HttpCache(args.cache_dir)
+        corpus.extend(('result', body) for _, body in cache.iter_bodies(RACE_RESULT_URL_PATTERN))
+        corpus.extend(('list', body) for _, body in cache.iter_bodies(RACE_LIST_URL_PATTERN))
+
+    if not corpus and args.synthetic:
+        corpus = [('result', synthetic_result_page(i)) for i in range(args.synthetic)]
+    return corpus[:args.limit] if args.limit else corpus
+
+
+def parse_all(corpus, parse_result, parse_list):
+    outputs = []
+    for kind, content in corpus:
+        if kind == 'result':
+            outputs.append(parse_result(content, 'RACE', '2024-01-01'))
+        else:
+            outputs.append(parse_list(content, '2024-01-01', NETKEIBA_BASE_URL))
+    return outputs
+
+
+def benchmark(corpus, parse_result, parse_list, repeat):
+    """最速の1回分の処理速度（ページ/秒）と出力を返す"""
+    best = None
+    outputs = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = parse_all(corpus, parse_result, parse_list)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(corpus) / best if best else float('inf'), outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTMLパーサー（BeautifulSoup / lxml）の速度と出力の一致を確認します')
+    parser.add_argument(
+        '--cache-dir',
+        type=Path,
+        default=HTTP_CACHE_DIR,
+        help='ページを読み込むHTTPキャッシュのディレクトリ（デフォルト: cache/http）'
+    )
+    parser.add_argument(
+        '--html-dir',
+        type=Path,
+        help='HTMLファイル（*.html）のディレクトリ（指定時はキャッシュより優先）'
+    )
+    parser.add_argument(
+        '--synthetic',
+        type=int,
+        default=200,
+        help='保存済みのページがない場合に生成する結果ページ数（デフォルト: 200）'
+    )
+    parser.add_argument('--limit', type=int, help='使うページ数の上限')
+    parser.add_argument('--repeat', type=int, default=3, help='繰り返し回数（最速の回を採用）')
+    args = parser.parse_args()
+
+    logger = setup_logger(__name__)
+
+    corpus = load_corpus(args)
+    if not corpus:
+        logger.error("ベンチマーク対象のページがありません")
+        return 1
+    logger.info(f"対象ページ数: {len(corpus)} (結果 {sum(kind == 'result' for kind, _ in corpus)}件)")
+
+    before, expected = benchmark(corpus, parsers.parse_race_result_bs4, parsers.parse_race_list_bs4, args.repeat)
+    after, actual = benchmark(corpus, parsers.parse_race_result, parsers.parse_race_list, args.repeat)
+
+    logger.info(f"BeautifulSoup (html.parser): {before:.1f} ページ/秒")
+    logger.info(f"lxml: {after:.1f} ページ/秒 ({after / before:.1f}倍)")
+
+    mismatches = [i for i, (old, new) in enumerate(zip(expected, actual)) if old != new]
+    if mismatches:
+        logger.error(f"出力が一致しないページがあります: {len(mismatches)}件 (例: {mismatches[:5]})")
+        return 1
+
+    logger.info("全ページで出力が一致しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
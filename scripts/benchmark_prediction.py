@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+予測レイテンシのベンチマークスクリプト
+合成の履歴を一時データベースに保存し、これから走るレースのOiKeibaPredictor.predict_raceを
+通算成績の索引を使う場合と、レースごとに集計テーブルを検索する以前の方法とで計測する
+"""
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+
+# プロジェクトルートを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import LIGHTGBM_PARAMS
+from src.data_collection.database import OiKeibaDatabase
+from src.feature_engineering.point_in_time import ENTITIES, STATE_COLUMNS, rates
+from src.models.lightgbm_model import LightGBMModel
+from src.prediction.predictor import OiKeibaPredictor
+from src.utils.logger import setup_logger
+
+
+class DatabaseStatsModel(LightGBMModel):
+    """索引を使う前の予測時特徴量（レースごとに集計テーブルを検索してマージする）"""
+
+    def create_as_of_features_prediction(self, df):
+        frames = []
+        for entity in ENTITIES:
+            name_column = f'{entity}_name'
+            stats = self.db.get_entity_stats(entity, df[name_column].unique().tolist())
+            state = df[[name_column]].merge(stats, on=name_column, how='left')[list(STATE_COLUMNS)].fillna(0)
+            frames.append(rates(state.set_axis(df.index), f'{entity}_'))
+        return pd.concat(frames, axis=1)
+
+
+def synthetic_results(races, runners, seed=0):
+    """合成のレース結果（馬はおよそ10走、騎手・調教師は数百人）"""
+    rng = np.random.default_rng(seed)
+    horses = max(runners, races * runners // 10)
+    rows = []
+    for race in range(races):
+        race_date = (pd.Timestamp('2015-01-01') + pd.Timedelta(days=race // 12)).strftime('%Y-%m-%d')
+        for position, horse in enumerate(rng.choice(horses, runners, replace=False), start=1):
+            rows.append({
+                'race_id': f'S{race:07d}',
+                'race_date': race_date,
+                'race_name': 'ベンチマーク',
+                'course_length': int(rng.choice([1200, 1400, 1600, 1800])),
+                'course_type': 'ダート',
+                'weather': str(rng.choice(['晴', '曇', '雨'])),
+                'track_condition': str(rng.choice(['良', '稍重', '重', '不良'])),
+                'horse_name': f'馬{horse}',
+                'finish_position': position,
+                'jockey_name': f'騎手{rng.integers(300)}',
+                'trainer_name': f'調教師{rng.integers(200)}',
+                'horse_weight': int(rng.integers(420, 520)),
+                'odds': float(rng.uniform(1.5, 80.0)),
+                'popularity': int(rng.integers(1, runners + 1)),
+                'time_result': '1:30.0',
+                'margin': '',
+            })
+    return rows
+
+
+def upcoming_races(history, count, runners, seed=1):
+    """履歴にいる馬・騎手・調教師で組んだ、まだデータベースにないレース"""
+    rng = np.random.default_rng(seed)
+    horses = history['horse_name'].unique()
+    jockeys = history['jockey_name'].unique()
+    trainers = history['trainer_name'].unique()
+    return [
+        pd.DataFrame({
+            'race_id': f'N{race:07d}',
+            'race_date': '2030-01-01',
+            'horse_name': rng.choice(horses, runners, replace=False),
+            'jockey_name': rng.choice(jockeys, runners),
+            'trainer_name': rng.choice(trainers, runners),
+            'course_length': 1600,
+            'horse_weight': rng.integers(420, 520, runners),
+            'odds': rng.uniform(1.5, 80.0, runners),
+            'popularity': np.arange(1, runners + 1),
+            'weather': '晴',
+            'track_condition': '良',
+        })
+        for race in range(count)
+    ]
+
+
+def train_small_model(model, history):
+    """計測用に少ない木の数でモデルを作る（予測の手順は本番と同じ）"""
+    X = model.prepare_features(history, is_training=True)
+    y = (history['finish_position'] - 1).clip(0, LIGHTGBM_PARAMS['num_class'] - 1)
+    params = dict(LIGHTGBM_PARAMS, verbose=-1)
+    model.model = lgb.train(params, lgb.Dataset(X, label=y), num_boost_round=20)
+    return model
+
+
+def measure(predictor, races, repeat):
+    """predict_raceのレイテンシ（ミリ秒）"""
+    predictor.predict_race(races[0])  # 初回の読み込みは除く
+    latencies = []
+    for _ in range(repeat):
+        for race in races:
+            start = time.perf_counter()
+            predictor.predict_race(race)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='1レースの予測にかかる時間を計測します')
+    parser.add_argument('--races', type=int, default=5000, help='合成履歴のレース数（デフォルト: 5000）')
+    parser.add_argument('--runners', type=int, default=16, help='1レースの出走頭数（デフォルト: 16）')
+    parser.add_argument('--predict', type=int, default=50, help='予測するレース数（デフォルト: 50）')
+    parser.add_argument('--repeat', type=int, default=3, help='繰り返し回数')
+    args = parser.parse_args()
+
+    logger = setup_logger(__name__)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = OiKeibaDatabase(Path(temp_dir) / 'benchmark.db')
+        db.bulk_save_race_results(synthetic_results(args.races, args.runners))
+        history = db.get_race_data(ascending=True)
+        races = upcoming_races(history, args.predict, args.runners)
+        logger.info(f"合成履歴: {len(history):,}行 / 馬 {history['horse_name'].nunique():,}頭")
+
+        predictor = OiKeibaPredictor()
+        results = {}
+        for label, model_class in (('以前（集計テーブルを検索）', DatabaseStatsModel), ('索引', LightGBMModel)):
+            model = model_class(model_name='benchmark_prediction')
+            model.db = model.stats_index.db = db
+            predictor.model = train_small_model(model, history)
+            predictor.db = db
+            latencies = measure(predictor, races, args.repeat)
+            results[label] = latencies
+            logger.info(
+                f"{label}: 中央値 {np.median(latencies):.2f}ミリ秒 / "
+                f"p95 {np.percentile(latencies, 95):.2f}ミリ秒 ({len(latencies)}回)"
+            )
+
+            # 特徴量の作成だけの時間
+            start = time.perf_counter()
+            for race in races:
+                model.create_as_of_features_prediction(race)
+            logger.info(f"{label}: 過去成績の特徴量 {(time.perf_counter() - start) / len(races) * 1000:.3f}ミリ秒/レース")
+
+        db.close()
+
+    before, after = (np.median(latencies) for latencies in results.values())
+    logger.info(f"predict_raceの中央値: {before:.2f} -> {after:.2f}ミリ秒 ({before / after:.1f}倍)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+スクレイパーのオフラインベンチマークスクリプト
+record: ページをフィクスチャのディレクトリに記録する（HTTPキャッシュ・netkeiba・生成ページから）
+run:    フィクスチャをローカルHTTPサーバーから返し、一覧取得から保存までを通して計測する
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+# プロジェクトルートを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import HTTP_CACHE_DIR, PROCESSED_DATA_DIR, PIPELINE_PARSE_WORKERS
+from src.data_collection.database import OiKeibaDatabase
+from src.data_collection.fetcher import ConcurrentFetcher, CircuitBreaker
+from src.data_collection.http_cache import HttpCache
+from src.data_collection.pipeline import CollectionPipeline
+from src.data_collection.replay import FixtureStore, ReplayServer, build_synthetic_site
+from src.data_collection.scraper import OiKeibaScraper
+from src.utils.logger import setup_logger
+
+DEFAULT_FIXTURES_DIR = PROCESSED_DATA_DIR / 'scraper_fixtures'
+# フィクスチャとして取り込むページ（カレンダー・レース一覧・レース結果）
+FIXTURE_URL_PATTERN = r'/top/calendar\.html|/race/list/|/race/\d+/$'
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def record(args, logger):
+    """フィクスチャを記録"""
+    store = FixtureStore(args.fixtures)
+
+    if args.synthetic:
+        races = build_synthetic_site(store, args.start or datetime(2024, 1, 1), args.synthetic,
+                                     args.races_per_day, args.runners)
+        logger.info(f"生成したレース: {races}件")
+    elif args.live:
+        if not (args.start and args.end):
+            logger.error("--live には --start と --end が必要です")
+            return 1
+        # 一時的なキャッシュに取得してからフィクスチャに取り込む
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = HttpCache(Path(temp_dir) / 'http')
+            db = OiKeibaDatabase(Path(temp_dir) / 'record.db')
+            scraper = OiKeibaScraper(db=db, fetcher=ConcurrentFetcher(cache=cache))
+            race_list = scraper.plan_races(args.start, args.end)
+            for race, _, error in scraper.fetcher.map(
+                lambda race: scraper.fetch_race_result_page(race['race_id'], race['race_date']), race_list
+            ):
+                if error is not None:
+                    logger.warning(f"取得できませんでした: {race['race_id']} - {error}")
+            count = store.import_cache(cache, FIXTURE_URL_PATTERN)
+            db.close()
+        logger.info(f"netkeibaから記録したページ: {count}件")
+    else:
+        cache_dir = Path(args.from_cache)
+        if not (cache_dir / 'index.db').exists():
+            logger.error(f"HTTPキャッシュがありません: {cache_dir}")
+            return 1
+        count = store.import_cache(HttpCache(cache_dir), FIXTURE_URL_PATTERN)
+        logger.info(f"キャッシュから記録したページ: {count}件")
+
+    store.save()
+    logger.info(f"フィクスチャ: {args.fixtures} ({len(store)}ページ, 開催日 {len(store.meeting_dates())}日)")
+    return 0
+
+
+def run_once(store, start, end, workers, args, logger):
+    """1つの並行数で一覧取得から保存までを計測"""
+    with ReplayServer(store, latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate, seed=args.seed) as server, \
+            tempfile.TemporaryDirectory() as temp_dir:
+        db = OiKeibaDatabase(Path(temp_dir) / 'benchmark.db')
+        fetcher = ConcurrentFetcher(
+            max_workers=workers, rate=args.rate, backoff_base=args.backoff,
+            breaker=CircuitBreaker(cooldown=args.cooldown)
+        )
+        scraper = OiKeibaScraper(db=db, fetcher=fetcher, base_url=server.base_url)
+        pipeline = CollectionPipeline(scraper, parse_workers=args.parse_workers, use_processes=not args.threads)
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        race_list = scraper.plan_races(start, end)
+        summary = pipeline.run(race_list)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        db.close()
+
+    stages = summary['metrics']['stages']
+    rows = summary['inserted'] + summary['replaced']
+    return {
+        'workers': workers,
+        'races': summary['races'],
+        'stored': summary['stored'],
+        'failed': summary['failed'],
+        'rows': rows,
+        'seconds': elapsed,
+        'requests': server.stats['requests'],
+        'injected_errors': server.stats['errors'],
+        'retries': fetcher.stats['retries'],
+        'requests_per_second': server.stats['requests'] / elapsed,
+        'rows_per_second': rows / elapsed,
+        # パースはワーカーでのCPU時間、取得はレスポンス待ちの合計（並行しているので経過時間より長くなる）
+        'parse_seconds': stages.get('parse', {}).get('seconds', 0.0),
+        'fetch_wait_seconds': stages.get('fetch', {}).get('seconds', 0.0),
+        'rate_limit_wait_seconds': fetcher.stats['wait_seconds'],
+        'write_seconds': stages.get('write', {}).get('seconds', 0.0),
+        'main_process_cpu_seconds': cpu,
+    }
+
+
+def run(args, logger):
+    """フィクスチャを使ってベンチマーク"""
+    store = FixtureStore(args.fixtures)
+    dates = store.meeting_dates()
+    if not dates:
+        logger.error(f"フィクスチャにレース一覧がありません: {args.fixtures}（先に record を実行してください）")
+        return 1
+    start = args.start or datetime.strptime(dates[0], '%Y%m%d')
+    end = args.end or datetime.strptime(dates[-1], '%Y%m%d')
+    logger.info(f"対象期間: {start:%Y-%m-%d} - {end:%Y-%m-%d} / 遅延 {args.latency}秒 / エラー率 {args.error_rate:.0%}")
+
+    results = []
+    for workers in args.workers:
+        result = run_once(store, start, end, workers, args, logger)
+        results.append(result)
+        logger.info(
+            f"並行数 {workers}: {result['seconds']:.2f}秒 / {result['requests_per_second']:.1f} リクエスト/秒 / "
+            f"{result['rows_per_second']:.0f} 行/秒 (パース {result['parse_seconds']:.2f}秒, "
+            f"応答待ち {result['fetch_wait_seconds']:.2f}秒, 保存 {result['write_seconds']:.2f}秒, "
+            f"失敗 {result['failed']}レース, 再試行 {result['retries']}回)"
+        )
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+        logger.info(f"結果を保存しました: {args.json}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='スクレイパーをネットワークに出ずに計測します')
+    parser.add_argument(
+        '--fixtures',
+        type=Path,
+        default=DEFAULT_FIXTURES_DIR,
+        help='フィクスチャのディレクトリ（デフォルト: data/processed/scraper_fixtures）'
+    )
+    parser.add_argument('--start', type=parse_date, help='開始日（YYYY-MM-DD）')
+    parser.add_argument('--end', type=parse_date, help='終了日（YYYY-MM-DD）')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='ページをフィクスチャに記録')
+    source = record_parser.add_mutually_exclusive_group()
+    source.add_argument(
+        '--from-cache',
+        default=HTTP_CACHE_DIR,
+        help='ページを取り込むHTTPキャッシュのディレクトリ（デフォルト: cache/http）'
+    )
+    source.add_argument('--live', action='store_true', help='netkeibaから取得して記録（--start/--end が必要）')
+    source.add_argument('--synthetic', type=int, metavar='DAYS', help='指定日数分のページを生成して記録')
+    record_parser.add_argument('--races-per-day', type=int, default=12, help='生成する1日あたりのレース数')
+    record_parser.add_argument('--runners', type=int, default=14, help='生成する1レースあたりの出走頭数')
+
+    run_parser = commands.add_parser('run', help='フィクスチャを使って計測')
+    run_parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        default=[1, 4, 8],
+        help='計測する並行数（複数指定で順に計測、デフォルト: 1 4 8）'
+    )
+    run_parser.add_argument(
+        '--parse-workers',
+        type=int,
+        default=PIPELINE_PARSE_WORKERS,
+        help=f'HTMLをパースするプロセス数（デフォルト: {PIPELINE_PARSE_WORKERS}）'
+    )
+    run_parser.add_argument('--threads', action='store_true', help='パースをプロセスではなくスレッドで行う')
+    run_parser.add_argument('--latency', type=float, default=0.05, help='応答の遅延（秒、デフォルト: 0.05）')
+    run_parser.add_argument('--jitter', type=float, default=0.02, help='遅延のばらつき（秒、デフォルト: 0.02）')
+    run_parser.add_argument('--error-rate', type=float, default=0.0, help='503を返す割合（デフォルト: 0）')
+    run_parser.add_argument('--rate', type=float, default=0, help='ホストごとの最大リクエスト数/秒（0で無制限）')
+    run_parser.add_argument('--backoff', type=float, default=0.05, help='再試行の初回の待ち秒数（デフォルト: 0.05）')
+    run_parser.add_argument('--cooldown', type=float, default=1.0, help='サーキットブレーカーの停止秒数（デフォルト: 1）')
+    run_parser.add_argument('--seed', type=int, default=0, help='遅延・エラー注入の乱数シード')
+    run_parser.add_argument('--json', help='結果をJSONで保存するファイル')
+    args = parser.parse_args()
+
+    logger = setup_logger(__name__)
+
+    try:
+        if args.command == 'record':
+            return record(args, logger)
+        return run(args, logger)
+    except KeyboardInterrupt:
+        logger.info("中断されました")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,10 +10,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import random
 from datetime import datetime, timedelta
 import pandas as pd
-import sqlite3
 from pathlib import Path
 
-from config.settings import DATABASE_PATH
 from src.data_collection.database import OiKeibaDatabase
 from src.utils.logger import setup_logger
 
@@ -210,11 +208,11 @@ class SampleDataGenerator:
         """データベースに保存"""
         logger.info("データベースに保存中...")
         
-        # レース結果を保存
-        self.db.save_race_results(race_results)
+        # レース結果を保存（1トランザクションで一括書き込み）
+        self.db.bulk_save_race_results(race_results)
         
-        # 馬データを保存
-        conn = sqlite3.connect(DATABASE_PATH)
+        # 馬データを保存（to_sqlは自身でコミットするため永続接続をそのまま渡す）
+        conn = self.db.get_connection()
         
         # horsesテーブル
         horses_df = pd.DataFrame(horses_data)
@@ -228,15 +226,13 @@ class SampleDataGenerator:
         stats_df = pd.DataFrame(stats)
         stats_df.to_sql('jockey_trainer_stats', conn, if_exists='replace', index=False)
         
-        conn.close()
-        
         logger.info("データベースへの保存完了！")
     
     def verify_data(self):
         """保存されたデータを確認"""
         logger.info("\nデータベースの内容を確認中...")
         
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = self.db.get_connection()
         
         # 各テーブルのレコード数を確認
         tables = ['race_results', 'horses', 'jra_horse_records', 'jockey_trainer_stats']
@@ -249,8 +245,6 @@ class SampleDataGenerator:
             df = pd.read_sql_query(f"SELECT * FROM {table} LIMIT 3", conn)
             print(f"\n{table}のサンプル:")
             print(df)
-        
-        conn.close()
 
 def main():
     """メイン処理"""
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Parquetスナップショット書き出しスクリプト
+race_resultsは月単位で分割し、前回から変更のあった月だけを書き直す
+"""
+import sys
+import argparse
+from pathlib import Path
+
+# プロジェクトルートを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.data_collection.snapshot import RaceHistorySnapshot, PARTITIONED_TABLES, FULL_TABLES
+from src.utils.logger import setup_logger
+
+def main():
+    parser = argparse.ArgumentParser(description='データベースをParquetスナップショットに書き出します')
+    parser.add_argument(
+        '--tables',
+        nargs='+',
+        choices=list(PARTITIONED_TABLES) + FULL_TABLES,
+        help='書き出すテーブル（デフォルト: すべて）'
+    )
+    parser.add_argument(
+        '--output-dir',
+        type=Path,
+        help='出力先ディレクトリ（デフォルト: data/processed/snapshot）'
+    )
+    args = parser.parse_args()
+    
+    logger = setup_logger(__name__)
+    
+    try:
+        snapshot = RaceHistorySnapshot(snapshot_dir=args.output_dir)
+        summary = snapshot.export(args.tables)
+        logger.info(f"スナップショットを書き出しました: {snapshot.snapshot_dir}")
+        for table, result in summary.items():
+            logger.info(f"  {table}: {result}")
+    
+    except Exception as e:
+        logger.error(f"スナップショット書き出しエラー: {e}")
+        return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
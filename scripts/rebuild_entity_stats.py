@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+集計テーブル（馬・騎手・調教師の通算成績）の再集計スクリプト
+通常はレース結果の保存時に差分更新されるため、不整合が疑われる場合に実行する
+"""
+import sys
+from pathlib import Path
+
+# プロジェクトルートを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.data_collection.database import OiKeibaDatabase, ENTITY_STATS_TABLES
+from src.utils.logger import setup_logger
+
+def main():
+    logger = setup_logger(__name__)
+    
+    try:
+        db = OiKeibaDatabase()
+        db.rebuild_entity_stats()
+        
+        for entity in ENTITY_STATS_TABLES:
+            logger.info(f"{entity}: {len(db.get_entity_stats(entity))}件")
+    
+    except Exception as e:
+        logger.error(f"再集計エラー: {e}")
+        return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+ページアーカイブの再パーススクリプト
+保存済みのレース結果ページを並列にパースし直してデータベースに保存し直す
+（パーサーの修正や列の追加を、取得し直さずに過去のデータへ反映する）
+"""
+import sys
+import argparse
+from pathlib import Path
+
+# プロジェクトルートを追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import HTTP_CACHE_DIR, PAGE_ARCHIVE_DIR, PIPELINE_PARSE_WORKERS
+from src.data_collection.database import OiKeibaDatabase
+from src.data_collection.http_cache import HttpCache
+from src.data_collection.page_archive import PageArchive, ArchiveReparser
+from src.feature_engineering.feature_store import FeatureStore
+from src.utils.logger import setup_logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ページアーカイブのレース結果を再パースして保存し直します')
+    parser.add_argument(
+        '--archive-dir',
+        type=Path,
+        default=PAGE_ARCHIVE_DIR,
+        help='ページアーカイブのディレクトリ（デフォルト: data/raw/pages）'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=PIPELINE_PARSE_WORKERS,
+        help=f'パースするプロセス数（デフォルト: {PIPELINE_PARSE_WORKERS}）'
+    )
+    parser.add_argument('--start', help='対象の開始日（YYYY-MM-DD）')
+    parser.add_argument('--end', help='対象の終了日（YYYY-MM-DD）')
+    parser.add_argument('--race-id', nargs='+', help='対象のレースID（複数指定可）')
+    parser.add_argument(
+        '--import-cache',
+        action='store_true',
+        help='先にHTTPキャッシュのページをアーカイブに取り込む（アーカイブ導入前に取得したページ用）'
+    )
+    parser.add_argument('--dry-run', action='store_true', help='対象のレース数だけ表示して終了')
+    args = parser.parse_args()
+
+    logger = setup_logger(__name__)
+
+    try:
+        archive = PageArchive(args.archive_dir)
+        if args.import_cache:
+            if (Path(HTTP_CACHE_DIR) / 'index.db').exists():
+                added = archive.import_cache(HttpCache(), r'/race/')
+                logger.info(f"HTTPキャッシュから取り込んだページ: {added}件")
+            else:
+                logger.warning(f"HTTPキャッシュがありません: {HTTP_CACHE_DIR}")
+
+        summary = archive.summary()
+        logger.info(
+            f"ページアーカイブ: {summary['pages']}ページ / {summary['races']}レース "
+            f"({summary['stored_mb']:.1f}MB, 展開後 {summary['size_mb']:.1f}MB)"
+        )
+
+        db = OiKeibaDatabase()
+        reparser = ArchiveReparser(archive, db, workers=args.workers)
+        if args.dry_run:
+            logger.info(f"対象レース数: {len(archive.race_records(args.race_id))}")
+            return 0
+
+        result = reparser.run(race_ids=args.race_id, start_date=args.start, end_date=args.end)
+        logger.info(
+            f"再パース完了: {result['parsed']}レース (結果表なし {result['empty']} / エラー {result['failed']} / "
+            f"開催日不明 {result['skipped']}) 新規 {result['inserted']}件 / 置換 {result['replaced']}件"
+        )
+        if result['inserted'] or result['replaced']:
+            FeatureStore(db=db).update_quietly()
+        return 0
+
+    except KeyboardInterrupt:
+        logger.info("ユーザーによって中断されました")
+        return 1
+    except Exception as e:
+        logger.error(f"再パースエラー: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
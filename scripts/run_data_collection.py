@@ -13,6 +13,12 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 from src.data_collection.scraper import OiKeibaScraper
 from src.data_collection.database import OiKeibaDatabase
+from src.data_collection.fetcher import ConcurrentFetcher
+from src.data_collection.http_cache import HttpCache
+from src.data_collection.page_archive import PageArchive
+from src.data_collection.pipeline import CollectionPipeline
+from src.feature_engineering.feature_store import FeatureStore
+from config.settings import SCRAPING_MAX_WORKERS, SCRAPING_RATE_PER_HOST, PIPELINE_PARSE_WORKERS
 from src.utils.logger import setup_logger
 
 
@@ -39,6 +45,9 @@ def main():
   
   # 最近7日間のデータを収集
   python scripts/run_data_collection.py --days-back 7
+  
+  # 中断した収集を未取得のレースから再開
+  python scripts/run_data_collection.py --months-back 36 --resume
         """
     )
     
@@ -67,7 +76,42 @@ def main():
         help='収集終了日（YYYY-MM-DD形式、デフォルト: 今日）'
     )
     
+    # 並行取得のオプション
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=SCRAPING_MAX_WORKERS,
+        help=f'同時に処理するリクエスト数（デフォルト: {SCRAPING_MAX_WORKERS}）'
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=SCRAPING_RATE_PER_HOST,
+        help=f'ホストごとの1秒あたりの最大リクエスト数（デフォルト: {SCRAPING_RATE_PER_HOST}）'
+    )
+    parser.add_argument(
+        '--parse-workers',
+        type=int,
+        default=PIPELINE_PARSE_WORKERS,
+        help=f'HTMLをパースするプロセス数（デフォルト: {PIPELINE_PARSE_WORKERS}）'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='HTTPキャッシュを使わずに全ページを取得し直す'
+    )
+    parser.add_argument(
+        '--no-archive',
+        action='store_true',
+        help='取得したページをアーカイブ（再パース用）に保存しない'
+    )
+    
     # その他のオプション
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='収集ジャーナルを使い、一覧取得済みの日付と保存済みのレースをスキップして再開'
+    )
     parser.add_argument(
         '--dry-run',
         action='store_true',
@@ -120,13 +164,20 @@ def main():
     try:
         # スクレイパーの初期化
         db = OiKeibaDatabase() if not args.dry_run else None
-        scraper = OiKeibaScraper(db=db)
+        cache = None if args.no_cache else HttpCache()
+        archive = None if args.no_archive else PageArchive()
+        fetcher = ConcurrentFetcher(max_workers=args.workers, rate=args.rate, cache=cache, archive=archive)
+        scraper = OiKeibaScraper(db=db, fetcher=fetcher)
         
         # データ収集の実行
         logger.info("データ収集を開始します...")
         
-        # get_race_listメソッドを直接呼び出し
-        race_list = scraper.get_race_list(start_date, end_date)
+        if args.dry_run:
+            # ジャーナルや開催カレンダーにも記録しない
+            race_list = scraper.get_race_list(start_date, end_date, record=False)
+        else:
+            # 一覧はジャーナルに記録し、--resumeでは保存済みのレースを除く
+            race_list = scraper.plan_races(start_date, end_date, resume=args.resume)
         logger.info(f"取得対象レース数: {len(race_list)}")
         
         if args.dry_run:
@@ -137,23 +188,40 @@ def main():
             if len(race_list) > 10:
                 logger.info(f"  ... 他 {len(race_list) - 10} レース")
         else:
-            # 実際のデータ収集
-            import time
-            from config.settings import SCRAPING_DELAY
+            # 実際のデータ収集（取得・パース・保存を段ごとに並行して進める）
+            pipeline = CollectionPipeline(scraper, parse_workers=args.parse_workers)
+            summary = pipeline.run(race_list)
             
-            for i, race in enumerate(race_list):
-                logger.info(f"進捗: {i+1}/{len(race_list)} - {race['race_name']}")
-                
-                results = scraper.scrape_race_result(race['race_id'], race['race_date'])
-                if results:
-                    scraper.db.save_race_results(results)
-                    logger.info(f"保存完了: {len(results)}件")
-                else:
-                    logger.warning(f"データ取得失敗: {race['race_id']}")
-                
-                # サーバーに負荷をかけないように待機
-                if i < len(race_list) - 1:  # 最後のレースの後は待機不要
-                    time.sleep(SCRAPING_DELAY)
+            logger.info(f"保存件数: 新規 {summary['inserted']}件 / 置換 {summary['replaced']}件")
+            if summary['inserted'] or summary['replaced']:
+                FeatureStore(db=db).update_quietly()
+            journal = scraper.journal.progress(start_date, end_date)
+            logger.info(
+                f"収集状況: 一覧取得 {journal['listed_dates']}日 / レース {journal['races']}件 "
+                f"(保存済み {journal['stored']} / 失敗 {journal['failed']} / 未取得 {journal['pending']})"
+            )
+            logger.info(
+                f"リクエスト数: {fetcher.stats['requests']}件 / エラー {fetcher.stats['errors']}件 "
+                f"(レート制限の待ち時間合計 {fetcher.stats['wait_seconds']:.1f}秒)"
+            )
+            logger.info(
+                f"再試行: {fetcher.stats['retries']}回 (429/5xx {fetcher.stats['throttled']}件, "
+                f"一時停止 {fetcher.stats['paused_seconds']:.0f}秒) / 取り直したレース {summary['retried']}件"
+            )
+        
+        if cache is not None:
+            summary = cache.summary()
+            logger.info(
+                f"HTTPキャッシュ: ヒット {summary['hits']}件 / 再検証 {summary['revalidated']}件 / "
+                f"ミス {summary['misses']}件 ({summary['entries']}件, {summary['size_mb']:.1f}MB)"
+            )
+        
+        if archive is not None:
+            summary = archive.summary()
+            logger.info(
+                f"ページアーカイブ: {summary['pages']}ページ / {summary['races']}レース "
+                f"({summary['stored_mb']:.1f}MB, 圧縮率 {summary['ratio']:.1f}倍)"
+            )
         
         logger.info("データ収集が完了しました！")
         
@@ -162,7 +230,6 @@ def main():
             conn = scraper.db.get_connection()
             total_records = conn.execute("SELECT COUNT(*) FROM race_results").fetchone()[0]
             logger.info(f"データベース内の総レコード数: {total_records}")
-            conn.close()
         
         return 0
         
@@ -17,7 +17,8 @@ def main():
     
     try:
         model = LightGBMModel()
-        accuracy = model.train()
+        # 特徴量ストアを差分で更新し、計算済みの特徴量で訓練する
+        accuracy = model.train(source='store')
         
         if accuracy:
             logger.info(f"モデル訓練が完了しました - 精度: {accuracy:.4f}")
@@ -1,162 +1,1218 @@
 """
 データベース操作ユーティリティ
 """
+import os
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
 import pandas as pd
 from pathlib import Path
-from config.settings import DATABASE_PATH
+from config.settings import (
+    DATABASE_PATH, DATABASE_TIMEOUT, DATABASE_PRAGMAS, BULK_INSERT_BATCH_SIZE, QUERY_CACHE_MAX_MB
+)
 from src.utils.logger import setup_logger
 
+
+class ConnectionManager:
+    """スレッドごとに永続的なSQLite接続を管理する"""
+
+    def __init__(self, db_path, pragmas=None, timeout=None):
+        self.db_path = Path(db_path)
+        self.pragmas = dict(DATABASE_PRAGMAS if pragmas is None else pragmas)
+        self.timeout = timeout or DATABASE_TIMEOUT
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._generation = 0
+        # DBファイル単位で共有するキャッシュ（ロールバック時に破棄する）
+        self.caches = {}
+        # 書き込みのたびに進めるデータのバージョン（読み取りキャッシュのキー）
+        self.write_version = 0
+
+    def _connect(self):
+        """新しい接続を作成してPRAGMAを適用"""
+        # 明示的なBEGIN/COMMITでトランザクションを管理するため自動コミットモードで開く
+        conn = sqlite3.connect(
+            str(self.db_path),
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def get_connection(self):
+        """現在のスレッド用の接続を取得（なければ作成）"""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        # close_all後やfork後のプロセスでは接続を作り直す
+        if conn is None or local.generation != self._generation or local.pid != os.getpid():
+            conn = self._connect()
+            local.conn = conn
+            local.generation = self._generation
+            local.pid = os.getpid()
+            local.depth = 0
+            # 変化はこの接続で前回見た値との差で判定する（新しい接続だけでは変化とみなさない）
+            local.data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """トランザクションのコンテキストマネージャ（ネストした場合は外側に合流）"""
+        conn = self.get_connection()
+        local = self._local
+        if local.depth > 0:
+            local.depth += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+
+        # 書き込みロックを先に確保してロック昇格時の競合を避ける
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            # 取り消される書き込みを前提にしたキャッシュを先に破棄する
+            for cache in self.caches.values():
+                cache.clear()
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            if conn.in_transaction:
+                conn.commit()
+            if immediate:
+                self.bump_write_version()
+        finally:
+            local.depth = 0
+
+    def bump_write_version(self):
+        """データのバージョンを進める（読み取りキャッシュを無効化）"""
+        with self._lock:
+            self.write_version += 1
+
+    def data_version(self):
+        """現在のデータのバージョンを取得
+
+        自プロセスの書き込みはwrite_versionで、他の接続・プロセスの書き込みは
+        PRAGMA data_version（ファイルを読まずに確認できる）の変化で検出する。
+        """
+        conn = self.get_connection()
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        local = self._local
+        # data_versionは接続ごとの値なので、同じ接続で作成時・前回から変わったときだけ進める
+        if local.data_version != version:
+            local.data_version = version
+            self.bump_write_version()
+        return self.write_version
+
+    def close_all(self):
+        """管理している全ての接続を閉じる"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+class QueryCache:
+    """読み取り結果のLRUキャッシュ（メモリ使用量で上限を管理し、データのバージョンが変わったら全破棄）"""
+
+    def __init__(self, max_mb=None):
+        self.max_bytes = int((QUERY_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = None
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        """キャッシュから取得（なければNone）"""
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # 呼び出し側の変更がキャッシュに及ばないようにコピーを返す
+            return entry[0].copy()
+
+    def put(self, key, version, df):
+        """結果を格納（上限を超えたら古いものから追い出す）"""
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # 読み込み中に書き込みがあった結果は格納しない
+            if version != self.version:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old[1]
+            self._entries[key] = (df.copy(), size)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._reset(None)
+
+    def stats(self):
+        """ヒット率などの統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size_mb': self.size_bytes / 1024 / 1024,
+            }
+
+    def _reset(self, version):
+        self._entries.clear()
+        self.size_bytes = 0
+        self.version = version
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path):
+    """DBファイルごとに共有される接続マネージャを取得"""
+    key = str(Path(db_path).resolve())
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = ConnectionManager(db_path)
+            _managers[key] = manager
+        return manager
+
+
+# race_resultsへの書き込み列（INSERT文とタプルの並び順）
+RACE_RESULT_COLUMNS = (
+    'race_id', 'race_date', 'race_name', 'course_length', 'course_type', 'weather',
+    'track_condition', 'horse_name', 'finish_position', 'jockey_name', 'trainer_name',
+    'horse_weight', 'odds', 'popularity', 'time_result', 'margin'
+)
+# 名前を整数IDに置き換える辞書テーブル（名前列: (テーブル名, ID列)）
+ENTITY_DICTIONARIES = {
+    'race_name': ('race_names', 'race_name_id'),
+    'horse_name': ('horse_names', 'horse_id'),
+    'jockey_name': ('jockey_names', 'jockey_id'),
+    'trainer_name': ('trainer_names', 'trainer_id'),
+}
+# レース単位の属性（racesテーブルにレースごとに1行だけ持つ）
+RACE_LEVEL_COLUMNS = ('race_date', 'race_name', 'course_length', 'course_type', 'weather', 'track_condition')
+# 実テーブルへの書き込み列（RACE_RESULT_COLUMNSの名前列をID列に置き換えたもの）
+RACE_COLUMNS = tuple(
+    ENTITY_DICTIONARIES[column][1] if column in ENTITY_DICTIONARIES else column
+    for column in ('race_id',) + RACE_LEVEL_COLUMNS
+)
+# 出走行は開催日以外のレース単位の属性を持たない（開催日は集計のインデックス用）
+RACE_ENTRY_COLUMNS = tuple(
+    ENTITY_DICTIONARIES[column][1] if column in ENTITY_DICTIONARIES else column
+    for column in RACE_RESULT_COLUMNS
+    if column == 'race_date' or column not in RACE_LEVEL_COLUMNS
+)
+_RACE_COLUMN_INDEXES = [RACE_RESULT_COLUMNS.index(column) for column in ('race_id',) + RACE_LEVEL_COLUMNS]
+_RACE_ENTRY_COLUMN_INDEXES = [
+    index for index, column in enumerate(RACE_RESULT_COLUMNS)
+    if column == 'race_date' or column not in RACE_LEVEL_COLUMNS
+]
+# get_race_dataで取得できる列（race_resultsビューの列）
+RACE_DATA_COLUMNS = RACE_RESULT_COLUMNS + ('created_at', 'horse_id', 'jockey_id', 'trainer_id')
+# compact=True で読み込むときの列ごとの型
+COMPACT_CATEGORY_COLUMNS = (
+    'race_name', 'course_type', 'weather', 'track_condition',
+    'horse_name', 'jockey_name', 'trainer_name'
+)
+COMPACT_INTEGER_DTYPES = {
+    'finish_position': 'int8',
+    'popularity': 'int8',
+    'course_length': 'int16',
+    'horse_weight': 'int16',
+}
+COMPACT_FLOAT_DTYPES = {
+    'odds': 'float32',
+}
+COMPACT_DATE_COLUMNS = ('race_date', 'created_at')
+COMPACT_ID_COLUMNS = ('horse_id', 'jockey_id', 'trainer_id')
+_RACE_ID_INDEX = RACE_RESULT_COLUMNS.index('race_id')
+_HORSE_NAME_INDEX = RACE_RESULT_COLUMNS.index('horse_name')
+_RACE_DATE_INDEX = RACE_RESULT_COLUMNS.index('race_date')
+_FINISH_POSITION_INDEX = RACE_RESULT_COLUMNS.index('finish_position')
+
+# 通算成績の集計テーブル（エンティティ種別: (テーブル名, 名前列)）
+ENTITY_STATS_TABLES = {
+    'horse': ('horse_stats', 'horse_name'),
+    'jockey': ('jockey_stats', 'jockey_name'),
+    'trainer': ('trainer_stats', 'trainer_name'),
+}
+ENTITY_STATS_COLUMNS = ('starts', 'wins', 'top3', 'position_sum', 'last_race_date')
+_ENTITY_NAME_INDEXES = {
+    entity: RACE_RESULT_COLUMNS.index(name_column)
+    for entity, (_, name_column) in ENTITY_STATS_TABLES.items()
+}
+# SQLiteのバインド変数上限を超えないようにIN句を分割する
+_MAX_SQL_VARIABLES = 500
+
+
+def _batched(iterable, size):
+    """iterableをsize件ずつのリストに分割"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def memory_usage_mb(df):
+    """DataFrameのメモリ使用量（MB）"""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def compact_race_data(df):
+    """レースデータを省メモリな型に変換（名前・条件はcategory、着順などは小さい整数）"""
+    df = df.copy()
+    for column in COMPACT_CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    # 欠損はスクレイパーの既定値と同じ0として扱う
+    for column, dtype in COMPACT_INTEGER_DTYPES.items():
+        if column in df.columns:
+            df[column] = df[column].fillna(0).astype(dtype)
+    for column, dtype in COMPACT_FLOAT_DTYPES.items():
+        if column in df.columns:
+            df[column] = df[column].astype(dtype)
+    for column in COMPACT_DATE_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    # IDは欠損がなければint32に（欠損を0で埋めると別の馬と区別できなくなる）
+    for column in COMPACT_ID_COLUMNS:
+        if column in df.columns and df[column].notna().all():
+            df[column] = df[column].astype('int32')
+    return df
+
+
+def _iter_result_rows(results):
+    """リスト・DataFrame・イテレータのレース結果をINSERT用タプルに変換"""
+    if isinstance(results, pd.DataFrame):
+        frame = results.reindex(columns=list(RACE_RESULT_COLUMNS))
+        # numpy型はsqlite3でバインドできないためPythonオブジェクトに変換
+        frame = frame.astype(object).where(frame.notna(), None)
+        yield from frame.itertuples(index=False, name=None)
+        return
+    
+    if isinstance(results, dict):
+        results = [results]
+    
+    for result in results:
+        yield tuple(result.get(column) for column in RACE_RESULT_COLUMNS)
+
+
+def _rebuild_entity_stats(conn):
+    """race_resultsから集計テーブルを作り直す"""
+    for table, name_column in ENTITY_STATS_TABLES.values():
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f'''
+            INSERT INTO {table} ({name_column}, {', '.join(ENTITY_STATS_COLUMNS)})
+            SELECT 
+                {name_column},
+                COUNT(*),
+                SUM(finish_position = 1),
+                SUM(finish_position <= 3),
+                SUM(finish_position),
+                MAX(race_date)
+            FROM race_results
+            WHERE {name_column} IS NOT NULL AND finish_position IS NOT NULL
+            GROUP BY {name_column}
+        ''')
+
+
+def _create_entity_stats_tables(conn):
+    """馬・騎手・調教師の集計テーブルを作成して既存データから集計"""
+    for table, name_column in ENTITY_STATS_TABLES.values():
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                {name_column} TEXT PRIMARY KEY,
+                starts INTEGER NOT NULL DEFAULT 0,
+                wins INTEGER NOT NULL DEFAULT 0,
+                top3 INTEGER NOT NULL DEFAULT 0,
+                position_sum INTEGER NOT NULL DEFAULT 0,
+                last_race_date TEXT
+            )
+        ''')
+    _rebuild_entity_stats(conn)
+
+
+def _accumulate_entity_stats(deltas, row, sign):
+    """1行分の成績を集計の差分に加算（sign=-1で取り消し）"""
+    position = row[_FINISH_POSITION_INDEX]
+    if position is None:
+        return
+    
+    race_date = row[_RACE_DATE_INDEX]
+    for entity, name_index in _ENTITY_NAME_INDEXES.items():
+        name = row[name_index]
+        if name is None:
+            continue
+        delta = deltas[entity].setdefault(name, [0, 0, 0, 0, None])
+        delta[0] += sign
+        delta[1] += sign * (position == 1)
+        delta[2] += sign * (position <= 3)
+        delta[3] += sign * position
+        # 取り消し時は最終出走日を戻さない（必要ならrebuild_entity_statsで再集計）
+        if sign > 0 and race_date is not None and (delta[4] is None or race_date > delta[4]):
+            delta[4] = race_date
+
+
+def _normalize_race_results(conn):
+    """race_resultsを整数IDで持つ実テーブルrace_entriesと、従来の列名を保つビューに分割"""
+    for name_column, (table, id_column) in ENTITY_DICTIONARIES.items():
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                {id_column} INTEGER PRIMARY KEY,
+                {name_column} TEXT NOT NULL UNIQUE
+            )
+        ''')
+        conn.execute(f'''
+            INSERT OR IGNORE INTO {table} ({name_column})
+            SELECT DISTINCT {name_column} FROM race_results WHERE {name_column} IS NOT NULL
+        ''')
+    
+    conn.execute('''
+        CREATE TABLE race_entries (
+            race_id TEXT,
+            race_date TEXT,
+            race_name_id INTEGER,
+            course_length INTEGER,
+            course_type TEXT,
+            weather TEXT,
+            track_condition TEXT,
+            horse_id INTEGER,
+            finish_position INTEGER,
+            jockey_id INTEGER,
+            trainer_id INTEGER,
+            horse_weight INTEGER,
+            odds REAL,
+            popularity INTEGER,
+            time_result TEXT,
+            margin TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (race_id, horse_id)
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO race_entries
+        SELECT 
+            r.race_id, r.race_date, rn.race_name_id, r.course_length, r.course_type,
+            r.weather, r.track_condition, h.horse_id, r.finish_position, j.jockey_id,
+            t.trainer_id, r.horse_weight, r.odds, r.popularity, r.time_result,
+            r.margin, r.created_at
+        FROM race_results r
+        LEFT JOIN race_names rn ON rn.race_name = r.race_name
+        LEFT JOIN horse_names h ON h.horse_name = r.horse_name
+        LEFT JOIN jockey_names j ON j.jockey_name = r.jockey_name
+        LEFT JOIN trainer_names t ON t.trainer_name = r.trainer_name
+    ''')
+    conn.execute("DROP TABLE race_results")
+    
+    # 既存の呼び出し側がそのまま使えるように従来の列名でビューを作る
+    conn.execute('''
+        CREATE VIEW race_results AS
+        SELECT 
+            e.race_id, e.race_date, rn.race_name, e.course_length, e.course_type,
+            e.weather, e.track_condition, h.horse_name, e.finish_position, j.jockey_name,
+            t.trainer_name, e.horse_weight, e.odds, e.popularity, e.time_result,
+            e.margin, e.created_at, e.horse_id, e.jockey_id, e.trainer_id
+        FROM race_entries e
+        LEFT JOIN race_names rn ON rn.race_name_id = e.race_name_id
+        LEFT JOIN horse_names h ON h.horse_id = e.horse_id
+        LEFT JOIN jockey_names j ON j.jockey_id = e.jockey_id
+        LEFT JOIN trainer_names t ON t.trainer_id = e.trainer_id
+    ''')
+    
+    conn.execute("CREATE INDEX idx_race_entries_date ON race_entries (race_date, race_id)")
+    for id_column in ('horse_id', 'jockey_id', 'trainer_id'):
+        conn.execute(
+            f"CREATE INDEX idx_race_entries_{id_column[:-3]} "
+            f"ON race_entries ({id_column}, race_date, finish_position)"
+        )
+
+
+def _split_race_metadata(conn):
+    """レース単位の属性（レース名・距離・コース・天候・馬場）をracesテーブルに移し、出走行から除く"""
+    conn.execute("DROP VIEW race_results")
+    conn.execute('''
+        CREATE TABLE races (
+            race_id TEXT PRIMARY KEY,
+            race_date TEXT,
+            race_name_id INTEGER,
+            course_length INTEGER,
+            course_type TEXT,
+            weather TEXT,
+            track_condition TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # 同じレースの行は同じ値を持つため、どの行から取ってもよい
+    conn.execute('''
+        INSERT INTO races
+        SELECT race_id, race_date, race_name_id, course_length, course_type,
+               weather, track_condition, MIN(created_at)
+        FROM race_entries
+        GROUP BY race_id
+    ''')
+    
+    # 開催日は集計の期間指定をインデックスだけで済ませるため出走行にも残す
+    conn.execute('''
+        CREATE TABLE race_entries_v6 (
+            race_id TEXT NOT NULL REFERENCES races (race_id),
+            race_date TEXT,
+            horse_id INTEGER,
+            finish_position INTEGER,
+            jockey_id INTEGER,
+            trainer_id INTEGER,
+            horse_weight INTEGER,
+            odds REAL,
+            popularity INTEGER,
+            time_result TEXT,
+            margin TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (race_id, horse_id)
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO race_entries_v6
+        SELECT race_id, race_date, horse_id, finish_position, jockey_id, trainer_id,
+               horse_weight, odds, popularity, time_result, margin, created_at
+        FROM race_entries
+    ''')
+    conn.execute("DROP TABLE race_entries")
+    conn.execute("ALTER TABLE race_entries_v6 RENAME TO race_entries")
+    
+    conn.execute('''
+        CREATE VIEW race_results AS
+        SELECT 
+            e.race_id, e.race_date, rn.race_name, r.course_length, r.course_type,
+            r.weather, r.track_condition, h.horse_name, e.finish_position, j.jockey_name,
+            t.trainer_name, e.horse_weight, e.odds, e.popularity, e.time_result,
+            e.margin, e.created_at, e.horse_id, e.jockey_id, e.trainer_id
+        FROM race_entries e
+        LEFT JOIN races r ON r.race_id = e.race_id
+        LEFT JOIN race_names rn ON rn.race_name_id = r.race_name_id
+        LEFT JOIN horse_names h ON h.horse_id = e.horse_id
+        LEFT JOIN jockey_names j ON j.jockey_id = e.jockey_id
+        LEFT JOIN trainer_names t ON t.trainer_id = e.trainer_id
+    ''')
+    
+    conn.execute("CREATE INDEX idx_races_date ON races (race_date, race_id)")
+    conn.execute("CREATE INDEX idx_race_entries_date ON race_entries (race_date, race_id)")
+    for id_column in ('horse_id', 'jockey_id', 'trainer_id'):
+        conn.execute(
+            f"CREATE INDEX idx_race_entries_{id_column[:-3]} "
+            f"ON race_entries ({id_column}, race_date, finish_position)"
+        )
+
+
+# スキーママイグレーション（バージョン順に適用）
+# 各要素は (バージョン, 説明, SQL文のリストまたは接続を受け取る関数)
+MIGRATIONS = [
+    (1, 'race_resultsに検索・集計用のカバリングインデックスを追加', [
+        # 日付順の一覧・期間指定の検索
+        "CREATE INDEX IF NOT EXISTS idx_race_results_date ON race_results (race_date, race_id)",
+        # 馬・騎手・調教師ごとの成績集計（着順まで含めてテーブル本体を読まない）
+        "CREATE INDEX IF NOT EXISTS idx_race_results_horse "
+        "ON race_results (horse_name, race_date, finish_position)",
+        "CREATE INDEX IF NOT EXISTS idx_race_results_jockey "
+        "ON race_results (jockey_name, race_date, finish_position)",
+        "CREATE INDEX IF NOT EXISTS idx_race_results_trainer "
+        "ON race_results (trainer_name, race_date, finish_position)",
+    ]),
+    (2, '馬・騎手・調教師の通算成績集計テーブルを追加', _create_entity_stats_tables),
+    (3, 'レース名・馬・騎手・調教師を整数IDの辞書テーブルに正規化', _normalize_race_results),
+    (4, 'データ収集の進捗を記録するジャーナルテーブルを追加', [
+        # レース一覧を取得済みの日付（settled=1は確定後に取得したもので再取得不要）
+        '''CREATE TABLE IF NOT EXISTS collection_dates (
+            race_date TEXT PRIMARY KEY,
+            race_count INTEGER NOT NULL,
+            settled INTEGER NOT NULL DEFAULT 0,
+            listed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        # 一覧に載っていたレースと取得状況（pending / stored / failed）
+        '''CREATE TABLE IF NOT EXISTS collection_races (
+            race_id TEXT PRIMARY KEY,
+            race_date TEXT NOT NULL,
+            race_name TEXT,
+            race_url TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_collection_races_date ON collection_races (race_date, status)",
+    ]),
+    (5, '開催日カレンダーのテーブルを追加', [
+        # カレンダーを取得済みの月（settled=1は月が終わってから取得したもので再取得不要）
+        '''CREATE TABLE IF NOT EXISTS calendar_months (
+            month TEXT PRIMARY KEY,
+            meeting_days INTEGER NOT NULL,
+            settled INTEGER NOT NULL DEFAULT 0,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS meeting_days (
+            race_date TEXT PRIMARY KEY,
+            month TEXT NOT NULL
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_meeting_days_month ON meeting_days (month)",
+    ]),
+    (6, 'レース単位の属性をracesテーブルに分離', _split_race_metadata),
+]
+# テーブルを作り直すマイグレーション（適用後にVACUUMでファイルを縮小する）
+REBUILDING_MIGRATIONS = {3, 6}
+
+# 複数エンティティの成績を一時テーブル経由で1回のクエリで集計する
+# （as_of指定時は{date_condition}にその日より前のレースに絞る条件が入る）
+ENTITY_STATS_MANY_COLUMNS = ('total_races', 'avg_position', 'best_position', 'wins', 'places')
+ENTITY_STATS_MANY_QUERY = """
+    SELECT 
+        q.name as {name_column},
+        COUNT(e.{id_column}) as total_races,
+        AVG(e.finish_position) as avg_position,
+        MIN(e.finish_position) as best_position,
+        COUNT(CASE WHEN e.finish_position = 1 THEN 1 END) as wins,
+        COUNT(CASE WHEN e.finish_position <= 3 THEN 1 END) as places
+    FROM temp.entity_lookup q
+    LEFT JOIN {dictionary} d ON d.{name_column} = q.name
+    LEFT JOIN race_entries e ON e.{id_column} = d.{id_column}{date_condition}
+    GROUP BY q.name
+"""
+
+# インデックスを使うべき主要クエリ（check_query_plansで検証）
+HOT_QUERIES = {
+    'race_data_by_date': ("SELECT * FROM race_results ORDER BY race_date DESC LIMIT 100", []),
+    'races_between': (
+        "SELECT * FROM race_results WHERE race_date >= ? AND race_date <= ? ORDER BY race_date, race_id",
+        ['2024-01-01', '2024-12-31']
+    ),
+    # get_*_stats_manyが馬1頭ごとに引く部分
+    'horse_stats': (
+        "SELECT COUNT(*), AVG(finish_position) FROM race_entries WHERE horse_id = ? AND race_date < ?",
+        [1, '2024-01-01']
+    ),
+    # 騎手・調教師の集計は名前ではなく整数IDでグループ化する
+    'jockey_stats': (
+        "SELECT jockey_id, COUNT(*), SUM(finish_position = 1) FROM race_entries GROUP BY jockey_id",
+        []
+    ),
+    'trainer_stats': (
+        "SELECT trainer_id, COUNT(*), SUM(finish_position = 1) FROM race_entries GROUP BY trainer_id",
+        []
+    ),
+}
+
+
+class RaceResultWriter:
+    """複数レースの結果をバッファリングし、まとめて書き込む"""
+    
+    def __init__(self, db, batch_size=None, on_flush=None):
+        self.db = db
+        self.batch_size = batch_size or BULK_INSERT_BATCH_SIZE
+        self.buffer = []
+        self.counts = {'inserted': 0, 'replaced': 0}
+        # 書き込みを確定するたびに保存したレースIDのリストで呼ぶ（収集ジャーナルへの記録など）
+        self.on_flush = on_flush
+    
+    def add(self, results):
+        """レース結果をバッファに追加（バッチサイズに達したら書き込み）"""
+        self.buffer.extend(_iter_result_rows(results))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """バッファの内容を1トランザクションで書き込み"""
+        if not self.buffer:
+            return
+        
+        rows, self.buffer = self.buffer, []
+        inserted_total, replaced_total = 0, 0
+        with self.db.transaction() as conn:
+            for batch in _batched(rows, self.batch_size):
+                inserted, replaced = self.db._write_race_result_batch(conn, batch)
+                inserted_total += inserted
+                replaced_total += replaced
+        
+        self.counts['inserted'] += inserted_total
+        self.counts['replaced'] += replaced_total
+        if self.on_flush is not None:
+            self.on_flush(sorted({row[_RACE_ID_INDEX] for row in rows}))
+        self.db.logger.info(
+            f"レース結果を書き込みました: {len(rows)}件 (新規 {inserted_total}件 / 置換 {replaced_total}件)"
+        )
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 途中で例外が起きても取得済みのデータは保存する
+        self.flush()
+        return False
+
+
 class OiKeibaDatabase:
     def __init__(self, db_path=None):
-        self.db_path = db_path or DATABASE_PATH
+        self.db_path = Path(db_path or DATABASE_PATH)
         self.logger = setup_logger(__name__)
+        # データベースディレクトリを作成
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connections = get_connection_manager(self.db_path)
+        # 読み取り結果のキャッシュも同じDBファイルのインスタンス間で共有する
+        self.query_cache = self.connections.caches.setdefault('query', QueryCache())
         self.init_database()
     
+    def get_connection(self):
+        """現在のスレッドの永続接続を取得"""
+        return self.connections.get_connection()
+    
+    def transaction(self, immediate=True):
+        """トランザクションを開始（with文で使用）"""
+        return self.connections.transaction(immediate=immediate)
+    
+    def close(self):
+        """接続を全て閉じる（次回アクセス時に再接続される）"""
+        self.connections.close_all()
+    
+    def cache_stats(self):
+        """読み取りキャッシュの統計（ヒット・ミス件数、使用量など）"""
+        return self.query_cache.stats()
+    
+    def clear_query_cache(self):
+        """読み取りキャッシュを破棄"""
+        self.query_cache.clear()
+    
+    def _cached_read(self, key, loader):
+        """データのバージョンが変わっていなければキャッシュした結果を返す（loaderは読み込み関数）"""
+        # トランザクション中は未コミットの書き込みを読む必要があるためキャッシュを使わない
+        if self.query_cache.max_bytes <= 0 or self.get_connection().in_transaction:
+            return loader()
+        
+        version = self.connections.data_version()
+        df = self.query_cache.get(key, version)
+        if df is None:
+            df = loader()
+            self.query_cache.put(key, version, df)
+        return df
+    
     def init_database(self):
         """データベースの初期化"""
-        # データベースディレクトリを作成
-        self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # レース結果テーブル
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS race_results (
-                race_id TEXT,
-                race_date TEXT,
-                race_name TEXT,
-                course_length INTEGER,
-                course_type TEXT,
-                weather TEXT,
-                track_condition TEXT,
-                horse_name TEXT,
-                finish_position INTEGER,
-                jockey_name TEXT,
-                trainer_name TEXT,
-                horse_weight INTEGER,
-                odds REAL,
-                popularity INTEGER,
-                time_result TEXT,
-                margin TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (race_id, horse_name)
-            )
-        ''')
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # レース結果テーブル
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS race_results (
+                    race_id TEXT,
+                    race_date TEXT,
+                    race_name TEXT,
+                    course_length INTEGER,
+                    course_type TEXT,
+                    weather TEXT,
+                    track_condition TEXT,
+                    horse_name TEXT,
+                    finish_position INTEGER,
+                    jockey_name TEXT,
+                    trainer_name TEXT,
+                    horse_weight INTEGER,
+                    odds REAL,
+                    popularity INTEGER,
+                    time_result TEXT,
+                    margin TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (race_id, horse_name)
+                )
+            ''')
+            
+            # 馬の基本情報テーブル
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS horses (
+                    horse_id TEXT PRIMARY KEY,
+                    horse_name TEXT UNIQUE,
+                    birth_date TEXT,
+                    gender TEXT,
+                    coat_color TEXT,
+                    father_name TEXT,
+                    mother_name TEXT,
+                    owner_name TEXT,
+                    trainer_name TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # JRA成績テーブル
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jra_horse_records (
+                    horse_name TEXT,
+                    jra_race_date TEXT,
+                    course_name TEXT,
+                    race_name TEXT,
+                    finish_position INTEGER,
+                    total_horses INTEGER,
+                    jockey_name TEXT,
+                    horse_weight INTEGER,
+                    odds REAL,
+                    time_result TEXT,
+                    prize_money INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (horse_name, jra_race_date, race_name)
+                )
+            ''')
+            
+            # 騎手・調教師統計テーブル
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jockey_trainer_stats (
+                    name TEXT,
+                    role TEXT,  -- 'jockey' or 'trainer'
+                    year INTEGER,
+                    races INTEGER,
+                    wins INTEGER,
+                    win_rate REAL,
+                    places INTEGER,
+                    place_rate REAL,
+                    prize_money INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (name, role, year)
+                )
+            ''')
         
-        # 馬の基本情報テーブル
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS horses (
-                horse_id TEXT PRIMARY KEY,
-                horse_name TEXT UNIQUE,
-                birth_date TEXT,
-                gender TEXT,
-                coat_color TEXT,
-                father_name TEXT,
-                mother_name TEXT,
-                owner_name TEXT,
-                trainer_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        self.migrate()
+        self.logger.info("データベースを初期化しました")
+    
+    def get_schema_version(self):
+        """適用済みのスキーマバージョンを取得"""
+        row = self.get_connection().execute("SELECT MAX(version) FROM schema_version").fetchone()
+        return row[0] or 0
+    
+    def migrate(self):
+        """未適用のマイグレーションを順に適用（既存のDBファイルもその場で更新）"""
+        conn = self.get_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
         
-        # JRA成績テーブル
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS jra_horse_records (
-                horse_name TEXT,
-                jra_race_date TEXT,
-                course_name TEXT,
-                race_name TEXT,
-                finish_position INTEGER,
-                total_horses INTEGER,
-                jockey_name TEXT,
-                horse_weight INTEGER,
-                odds REAL,
-                time_result TEXT,
-                prize_money INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (horse_name, jra_race_date, race_name)
-            )
-        ''')
+        applied = []
+        for version, description, steps in MIGRATIONS:
+            with self.transaction() as conn:
+                # 他プロセスが先に適用している場合があるためロック取得後に確認
+                if self.get_schema_version() >= version:
+                    continue
+                
+                if callable(steps):
+                    steps(conn)
+                else:
+                    for statement in steps:
+                        conn.execute(statement)
+                
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+            applied.append(version)
+            self.logger.info(f"マイグレーションを適用しました: v{version} {description}")
         
-        # 騎手・調教師統計テーブル
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS jockey_trainer_stats (
-                name TEXT,
-                role TEXT,  -- 'jockey' or 'trainer'
-                year INTEGER,
-                races INTEGER,
-                wins INTEGER,
-                win_rate REAL,
-                places INTEGER,
-                place_rate REAL,
-                prize_money INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (name, role, year)
-            )
-        ''')
+        if REBUILDING_MIGRATIONS.intersection(applied):
+            self.vacuum()
+    
+    def vacuum(self):
+        """未使用領域を解放してDBファイルを縮小"""
+        self.get_connection().execute("VACUUM")
+        self.logger.info("VACUUMを実行しました")
+    
+    def explain_query_plan(self, query, params=None):
+        """クエリの実行計画を取得"""
+        rows = self.get_connection().execute(f"EXPLAIN QUERY PLAN {query}", params or []).fetchall()
+        return [row[-1] for row in rows]
+    
+    def check_query_plans(self):
+        """主要クエリがインデックスを使っているか確認"""
+        report = {}
+        for name, (query, params) in HOT_QUERIES.items():
+            plan = self.explain_query_plan(query, params)
+            # インデックスを使わないSCANはフルスキャン
+            full_scans = [
+                detail for detail in plan
+                if detail.startswith('SCAN') and 'INDEX' not in detail
+            ]
+            report[name] = {'uses_index': not full_scans, 'plan': plan}
+            if full_scans:
+                self.logger.warning(f"フルスキャンを検出: {name} - {full_scans}")
         
-        conn.commit()
-        conn.close()
-        self.logger.info("データベースを初期化しました")
+        return report
     
     def save_race_results(self, results):
         """レース結果を保存"""
-        if not results:
+        if results is None or len(results) == 0:
             return
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.bulk_save_race_results(results)
+    
+    def bulk_save_race_results(self, results, batch_size=None):
+        """レース結果をexecutemanyでまとめて保存（全バッチを1トランザクションで書き込む）"""
+        batch_size = batch_size or BULK_INSERT_BATCH_SIZE
+        counts = {'inserted': 0, 'replaced': 0}
         
-        for result in results:
-            cursor.execute('''
-                INSERT OR REPLACE INTO race_results 
-                (race_id, race_date, race_name, course_length, course_type, weather, 
-                 track_condition, horse_name, finish_position, jockey_name, trainer_name, 
-                 horse_weight, odds, popularity, time_result, margin)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                result.get('race_id'), result.get('race_date'), result.get('race_name'),
-                result.get('course_length'), result.get('course_type'), result.get('weather'),
-                result.get('track_condition'), result.get('horse_name'), result.get('finish_position'),
-                result.get('jockey_name'), result.get('trainer_name'), result.get('horse_weight'),
-                result.get('odds'), result.get('popularity'), result.get('time_result'), result.get('margin')
-            ))
-        
-        conn.commit()
-        conn.close()
-        self.logger.info(f"レース結果を保存しました: {len(results)}件")
-    
-    def get_race_data(self, limit=None):
-        """レースデータを取得"""
-        conn = sqlite3.connect(self.db_path)
-        
-        query = "SELECT * FROM race_results ORDER BY race_date DESC"
-        if limit:
-            query += f" LIMIT {limit}"
+        with self.transaction() as conn:
+            for batch in _batched(_iter_result_rows(results), batch_size):
+                inserted, replaced = self._write_race_result_batch(conn, batch)
+                counts['inserted'] += inserted
+                counts['replaced'] += replaced
         
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        self.logger.info(
+            f"レース結果を保存しました: {counts['inserted'] + counts['replaced']}件 "
+            f"(新規 {counts['inserted']}件 / 置換 {counts['replaced']}件)"
+        )
+        return counts
+    
+    def bulk_writer(self, batch_size=None, on_flush=None):
+        """複数レースにまたがってバッファリングするライターを作成（with文で使用）"""
+        return RaceResultWriter(self, batch_size=batch_size, on_flush=on_flush)
+    
+    def _write_race_result_batch(self, conn, rows):
+        """1バッチ分を書き込み、(新規件数, 置換件数)を返す（集計テーブルも同じトランザクションで更新）"""
+        columns = ', '.join(RACE_RESULT_COLUMNS)
         
-        return df
+        # 既存の行を先に調べて新規と置換を区別する（置換分は集計から差し引く）
+        race_ids = sorted({row[_RACE_ID_INDEX] for row in rows})
+        current = {}
+        for chunk in _batched(race_ids, _MAX_SQL_VARIABLES):
+            placeholders = ', '.join('?' * len(chunk))
+            for old_row in conn.execute(
+                f"SELECT {columns} FROM race_results WHERE race_id IN ({placeholders})",
+                chunk
+            ):
+                current[(old_row[_RACE_ID_INDEX], old_row[_HORSE_NAME_INDEX])] = old_row
+        
+        deltas = {entity: {} for entity in ENTITY_STATS_TABLES}
+        replaced = 0
+        for row in rows:
+            key = (row[_RACE_ID_INDEX], row[_HORSE_NAME_INDEX])
+            old_row = current.get(key)
+            if old_row is not None:
+                replaced += 1
+                _accumulate_entity_stats(deltas, old_row, -1)
+            _accumulate_entity_stats(deltas, row, 1)
+            current[key] = row
+        
+        id_rows = self._to_id_rows(rows)
+        # レース単位の属性はレースごとに1行（同じバッチに同じレースが複数あれば後のもの）
+        race_rows = {row[_RACE_ID_INDEX]: [row[index] for index in _RACE_COLUMN_INDEXES] for row in id_rows}
+        conn.executemany(
+            f"INSERT INTO races ({', '.join(RACE_COLUMNS)}) VALUES ({', '.join('?' * len(RACE_COLUMNS))}) "
+            "ON CONFLICT (race_id) DO UPDATE SET "
+            + ', '.join(f"{column} = excluded.{column}" for column in RACE_COLUMNS[1:]),
+            list(race_rows.values())
+        )
+        placeholders = ', '.join('?' * len(RACE_ENTRY_COLUMNS))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO race_entries ({', '.join(RACE_ENTRY_COLUMNS)}) VALUES ({placeholders})",
+            [[row[index] for index in _RACE_ENTRY_COLUMN_INDEXES] for row in id_rows]
+        )
+        self._apply_entity_stats_deltas(conn, deltas, prune=replaced > 0)
+        return len(rows) - replaced, replaced
     
-    def get_horse_stats(self, horse_name):
-        """指定した馬の統計を取得"""
-        conn = sqlite3.connect(self.db_path)
+    def _to_id_rows(self, rows):
+        """名前列を辞書テーブルのIDに置き換えた行に変換（列の並びはRACE_RESULT_COLUMNSのまま）"""
+        id_maps = {}
+        for name_column in ENTITY_DICTIONARIES:
+            index = RACE_RESULT_COLUMNS.index(name_column)
+            id_maps[index] = self.resolve_entity_ids(name_column, (row[index] for row in rows))
         
-        query = """
-        SELECT 
-            COUNT(*) as total_races,
-            AVG(finish_position) as avg_position,
-            MIN(finish_position) as best_position,
-            COUNT(CASE WHEN finish_position = 1 THEN 1 END) as wins,
-            COUNT(CASE WHEN finish_position <= 3 THEN 1 END) as places
-        FROM race_results 
-        WHERE horse_name = ?
+        return [
+            tuple(
+                id_maps[index].get(value) if index in id_maps else value
+                for index, value in enumerate(row)
+            )
+            for row in rows
+        ]
+    
+    def resolve_entity_ids(self, name_column, names):
+        """名前を辞書テーブルのIDにまとめて変換（未登録の名前は追加する）
+        
+        変換結果はプロセス内で共有するキャッシュに保持し、次回以降はSQLを発行しない。
+        """
+        table, id_column = ENTITY_DICTIONARIES[name_column]
+        cache = self.connections.caches.setdefault('entity_ids', {}).setdefault(name_column, {})
+        missing = [name for name in dict.fromkeys(names) if name is not None and name not in cache]
+        if not missing:
+            return cache
+        
+        with self.transaction() as conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {table} ({name_column}) VALUES (?)",
+                [(name,) for name in missing]
+            )
+            for chunk in _batched(missing, _MAX_SQL_VARIABLES):
+                placeholders = ', '.join('?' * len(chunk))
+                cache.update(conn.execute(
+                    f"SELECT {name_column}, {id_column} FROM {table} WHERE {name_column} IN ({placeholders})",
+                    chunk
+                ).fetchall())
+        return cache
+    
+    def _apply_entity_stats_deltas(self, conn, deltas, prune=False):
+        """集計の差分を集計テーブルに反映"""
+        for entity, entity_deltas in deltas.items():
+            if not entity_deltas:
+                continue
+            
+            table, name_column = ENTITY_STATS_TABLES[entity]
+            conn.executemany(f'''
+                INSERT INTO {table} ({name_column}, {', '.join(ENTITY_STATS_COLUMNS)})
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT ({name_column}) DO UPDATE SET
+                    starts = starts + excluded.starts,
+                    wins = wins + excluded.wins,
+                    top3 = top3 + excluded.top3,
+                    position_sum = position_sum + excluded.position_sum,
+                    last_race_date = CASE
+                        WHEN excluded.last_race_date > COALESCE(last_race_date, '')
+                        THEN excluded.last_race_date ELSE last_race_date
+                    END
+            ''', [(name, *delta) for name, delta in entity_deltas.items()])
+            
+            if prune:
+                conn.execute(f"DELETE FROM {table} WHERE starts <= 0")
+    
+    def rebuild_entity_stats(self):
+        """集計テーブルをrace_resultsから再集計"""
+        with self.transaction() as conn:
+            _rebuild_entity_stats(conn)
+        self.logger.info("集計テーブルを再集計しました")
+    
+    def get_entity_stats(self, entity, names=None):
+        """馬・騎手・調教師の通算成績を集計テーブルから取得（entity: 'horse', 'jockey', 'trainer'）"""
+        if names is not None:
+            names = list(dict.fromkeys(name for name in names if name is not None))
+        return self._cached_read(
+            ('entity_stats', entity, None if names is None else tuple(names)),
+            lambda: self._load_entity_stats(entity, names)
+        )
+    
+    def _load_entity_stats(self, entity, names):
+        """集計テーブルから読み込み"""
+        table, name_column = ENTITY_STATS_TABLES[entity]
+        query = f"SELECT {name_column}, {', '.join(ENTITY_STATS_COLUMNS)} FROM {table}"
+        conn = self.get_connection()
+        
+        if names is None:
+            return pd.read_sql_query(query, conn)
+        
+        frames = [
+            pd.read_sql_query(
+                f"{query} WHERE {name_column} IN ({', '.join('?' * len(chunk))})",
+                conn,
+                params=chunk
+            )
+            for chunk in _batched(names, _MAX_SQL_VARIABLES)
+        ]
+        if not frames:
+            return pd.DataFrame(columns=[name_column, *ENTITY_STATS_COLUMNS])
+        return pd.concat(frames, ignore_index=True)
+    
+    def get_race_data(self, limit=None, columns=None, start_date=None, end_date=None,
+                      race_ids=None, horse_names=None, jockey_names=None, trainer_names=None,
+                      ascending=False, chunksize=None, compact=False):
+        """レースデータを取得
+        
+        columnsで取得列を絞り、start_date/end_date（両端を含む）と各エンティティの
+        リストで行を絞り込む。chunksizeを指定するとDataFrameのジェネレータを返す。
+        compact=Trueでは名前・条件列をcategory、着順などを小さい整数型で返す。
         """
+        query, params = self._build_race_data_query(
+            limit, columns, start_date, end_date,
+            {
+                'race_id': race_ids,
+                'horse_name': horse_names,
+                'jockey_name': jockey_names,
+                'trainer_name': trainer_names,
+            },
+            ascending
+        )
+        
+        if chunksize:
+            return self._iter_race_data(query, params, chunksize, compact)
+        
+        return self._cached_read(
+            ('race_data', query, tuple(params), compact),
+            lambda: self._load_race_data(query, params, compact)
+        )
+    
+    def get_races(self, start_date=None, end_date=None, race_ids=None):
+        """レース単位の属性を1レース1行で取得（レース単位の特徴量を出走行に展開する前に使う）"""
+        conditions = []
+        params = []
+        if start_date is not None:
+            conditions.append("r.race_date >= ?")
+            params.append(str(start_date))
+        if end_date is not None:
+            conditions.append("r.race_date <= ?")
+            params.append(str(end_date))
+        if race_ids is not None:
+            race_ids = list(dict.fromkeys(race_ids))
+            conditions.append(f"r.race_id IN ({', '.join('?' * len(race_ids))})" if race_ids else "0")
+            params.extend(race_ids)
         
-        result = pd.read_sql_query(query, conn, params=[horse_name])
-        conn.close()
+        query = '''
+            SELECT r.race_id, r.race_date, rn.race_name, r.course_length, r.course_type,
+                   r.weather, r.track_condition
+            FROM races r
+            LEFT JOIN race_names rn ON rn.race_name_id = r.race_name_id
+        '''
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY r.race_date, r.race_id"
         
-        return result.iloc[0] if not result.empty else None
+        return self._cached_read(
+            ('races', query, tuple(params)),
+            lambda: pd.read_sql_query(query, self.get_connection(), params=params)
+        )
+    
+    def _load_race_data(self, query, params, compact=False):
+        """レースデータをSQLiteから読み込み"""
+        df = pd.read_sql_query(query, self.get_connection(), params=params)
+        if compact:
+            before = memory_usage_mb(df)
+            df = compact_race_data(df)
+            self.logger.info(f"メモリ使用量: {before:.1f}MB -> {memory_usage_mb(df):.1f}MB ({len(df)}行)")
+        return df
+    
+    def _iter_race_data(self, query, params, chunksize, compact=False):
+        """レースデータをchunksize行ずつ返すジェネレータ"""
+        for chunk in pd.read_sql_query(query, self.get_connection(), params=params, chunksize=chunksize):
+            # カテゴリはチャンクごとに作られる点に注意
+            yield compact_race_data(chunk) if compact else chunk
+    
+    def _build_race_data_query(self, limit, columns, start_date, end_date, entity_filters, ascending):
+        """get_race_data用のSQLとパラメータを組み立て"""
+        if columns:
+            unknown = [column for column in columns if column not in RACE_DATA_COLUMNS]
+            if unknown:
+                raise ValueError(f"不明な列が指定されました: {unknown}")
+            select = ', '.join(columns)
+        else:
+            select = '*'
+        
+        conditions = []
+        params = []
+        if start_date is not None:
+            conditions.append("race_date >= ?")
+            params.append(str(start_date))
+        if end_date is not None:
+            conditions.append("race_date <= ?")
+            params.append(str(end_date))
+        
+        for column, values in entity_filters.items():
+            if values is None:
+                continue
+            values = list(dict.fromkeys(values))
+            if not values:
+                # 空リストは該当なし
+                conditions.append("0")
+                continue
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        
+        query = f"SELECT {select} FROM race_results"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY race_date, race_id" if ascending else " ORDER BY race_date DESC, race_id DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        
+        return query, params
+    
+    def get_horse_stats(self, horse_name):
+        """指定した馬の統計を取得（出走のない馬・名前がNoneの場合は出走数0の行）"""
+        stats = self.get_horse_stats_many([horse_name])
+        if stats.empty:
+            # Noneは集計対象から除かれるため、以前の集計クエリと同じ出走数0の行を返す
+            return pd.Series(
+                {'total_races': 0, 'avg_position': None, 'best_position': None, 'wins': 0, 'places': 0},
+                name=horse_name, dtype=object
+            )
+        return stats.iloc[0]
+    
+    def get_horse_stats_many(self, horse_names, as_of=None):
+        """複数の馬の統計を1回のクエリで取得（馬名をインデックスとするDataFrame）"""
+        return self._get_entity_stats_many('horse', horse_names, as_of)
+    
+    def get_jockey_stats_many(self, jockey_names, as_of=None):
+        """複数の騎手の統計を1回のクエリで取得（騎手名をインデックスとするDataFrame）"""
+        return self._get_entity_stats_many('jockey', jockey_names, as_of)
+    
+    def get_trainer_stats_many(self, trainer_names, as_of=None):
+        """複数の調教師の統計を1回のクエリで取得（調教師名をインデックスとするDataFrame）"""
+        return self._get_entity_stats_many('trainer', trainer_names, as_of)
+    
+    def _get_entity_stats_many(self, entity, names, as_of=None):
+        """名前を一時テーブルに入れて成績をまとめて集計（as_ofを指定するとその日より前のレースのみ）"""
+        _, name_column = ENTITY_STATS_TABLES[entity]
+        dictionary, id_column = ENTITY_DICTIONARIES[name_column]
+        names = list(dict.fromkeys(name for name in names if name is not None))
+        if not names:
+            return pd.DataFrame(columns=ENTITY_STATS_MANY_COLUMNS, index=pd.Index([], name=name_column))
+        
+        params = []
+        date_condition = ''
+        if as_of is not None:
+            # datetimeも日付部分だけで比較する
+            date_condition = ' AND e.race_date < ?'
+            params.append(str(as_of)[:10])
+        query = ENTITY_STATS_MANY_QUERY.format(
+            name_column=name_column, id_column=id_column,
+            dictionary=dictionary, date_condition=date_condition
+        )
+        
+        stats = self._cached_read(
+            ('entity_stats_many', query, tuple(names), tuple(params)),
+            lambda: self._load_entity_stats_many(query, names, params)
+        )
+        # 指定した順に並べる
+        return stats.set_index(name_column).reindex(names)
+    
+    def _load_entity_stats_many(self, query, names, params):
+        """名前を一時テーブルに入れて集計クエリを実行"""
+        # 一時テーブルは接続ごとなのでスレッド間で衝突しない
+        with self.transaction(immediate=False) as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS entity_lookup (name TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.entity_lookup")
+            conn.executemany("INSERT INTO temp.entity_lookup (name) VALUES (?)", ((name,) for name in names))
+            stats = pd.read_sql_query(query, conn, params=params)
+            conn.execute("DELETE FROM temp.entity_lookup")
+        return stats
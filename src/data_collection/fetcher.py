@@ -0,0 +1,384 @@
+"""
+並行HTTP取得エンジン
+ホストごとのトークンバケットでリクエスト間隔を守りながら、
+待ち時間の間に複数のリクエストと後続処理（パース）を並行して進める。
+応答時間とエラーに合わせてレートを調整し、一時的なエラーは間隔を広げながら再試行、
+エラー率が高いときはサーキットブレーカーでリクエスト全体を一時停止する
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.settings import (
+    SCRAPING_MAX_WORKERS, SCRAPING_RATE_PER_HOST, SCRAPING_BURST, USER_AGENT,
+    SCRAPING_MIN_RATE_PER_HOST, SCRAPING_MAX_RATE_FACTOR, SCRAPING_TARGET_LATENCY,
+    SCRAPING_CONNECT_TIMEOUT, SCRAPING_READ_TIMEOUT, SCRAPING_MAX_RETRIES,
+    SCRAPING_BACKOFF_BASE, SCRAPING_BACKOFF_MAX,
+    CIRCUIT_BREAKER_WINDOW, CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN
+)
+from src.utils.logger import setup_logger
+
+# 再試行する（サーバー側の一時的な問題とみなす）ステータスコード
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def is_retryable(error):
+    """時間をおけば成功する可能性のあるエラーか（404などは取り直しても変わらない）"""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUSES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def parse_retry_after(response):
+    """Retry-Afterヘッダーの秒数（日付形式や不正な値はNone）"""
+    value = response.headers.get('Retry-After')
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限（rate: 1秒あたりの補充数、burst: 最大保持数）"""
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得（足りなければ補充まで待つ）し、待った秒数を返す"""
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            self._refill()
+            # 先に予約してからロック外で待つ（マイナスは予約待ちの数）
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if delay > 0:
+            self._sleep(delay)
+        return delay
+
+    def set_rate(self, rate):
+        """補充レートを変更（それまでの分は元のレートで補充する）"""
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def pause(self, seconds):
+        """次のトークンをseconds秒後まで出さない（Retry-Afterなど）"""
+        if self.rate <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class HostRateLimiter:
+    """ホストごとにトークンバケットを持ち、応答に合わせてレートを調整するレート制限
+
+    応答時間の移動平均が目標の半分未満なら少しずつレートを上げ（上限はデフォルトでは基準レート）、
+    目標を超えたときや429/5xxが返ったときは半分に下げる（AIMD）。
+    """
+
+    # 応答時間の移動平均の重み
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self, rate=None, burst=None, min_rate=None, max_rate=None, target_latency=None):
+        self.rate = SCRAPING_RATE_PER_HOST if rate is None else rate
+        self.burst = SCRAPING_BURST if burst is None else burst
+        self.min_rate = min(self.rate, SCRAPING_MIN_RATE_PER_HOST if min_rate is None else min_rate)
+        self.max_rate = max(self.rate, self.rate * SCRAPING_MAX_RATE_FACTOR if max_rate is None else max_rate)
+        self.target_latency = SCRAPING_TARGET_LATENCY if target_latency is None else target_latency
+        self._buckets = {}
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """URLのホストのトークンを取得し、待った秒数を返す"""
+        return self._bucket(url).acquire()
+
+    def on_response(self, url, latency, throttled=False, retry_after=None):
+        """応答時間とサーバーの混雑に合わせてホストのレートを調整し、新しいレートを返す"""
+        host = urlsplit(url).netloc
+        bucket = self._bucket(url)
+        if bucket.rate <= 0:
+            return bucket.rate
+
+        with self._lock:
+            average = self._latency.get(host, latency)
+            average += (latency - average) * self.LATENCY_SMOOTHING
+            self._latency[host] = average
+
+            if throttled or average > self.target_latency:
+                rate = max(self.min_rate, bucket.rate / 2)
+            elif average < self.target_latency / 2:
+                rate = min(self.max_rate, bucket.rate + self.rate * 0.1)
+            else:
+                rate = bucket.rate
+            bucket.set_rate(rate)
+
+        if retry_after:
+            bucket.pause(retry_after)
+        return rate
+
+    def current_rate(self, url):
+        return self._bucket(url).rate
+
+    def _bucket(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[host] = bucket
+        return bucket
+
+
+class CircuitBreaker:
+    """直近のリクエストのエラー率が閾値を超えたら、一定時間すべてのリクエストを止める
+
+    止めた後は1件だけ試しに通し（half_open）、成功すれば再開、失敗すればもう一度止める。
+    """
+
+    def __init__(self, window=None, threshold=None, cooldown=None, clock=time.monotonic, sleep=time.sleep):
+        self.window = window or CIRCUIT_BREAKER_WINDOW
+        self.threshold = CIRCUIT_BREAKER_THRESHOLD if threshold is None else threshold
+        self.cooldown = CIRCUIT_BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.state = 'closed'
+        self.opened = 0
+        self._outcomes = deque(maxlen=self.window)
+        self._opened_at = None
+        self._probing = False
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.logger = setup_logger(__name__)
+
+    def wait(self):
+        """リクエストを送ってよくなるまで待ち、待った秒数を返す"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                if self.state == 'closed':
+                    return waited
+                now = self._clock()
+                if self.state == 'open' and now - self._opened_at >= self.cooldown:
+                    self.state = 'half_open'
+                if self.state == 'half_open' and not self._probing:
+                    self._probing = True
+                    return waited
+                # 再開を待つ（試しの1件の結果待ちなら短い間隔で確認する）
+                delay = max(0.1, self.cooldown - (now - self._opened_at)) if self.state == 'open' else 0.1
+            self._sleep(delay)
+            waited += delay
+
+    def record(self, success):
+        """リクエストの成否を記録し、必要なら止める・再開する"""
+        with self._lock:
+            if self.state == 'half_open' and self._probing:
+                self._probing = False
+                if success:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                    self.logger.info("リクエストを再開します")
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            if self.state == 'closed' and len(self._outcomes) == self.window:
+                error_rate = self._outcomes.count(False) / len(self._outcomes)
+                if error_rate > self.threshold:
+                    self._open()
+                    self.logger.warning(
+                        f"エラー率が高いためリクエストを{self.cooldown:.0f}秒停止します (直近{self.window}件中 "
+                        f"{self._outcomes.count(False)}件がエラー)"
+                    )
+
+    def _open(self):
+        self.state = 'open'
+        self.opened += 1
+        self._opened_at = self._clock()
+
+
+class ConcurrentFetcher:
+    """レート制限付きのHTTP取得とスレッドプールでの並行処理"""
+
+    def __init__(self, max_workers=None, rate=None, burst=None, timeout=None, headers=None, cache=None,
+                 max_retries=None, backoff_base=None, backoff_max=None, breaker=None, archive=None):
+        self.max_workers = max_workers or SCRAPING_MAX_WORKERS
+        self.limiter = HostRateLimiter(rate, burst)
+        # HttpCacheを渡すとキャッシュ済みのページはネットワークに出ない
+        self.cache = cache
+        # PageArchiveを渡すとネットワークから取得したページを全て保存する（再パース用）
+        self.archive = archive
+        # 応答のないサーバーでワーカーが止まらないように接続・読み取りの両方に上限を設ける
+        self.timeout = timeout or (SCRAPING_CONNECT_TIMEOUT, SCRAPING_READ_TIMEOUT)
+        self.max_retries = SCRAPING_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = SCRAPING_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = SCRAPING_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.headers = {'User-Agent': USER_AGENT, **(headers or {})}
+        self.logger = setup_logger(__name__)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'requests': 0, 'errors': 0, 'bytes': 0, 'wait_seconds': 0.0,
+            'retries': 0, 'throttled': 0, 'paused_seconds': 0.0,
+        }
+
+    def session(self):
+        """スレッドごとのセッションを取得（requests.Sessionはスレッド間で共有しない）"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url, immutable=False, **kwargs):
+        """レート制限を守ってGETし、レスポンスを返す（HTTPエラーは例外）
+
+        immutable=Trueは内容が変わらないページ（過去のレース結果など）で、
+        キャッシュがあればレート制限の待ちもなしで返す。
+        一時的なエラーはsend()で再試行してから例外にする。
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        session = _RateLimitedSession(self)
+        try:
+            if self.cache is not None:
+                response, fetched = self.cache.get(session, url, immutable=immutable, **kwargs)
+            else:
+                response, fetched = session.get(url, **kwargs), True
+            response.raise_for_status()
+        except requests.RequestException:
+            self._count(errors=1, wait_seconds=session.waited)
+            raise
+        if fetched:
+            self._count(requests=session.requests, bytes=len(response.content), wait_seconds=session.waited)
+            if self.archive is not None:
+                self.archive.append(url, response.content)
+        return response
+
+    def send(self, url, **kwargs):
+        """1つのURLを実際にリクエストする（ペース調整・再試行・サーキットブレーカー付き）
+
+        接続エラー・タイムアウト・429/5xxは間隔を指数的に広げながらmax_retries回まで再試行し、
+        それでも失敗したら最後のレスポンス（または例外）をそのまま返す。
+        戻り値は (レスポンス, リクエスト回数, レート制限などで待った秒数)。
+        """
+        attempts = 0
+        waited = 0.0
+        while True:
+            paused = self.breaker.wait()
+            if paused:
+                self._count(paused_seconds=paused)
+            waited += self.limiter.acquire(url)
+            attempts += 1
+
+            start = time.monotonic()
+            try:
+                response = self.session().get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                latency = time.monotonic() - start
+                self.breaker.record(False)
+                self.limiter.on_response(url, latency, throttled=True)
+                if attempts > self.max_retries:
+                    raise
+                waited += self._backoff(url, attempts)
+                continue
+            except Exception:
+                # 再試行しないエラーでも失敗を記録する（試しの1件なら他のワーカーの待ちを解く）
+                self.breaker.record(False)
+                raise
+
+            latency = time.monotonic() - start
+            throttled = response.status_code in RETRY_STATUSES
+            retry_after = parse_retry_after(response) if throttled else None
+            self.breaker.record(not throttled)
+            self.limiter.on_response(url, latency, throttled=throttled, retry_after=retry_after)
+            if not throttled or attempts > self.max_retries:
+                return response, attempts, waited
+
+            self._count(throttled=1)
+            waited += self._backoff(url, attempts, retry_after)
+
+    def _backoff(self, url, attempt, retry_after=None):
+        """再試行までの待ち（base * 2^(attempt-1)、ジッター付き、上限あり）"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        delay = random.uniform(delay / 2, delay)
+        if retry_after is not None:
+            delay = min(self.backoff_max, max(delay, retry_after))
+        self.logger.warning(f"再試行します ({attempt}/{self.max_retries}, {delay:.1f}秒後): {url}")
+        self._count(retries=1)
+        time.sleep(delay)
+        return delay
+
+    def map(self, func, items):
+        """itemsの各要素にfunc(item)をワーカースレッドで実行し、完了順に(item, 結果, 例外)を返す
+
+        同時に投入するのはmax_workersの2倍までに抑え、長いリストでも未処理の結果を溜め込まない。
+        呼び出し側で結果を処理（保存など）している間も取得は進む。
+        """
+        items = iter(items)
+        window = self.max_workers * 2
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='fetcher') as pool:
+            pending = {}
+
+            def submit(count):
+                for item in items:
+                    pending[pool.submit(func, item)] = item
+                    count -= 1
+                    if count <= 0:
+                        return
+
+            submit(window)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    error = future.exception()
+                    yield item, (None if error else future.result()), error
+                submit(len(done))
+
+    def _count(self, **values):
+        with self._stats_lock:
+            for key, value in values.items():
+                self.stats[key] += value
+
+
+class _RateLimitedSession:
+    """HttpCacheに渡すセッション（実際にリクエストするときだけレート制限・再試行を行う）"""
+
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+        self.requests = 0
+        self.waited = 0.0
+
+    def get(self, url, **kwargs):
+        response, attempts, waited = self.fetcher.send(url, **kwargs)
+        self.requests += attempts
+        self.waited += waited
+        return response
@@ -0,0 +1,196 @@
+"""
+HTTPレスポンスのディスクキャッシュ
+本文はzlibで圧縮したファイル、ETag/Last-Modifiedなどのメタデータは
+SQLiteの索引に保存し、URL単位で再利用・条件付き再検証を行う
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from config.settings import HTTP_CACHE_DIR, HTTP_CACHE_MAX_MB
+from src.data_collection.database import get_connection_manager
+from src.utils.logger import setup_logger
+
+# 再利用時に復元するレスポンスヘッダー
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class HttpCache:
+    def __init__(self, cache_dir=None, max_mb=None):
+        self.cache_dir = Path(cache_dir or HTTP_CACHE_DIR)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int((HTTP_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024)
+        self.connections = get_connection_manager(self.cache_dir / 'index.db')
+        self.logger = setup_logger(__name__)
+        self._stats_lock = threading.Lock()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+        self._init_index()
+
+    def _init_index(self):
+        with self.connections.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    headers TEXT NOT NULL,
+                    immutable INTEGER NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)')
+
+    def get(self, session, url, immutable=False, **kwargs):
+        """キャッシュを使ってGET
+
+        確定済みとして保存したページはキャッシュがあればネットワークに出ない。
+        それ以外はETag/Last-Modifiedで条件付きGETし、304ならキャッシュの本文を返す。
+        確定前に保存したページは、immutable=Trueでも一度再検証してから確定済みにする。
+        戻り値は (レスポンス, ネットワークに出たか)。
+        """
+        entry = self._lookup(url)
+        if entry is not None and entry['immutable']:
+            response = self._load(url, entry)
+            if response is not None:
+                self._count(hits=1)
+                self._touch(url, immutable)
+                return response, False
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            if entry['headers'].get('ETag'):
+                headers['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+        response = session.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            cached = self._load(url, entry)
+            if cached is not None:
+                self._count(revalidated=1)
+                self._touch(url, immutable)
+                return cached, True
+            # 本文が失われていれば条件なしで取り直す
+            response = session.get(url, **kwargs)
+
+        self._count(misses=1)
+        if response.status_code == 200:
+            self.store(url, response, immutable)
+        return response, True
+
+    def store(self, url, response, immutable=False):
+        """レスポンスを保存"""
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        path = self.cache_dir / key[:2] / f"{key}.zz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        body = zlib.compress(response.content, 6)
+        temp_path = path.with_suffix('.tmp')
+        temp_path.write_bytes(body)
+        os.replace(temp_path, path)
+
+        headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+        now = time.time()
+        with self.connections.transaction() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO entries (url, path, headers, immutable, size, stored_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (url, str(path.relative_to(self.cache_dir)), json.dumps(headers),
+                  int(immutable), len(body), now, now))
+        self._count(stored=1)
+        self.evict()
+
+    def evict(self):
+        """上限サイズを超えていれば最終利用が古いものから削除"""
+        conn = self.connections.get_connection()
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+
+        # 毎回の削除を避けるため上限の9割まで減らす
+        target = total - int(self.max_bytes * 0.9)
+        removed = []
+        freed = 0
+        for url, path, size in conn.execute('SELECT url, path, size FROM entries ORDER BY accessed_at').fetchall():
+            removed.append((url, path))
+            freed += size
+            if freed >= target:
+                break
+
+        with self.connections.transaction() as conn:
+            conn.executemany('DELETE FROM entries WHERE url = ?', [(url,) for url, _ in removed])
+        for _, path in removed:
+            try:
+                (self.cache_dir / path).unlink()
+            except FileNotFoundError:
+                pass
+
+        self._count(evicted=len(removed))
+        self.logger.info(f"HTTPキャッシュを整理: {len(removed)}件 ({freed / 1024 / 1024:.1f}MB)")
+        return len(removed)
+
+    def summary(self):
+        """件数・サイズとヒット統計"""
+        entries, size = self.connections.get_connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+        ).fetchone()
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {**stats, 'entries': entries, 'size_mb': size / 1024 / 1024}
+
+    def iter_bodies(self, url_pattern=None):
+        """保存済みの(URL, 本文)を順に返す（url_patternはURLに対する正規表現）"""
+        rows = self.connections.get_connection().execute(
+            'SELECT url, path, headers, immutable FROM entries ORDER BY url'
+        ).fetchall()
+        for url, path, headers, immutable in rows:
+            if url_pattern is not None and not re.search(url_pattern, url):
+                continue
+            response = self._load(url, {'path': path, 'headers': json.loads(headers), 'immutable': bool(immutable)})
+            if response is not None:
+                yield url, response.content
+
+    def _lookup(self, url):
+        row = self.connections.get_connection().execute(
+            'SELECT path, headers, immutable FROM entries WHERE url = ?', (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'path': row[0], 'headers': json.loads(row[1]), 'immutable': bool(row[2])}
+
+    def _load(self, url, entry):
+        """保存した本文からレスポンスを復元（ファイルがなければNone）"""
+        try:
+            content = zlib.decompress((self.cache_dir / entry['path']).read_bytes())
+        except (FileNotFoundError, zlib.error):
+            return None
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = content
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        return response
+
+    def _touch(self, url, immutable):
+        with self.connections.transaction() as conn:
+            conn.execute(
+                'UPDATE entries SET accessed_at = ?, immutable = MAX(immutable, ?) WHERE url = ?',
+                (time.time(), int(immutable), url)
+            )
+
+    def _count(self, **values):
+        with self._stats_lock:
+            for key, value in values.items():
+                self.stats[key] += value
@@ -0,0 +1,136 @@
+"""
+データ収集ジャーナル
+レース一覧を取得済みの日付と、一覧に載っていたレースの取得状況をSQLiteに記録し、
+中断したデータ収集を未取得のレースから再開できるようにする
+"""
+import time
+
+import pandas as pd
+
+from src.data_collection.database import OiKeibaDatabase
+from src.utils.logger import setup_logger
+
+
+class CollectionJournal:
+    def __init__(self, db=None):
+        self.db = db or OiKeibaDatabase()
+        self.logger = setup_logger(__name__)
+
+    def listed_dates(self, dates):
+        """確定後に一覧を取得済みの日付（再取得不要なもの）を返す"""
+        dates = [self._format_date(date) for date in dates]
+        if not dates:
+            return set()
+        rows = self.db.get_connection().execute(
+            "SELECT race_date FROM collection_dates WHERE settled = 1 AND race_date >= ? AND race_date <= ?",
+            (min(dates), max(dates))
+        ).fetchall()
+        return {row[0] for row in rows} & set(dates)
+
+    def record_listing(self, date, races, settled=False):
+        """1日分のレース一覧を記録（既に記録済みのレースの状態は変えない）"""
+        race_date = self._format_date(date)
+        with self.db.transaction() as conn:
+            conn.execute('''
+                INSERT INTO collection_dates (race_date, race_count, settled, listed_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(race_date) DO UPDATE SET
+                    race_count = excluded.race_count,
+                    settled = excluded.settled,
+                    listed_at = excluded.listed_at
+            ''', (race_date, len(races), int(settled)))
+            conn.executemany('''
+                INSERT INTO collection_races (race_id, race_date, race_name, race_url)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(race_id) DO UPDATE SET
+                    race_name = excluded.race_name,
+                    race_url = excluded.race_url
+            ''', [(race['race_id'], race['race_date'], race['race_name'], race['race_url']) for race in races])
+
+    def races(self, start_date, end_date, missing_only=False):
+        """期間内のレース一覧をジャーナルから取得（missing_only=Trueはrace_resultsにまだないものだけ）"""
+        query = '''
+            SELECT c.race_id, c.race_name, c.race_url, c.race_date
+            FROM collection_races c
+            WHERE c.race_date >= ? AND c.race_date <= ?
+        '''
+        if missing_only:
+            # ジャーナルの状態ではなく実際に保存されている結果と突き合わせる
+            query += " AND NOT EXISTS (SELECT 1 FROM races r WHERE r.race_id = c.race_id)"
+        query += " ORDER BY c.race_date, c.race_id"
+
+        rows = self.db.get_connection().execute(
+            query, (self._format_date(start_date), self._format_date(end_date))
+        ).fetchall()
+        return [
+            {'race_id': race_id, 'race_name': race_name, 'race_url': race_url, 'race_date': race_date}
+            for race_id, race_name, race_url, race_date in rows
+        ]
+
+    def mark_stored(self, race_ids):
+        """結果を保存したレースを記録"""
+        if not race_ids:
+            return
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "UPDATE collection_races SET status = 'stored', updated_at = CURRENT_TIMESTAMP WHERE race_id = ?",
+                [(race_id,) for race_id in race_ids]
+            )
+
+    def mark_failed(self, race_id, error=None):
+        """取得に失敗したレースを記録"""
+        with self.db.transaction() as conn:
+            conn.execute('''
+                UPDATE collection_races
+                SET status = 'failed', attempts = attempts + 1, last_error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE race_id = ?
+            ''', (None if error is None else str(error), race_id))
+
+    def progress(self, start_date, end_date):
+        """期間内の収集状況（取得済み日付数と状態ごとのレース数）"""
+        conn = self.db.get_connection()
+        start, end = self._format_date(start_date), self._format_date(end_date)
+        listed_dates = conn.execute(
+            "SELECT COUNT(*) FROM collection_dates WHERE race_date >= ? AND race_date <= ?", (start, end)
+        ).fetchone()[0]
+        status = pd.read_sql_query('''
+            SELECT status, COUNT(*) AS races FROM collection_races
+            WHERE race_date >= ? AND race_date <= ?
+            GROUP BY status
+        ''', conn, params=[start, end]).set_index('status')['races']
+
+        return {
+            'listed_dates': listed_dates,
+            'races': int(status.sum()),
+            'stored': int(status.get('stored', 0)),
+            'failed': int(status.get('failed', 0)),
+            'pending': int(status.get('pending', 0)),
+        }
+
+    @staticmethod
+    def _format_date(date):
+        return date if isinstance(date, str) else date.strftime('%Y-%m-%d')
+
+
+class ProgressReporter:
+    """件数ベースの進捗と残り時間の見積もりをログに出す"""
+
+    def __init__(self, total, logger=None, every=1):
+        self.total = total
+        self.every = max(1, every)
+        self.done = 0
+        self.logger = logger or setup_logger(__name__)
+        self.started = time.monotonic()
+
+    def update(self, message=''):
+        """1件完了として記録し、every件ごとにログを出す"""
+        self.done += 1
+        if self.done % self.every and self.done != self.total:
+            return
+        elapsed = time.monotonic() - self.started
+        percent = self.done / self.total * 100 if self.total else 100.0
+        remaining = elapsed / self.done * (self.total - self.done)
+        self.logger.info(
+            f"進捗: {self.done}/{self.total} ({percent:.1f}%) 経過 {elapsed:.0f}秒 / 残り約 {remaining:.0f}秒"
+            + (f" - {message}" if message else '')
+        )
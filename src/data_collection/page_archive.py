@@ -0,0 +1,294 @@
+"""
+取得したページの追記専用アーカイブ
+ネットワークから取得したページを1件ずつ圧縮してセグメントファイルの末尾に追記し、
+URL・レースIDから位置を引ける索引をSQLiteに持つ。
+パーサーを直したときや列を増やしたときは、取得し直さずにアーカイブから再パースする
+"""
+import hashlib
+import multiprocessing
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from config.settings import (
+    PAGE_ARCHIVE_DIR, PAGE_ARCHIVE_SEGMENT_MB, PAGE_ARCHIVE_CODEC, PIPELINE_PARSE_WORKERS
+)
+from src.data_collection import parsers
+from src.data_collection.database import get_connection_manager
+from src.data_collection.journal import CollectionJournal, ProgressReporter
+from src.utils.logger import setup_logger
+
+RACE_RESULT_URL_PATTERN = re.compile(r'/race/(\d+)/$')
+RACE_LIST_URL_PATTERN = re.compile(r'/race/list/')
+CALENDAR_URL_PATTERN = re.compile(r'/calendar\.html')
+
+# コーデックごとのセグメントファイルの拡張子
+CODEC_EXTENSIONS = {'zstd': 'zst', 'zlib': 'zz'}
+
+
+def compress(content, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(content)
+    return zlib.compress(content, 6)
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstdで圧縮されたページの読み込みにはzstandardが必要です")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def read_record(path, offset, length, codec):
+    """セグメントファイルから1件分を読み出して展開"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return decompress(f.read(length), codec)
+
+
+def classify_url(url):
+    """(ページの種類, レースID) を返す"""
+    match = RACE_RESULT_URL_PATTERN.search(url)
+    if match:
+        return 'result', match.group(1)
+    if RACE_LIST_URL_PATTERN.search(url):
+        return 'list', None
+    if CALENDAR_URL_PATTERN.search(url):
+        return 'calendar', None
+    return 'other', None
+
+
+class PageArchive:
+    def __init__(self, archive_dir=None, segment_mb=None, codec=None):
+        self.archive_dir = Path(archive_dir or PAGE_ARCHIVE_DIR)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = int((segment_mb or PAGE_ARCHIVE_SEGMENT_MB) * 1024 * 1024)
+        codec = codec or PAGE_ARCHIVE_CODEC
+        # zstandardがなければzlibで保存する（読み込みは記録されたコーデックで行う）
+        self.codec = 'zlib' if codec == 'zstd' and zstandard is None else codec
+        self.connections = get_connection_manager(self.archive_dir / 'index.db')
+        self.logger = setup_logger(__name__)
+        self._lock = threading.Lock()
+        self._segment = None
+        self._init_index()
+
+    def _init_index(self):
+        with self.connections.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS pages (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    race_id TEXT,
+                    segment TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    codec TEXT NOT NULL,
+                    sha1 TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_url ON pages (url, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_race ON pages (race_id, id)')
+
+    def append(self, url, content):
+        """ページを追記（同じURLの最新版と内容が同じなら何もせずFalse）"""
+        digest = hashlib.sha1(content).hexdigest()
+        latest = self._latest('url = ?', (url,))
+        if latest is not None and latest['sha1'] == digest:
+            return False
+
+        kind, race_id = classify_url(url)
+        data = compress(content, self.codec)
+        with self._lock:
+            segment = self._current_segment()
+            with open(self.archive_dir / segment, 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+
+            with self.connections.transaction() as conn:
+                conn.execute('''
+                    INSERT INTO pages (url, kind, race_id, segment, offset, length, size, codec, sha1, fetched_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (url, kind, race_id, segment, offset, len(data), len(content), self.codec, digest, time.time()))
+        return True
+
+    def get(self, url):
+        """URLの最新版の本文（なければNone）"""
+        record = self._latest('url = ?', (url,))
+        return None if record is None else self.read(record)
+
+    def get_race(self, race_id):
+        """レース結果ページの最新版の本文（なければNone）"""
+        record = self._latest("race_id = ? AND kind = 'result'", (race_id,))
+        return None if record is None else self.read(record)
+
+    def read(self, record):
+        return read_record(self.archive_dir / record['segment'], record['offset'], record['length'], record['codec'])
+
+    def race_records(self, race_ids=None):
+        """レースごとの結果ページの最新版の位置（race_idsを指定するとその中だけ）"""
+        rows = self.connections.get_connection().execute('''
+            SELECT race_id, segment, offset, length, codec FROM pages
+            WHERE id IN (SELECT MAX(id) FROM pages WHERE kind = 'result' GROUP BY race_id)
+            ORDER BY race_id
+        ''').fetchall()
+        wanted = None if race_ids is None else set(race_ids)
+        return [
+            {'race_id': race_id, 'segment': segment, 'offset': offset, 'length': length, 'codec': codec}
+            for race_id, segment, offset, length, codec in rows
+            if wanted is None or race_id in wanted
+        ]
+
+    def import_cache(self, cache, url_pattern=None):
+        """HttpCacheに保存済みのページを取り込み、追加した件数を返す"""
+        return sum(self.append(url, content) for url, content in cache.iter_bodies(url_pattern))
+
+    def summary(self):
+        """件数と圧縮前後のサイズ"""
+        pages, races, size, stored = self.connections.get_connection().execute('''
+            SELECT COUNT(*), COUNT(DISTINCT race_id), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0)
+            FROM pages
+        ''').fetchone()
+        return {
+            'pages': pages,
+            'races': races,
+            'size_mb': size / 1024 / 1024,
+            'stored_mb': stored / 1024 / 1024,
+            'ratio': size / stored if stored else 0.0,
+        }
+
+    def _latest(self, condition, params):
+        row = self.connections.get_connection().execute(
+            f"SELECT segment, offset, length, codec, sha1 FROM pages WHERE {condition} ORDER BY id DESC LIMIT 1",
+            params
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('segment', 'offset', 'length', 'codec', 'sha1'), row))
+
+    def _current_segment(self):
+        """追記先のセグメント（上限を超えたか、コーデックが違えば次のファイルにする）"""
+        extension = CODEC_EXTENSIONS[self.codec]
+        if self._segment is None:
+            segments = sorted(self.archive_dir.glob('segment-*.*'))
+            self._segment = segments[-1].name if segments else None
+
+        if self._segment is not None:
+            path = self.archive_dir / self._segment
+            if self._segment.endswith(f'.{extension}') and (
+                not path.exists() or path.stat().st_size < self.segment_bytes
+            ):
+                return self._segment
+            number = int(self._segment.split('-')[1].split('.')[0]) + 1
+        else:
+            number = 1
+        self._segment = f"segment-{number:06d}.{extension}"
+        return self._segment
+
+
+def _reparse(path, offset, length, codec, race_id, race_date):
+    """アーカイブの1レース分を読み出してパース（ワーカープロセスで実行）"""
+    return parsers.parse_race_result(read_record(path, offset, length, codec), race_id, race_date)
+
+
+class ArchiveReparser:
+    """アーカイブのレース結果ページを並列に再パースし、結果を保存し直す"""
+
+    def __init__(self, archive, db, workers=None, batch_size=None, use_processes=True):
+        self.archive = archive
+        self.db = db
+        self.workers = workers or PIPELINE_PARSE_WORKERS
+        self.batch_size = batch_size
+        self.use_processes = use_processes
+        self.logger = setup_logger(__name__)
+
+    def race_dates(self):
+        """レースIDから開催日（ジャーナルと保存済みの結果から）"""
+        rows = self.db.get_connection().execute('''
+            SELECT race_id, race_date FROM collection_races
+            UNION
+            SELECT race_id, race_date FROM races
+        ''').fetchall()
+        return dict(rows)
+
+    def run(self, race_ids=None, start_date=None, end_date=None):
+        """再パースして保存し、件数を返す（開催日が分からないレースは飛ばす）"""
+        dates = self.race_dates()
+        records = []
+        skipped = 0
+        for record in self.archive.race_records(race_ids):
+            race_date = dates.get(record['race_id'])
+            if race_date is None:
+                skipped += 1
+                continue
+            if (start_date and race_date < start_date) or (end_date and race_date > end_date):
+                continue
+            records.append((record, race_date))
+        if skipped:
+            self.logger.warning(f"開催日が分からないため飛ばしたレース: {skipped}件")
+        self.logger.info(f"再パースするレース: {len(records)}件 (ワーカー {self.workers})")
+
+        if self.use_processes:
+            executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='reparse')
+
+        progress = ProgressReporter(len(records), self.logger, every=max(1, len(records) // 20))
+        parsed = empty = failed = 0
+        pending = {}
+        items = iter(records)
+
+        def submit(count):
+            for record, race_date in items:
+                path = str(self.archive.archive_dir / record['segment'])
+                future = executor.submit(
+                    _reparse, path, record['offset'], record['length'], record['codec'], record['race_id'], race_date
+                )
+                pending[future] = record['race_id']
+                count -= 1
+                if count <= 0:
+                    return
+
+        journal = CollectionJournal(self.db)
+        with executor, self.db.bulk_writer(self.batch_size, on_flush=journal.mark_stored) as writer:
+            # 投入はワーカー数の数倍までにして、パース済みの結果を溜め込まない
+            submit(self.workers * 4)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    race_id = pending.pop(future)
+                    progress.update()
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        self.logger.error(f"再パースエラー: {race_id} - {e}")
+                        failed += 1
+                        continue
+                    if results:
+                        writer.add(results)
+                        parsed += 1
+                    else:
+                        self.logger.warning(f"結果表が見つかりません: {race_id}")
+                        empty += 1
+                submit(len(done))
+
+        return {
+            'races': len(records),
+            'parsed': parsed,
+            'empty': empty,
+            'failed': failed,
+            'skipped': skipped,
+            'inserted': writer.counts['inserted'],
+            'replaced': writer.counts['replaced'],
+        }
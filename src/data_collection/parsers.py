@@ -0,0 +1,209 @@
+"""
+netkeibaのページのパース
+lxmlで組み立てた木から必要な要素だけを取り出す。
+BeautifulSoup（html.parser）版は出力が一致することの確認とベンチマーク用に残している。
+プロセスプールから呼べるように全てモジュールレベルの関数にしている。
+"""
+import re
+from urllib.parse import urljoin
+
+import lxml.html
+from bs4 import BeautifulSoup, UnicodeDammit
+
+# 数値変換用の正規表現（毎回のコンパイルを避ける）
+NON_DIGIT_PATTERN = re.compile(r'[^\d]')
+NON_NUMBER_PATTERN = re.compile(r'[^\d.]')
+DIGITS_PATTERN = re.compile(r'(\d+)')
+RACE_LINK_PATTERN = re.compile(r'/race/\d+/')
+DISTANCE_PATTERN = re.compile(r'(\d+)m')
+WEATHER_PATTERN = re.compile(r'天候:(\w+)')
+CONDITION_PATTERN = re.compile(r'馬場:(\w+)')
+
+# classトークンで要素を探すXPath（BeautifulSoupのclass_指定と同じ一致条件）
+RESULTS_TABLE_XPATH = "//table[contains(concat(' ', normalize-space(@class), ' '), ' race_table_01 ')]"
+RACEDATA_XPATH = "//p[contains(concat(' ', normalize-space(@class), ' '), ' racedata ')]"
+
+
+def safe_int(value):
+    """安全な整数変換"""
+    try:
+        return int(NON_DIGIT_PATTERN.sub('', value))
+    except (ValueError, TypeError):
+        return 0
+
+
+def safe_float(value):
+    """安全な浮動小数点変換"""
+    try:
+        return float(NON_NUMBER_PATTERN.sub('', value))
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def extract_horse_weight(weight_text):
+    """馬体重を抽出"""
+    weight_match = DIGITS_PATTERN.search(weight_text)
+    return int(weight_match.group(1)) if weight_match else 0
+
+
+def parse_race_list(content, race_date, base_url):
+    """レース一覧ページからレースリンクを抽出（race_date: YYYY-MM-DD）"""
+    tree = _parse_html(content)
+    if tree is None:
+        return []
+
+    links = (
+        (link.get('href'), link)
+        for link in tree.iter('a')
+        if link.get('href') is not None and RACE_LINK_PATTERN.search(link.get('href'))
+    )
+    return _build_race_list(((href, link.text_content()) for href, link in links), race_date, base_url)
+
+
+def parse_race_result(content, race_id, race_date):
+    """レース結果ページをパース（結果表がなければNone）"""
+    tree = _parse_html(content)
+    if tree is None:
+        return None
+
+    # レース情報を取得
+    h1 = next(tree.iter('h1'), None)
+    racedata = tree.xpath(RACEDATA_XPATH)
+    race_info = _extract_race_info(
+        None if h1 is None else h1.text_content(),
+        racedata[0].text_content() if racedata else None
+    )
+
+    # 着順結果を取得
+    tables = tree.xpath(RESULTS_TABLE_XPATH)
+    if not tables:
+        return None
+
+    rows = list(tables[0].iter('tr'))[1:]  # ヘッダーを除く
+    return _build_results(
+        ([cell.text_content() for cell in row.iter('td')] for row in rows),
+        race_id, race_date, race_info
+    )
+
+
+def parse_race_list_bs4(content, race_date, base_url):
+    """BeautifulSoup版のレース一覧パース（比較用）"""
+    soup = BeautifulSoup(content, 'html.parser')
+    links = soup.find_all('a', href=RACE_LINK_PATTERN)
+    return _build_race_list(((link['href'], link.text) for link in links), race_date, base_url)
+
+
+def parse_race_result_bs4(content, race_id, race_date):
+    """BeautifulSoup版のレース結果パース（比較用）"""
+    soup = BeautifulSoup(content, 'html.parser')
+
+    h1 = soup.find('h1')
+    racedata = soup.find('p', class_='racedata')
+    race_info = _extract_race_info(
+        None if h1 is None else h1.text,
+        None if racedata is None else racedata.text
+    )
+
+    results_table = soup.find('table', class_='race_table_01')
+    if not results_table:
+        return None
+
+    rows = results_table.find_all('tr')[1:]
+    return _build_results(
+        ([cell.text for cell in row.find_all('td')] for row in rows),
+        race_id, race_date, race_info
+    )
+
+
+def _parse_html(content):
+    """HTMLを木に変換（文字コードの判定はBeautifulSoupと同じ方法で行う）"""
+    if isinstance(content, bytes):
+        content = UnicodeDammit(content, is_html=True).unicode_markup
+    if not content or not content.strip():
+        return None
+    return lxml.html.document_fromstring(content)
+
+
+def _extract_race_info(race_name_text, course_text):
+    """レース名とコース情報の文字列からレース情報を抽出"""
+    race_info = {}
+
+    # レース名
+    if race_name_text is not None:
+        race_info['race_name'] = race_name_text.strip()
+
+    # コース情報
+    if course_text is not None:
+        # 距離を抽出
+        distance_match = DISTANCE_PATTERN.search(course_text)
+        if distance_match:
+            race_info['course_length'] = int(distance_match.group(1))
+
+        # コース種別
+        if 'ダ' in course_text:
+            race_info['course_type'] = 'ダート'
+        elif '芝' in course_text:
+            race_info['course_type'] = '芝'
+
+        # 天候・馬場状態
+        weather_match = WEATHER_PATTERN.search(course_text)
+        if weather_match:
+            race_info['weather'] = weather_match.group(1)
+
+        condition_match = CONDITION_PATTERN.search(course_text)
+        if condition_match:
+            race_info['track_condition'] = condition_match.group(1)
+
+    return race_info
+
+
+def _build_race_list(links, race_date, base_url):
+    """(href, リンク文字列)からレース一覧を作成（同じレースへのリンクは最初の1件だけ）"""
+    race_list = []
+    seen = set()
+
+    for href, text in links:
+        race_id = href.split('/')[-2]
+        # 同じレースへのリンクが複数あることがある（レース名と結果への両方など）
+        if race_id in seen:
+            continue
+        seen.add(race_id)
+
+        race_list.append({
+            'race_id': race_id,
+            'race_name': text.strip(),
+            'race_url': urljoin(base_url, href),
+            'race_date': race_date
+        })
+
+    return race_list
+
+
+def _build_results(rows, race_id, race_date, race_info):
+    """各行のセル文字列のリストから結果の辞書を作成"""
+    results = []
+
+    for cells in rows:
+        if len(cells) < 8:
+            continue
+        cells = [cell.strip() for cell in cells]
+        results.append({
+            'race_id': race_id,
+            'race_date': race_date,
+            'race_name': race_info.get('race_name', ''),
+            'course_length': race_info.get('course_length', 0),
+            'course_type': race_info.get('course_type', ''),
+            'weather': race_info.get('weather', ''),
+            'track_condition': race_info.get('track_condition', ''),
+            'finish_position': safe_int(cells[0]),
+            'horse_name': cells[3],
+            'jockey_name': cells[6],
+            'trainer_name': cells[7] if len(cells) > 7 else '',
+            'horse_weight': extract_horse_weight(cells[4]),
+            'odds': safe_float(cells[5]),
+            'popularity': safe_int(cells[2]),
+            'time_result': cells[8] if len(cells) > 8 else '',
+            'margin': cells[9] if len(cells) > 9 else ''
+        })
+
+    return results
@@ -0,0 +1,268 @@
+"""
+段階的なデータ収集パイプライン
+取得（I/O待ちのスレッド）→ パース（CPUを使うプロセスプール）→ 保存（単一の書き込み段）を
+上限付きのキューでつなぎ、後ろの段が詰まったら前の段が待つ（バックプレッシャー）
+"""
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from config.settings import PIPELINE_PARSE_WORKERS, PIPELINE_QUEUE_SIZE, SCRAPING_RETRY_PASSES
+from src.data_collection import parsers
+from src.data_collection.fetcher import is_retryable
+from src.data_collection.journal import ProgressReporter
+from src.utils.logger import setup_logger
+
+# 段の終わりを後ろの段に知らせる目印
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    """他の段のエラーでパイプラインが止められた"""
+
+
+def _timed_parse(content, race_id, race_date):
+    """パースして(結果, 処理秒数)を返す（ワーカープロセスで実行）"""
+    start = time.perf_counter()
+    results = parsers.parse_race_result(content, race_id, race_date)
+    return results, time.perf_counter() - start
+
+
+class StageMetrics:
+    """キューの深さと段ごとの処理件数・処理時間"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queues = {}
+        self.stages = {}
+
+    def sample(self, name, depth):
+        """キューの深さを記録"""
+        with self._lock:
+            stats = self.queues.setdefault(name, {'samples': 0, 'total': 0, 'max': 0})
+            stats['samples'] += 1
+            stats['total'] += depth
+            stats['max'] = max(stats['max'], depth)
+
+    def record(self, stage, seconds, items=1):
+        """段の処理時間を記録"""
+        with self._lock:
+            stats = self.stages.setdefault(stage, {'items': 0, 'seconds': 0.0})
+            stats['items'] += items
+            stats['seconds'] += seconds
+
+    def summary(self):
+        with self._lock:
+            return {
+                'queues': {
+                    name: {
+                        'avg_depth': stats['total'] / stats['samples'] if stats['samples'] else 0.0,
+                        'max_depth': stats['max'],
+                    }
+                    for name, stats in self.queues.items()
+                },
+                'stages': {name: dict(stats) for name, stats in self.stages.items()},
+            }
+
+
+class CollectionPipeline:
+    def __init__(self, scraper, parse_workers=None, queue_size=None, batch_size=None, use_processes=True,
+                 retry_passes=None):
+        self.scraper = scraper
+        self.parse_workers = parse_workers or PIPELINE_PARSE_WORKERS
+        self.queue_size = queue_size or PIPELINE_QUEUE_SIZE
+        self.batch_size = batch_size
+        # 一時的なエラーで失敗したレースは最後にまとめて取り直す
+        self.retry_passes = SCRAPING_RETRY_PASSES if retry_passes is None else retry_passes
+        # Falseではパースをスレッドで行う（プロセスを起動できない環境やテスト用）
+        self.use_processes = use_processes
+        self.logger = setup_logger(__name__)
+        self.metrics = StageMetrics()
+
+    def run(self, race_list):
+        """レース一覧の結果を取得・パース・保存し、件数と各段の統計を返す"""
+        races = list(race_list)
+        self.metrics = StageMetrics()
+        summary = {'races': len(races), 'stored': 0, 'failed': 0, 'retried': 0, 'inserted': 0, 'replaced': 0}
+
+        for attempt in range(self.retry_passes + 1):
+            if attempt:
+                self.logger.info(f"失敗したレースを取り直します: {len(races)}レース ({attempt}/{self.retry_passes})")
+                summary['retried'] += len(races)
+            result = self._run_pass(races)
+            for key in ('stored', 'inserted', 'replaced'):
+                summary[key] += result[key]
+            # 取り直しても変わらない失敗（404や結果表のないページ）はこの時点で確定
+            summary['failed'] += result['failed'] - len(result['retry'])
+            races = result['retry']
+            if not races:
+                break
+        summary['failed'] += len(races)
+
+        summary['metrics'] = self.metrics.summary()
+        self._log_metrics(summary['metrics'])
+        return summary
+
+    def _run_pass(self, races):
+        """1回分の取得・パース・保存"""
+        fetched = queue.Queue(maxsize=self.queue_size)
+        parsed = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+
+        def run_stage(target, *args):
+            try:
+                target(*args)
+            except PipelineStopped:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+        stages = [
+            threading.Thread(target=run_stage, args=(self._fetch_stage, races, fetched, stop), name='pipeline-fetch'),
+            threading.Thread(target=run_stage, args=(self._parse_stage, fetched, parsed, stop), name='pipeline-parse'),
+        ]
+        for thread in stages:
+            thread.start()
+
+        summary = None
+        try:
+            summary = self._write_stage(len(races), fetched, parsed, stop)
+        except PipelineStopped:
+            # 前の段のエラーで止まった（エラーは下で送出する）
+            pass
+        finally:
+            stop.set()
+            for thread in stages:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+        return summary
+
+    def _fetch_stage(self, races, fetched, stop):
+        """取得段: fetcherのスレッドでページを取得して後ろに渡す"""
+        def fetch(race):
+            start = time.perf_counter()
+            content = self.scraper.fetch_race_result_page(race['race_id'], race['race_date'])
+            return content, time.perf_counter() - start
+
+        for race, result, error in self.scraper.fetcher.map(fetch, races):
+            content = None
+            if result is not None:
+                content, seconds = result
+                self.metrics.record('fetch', seconds)
+            self._put(fetched, 'fetched', (race, content, error), stop)
+        self._put(fetched, 'fetched', _DONE, stop)
+
+    def _parse_stage(self, fetched, parsed, stop):
+        """パース段: プロセスプールでHTMLをパースして書き込み段に渡す"""
+        if self.use_processes:
+            # 他のスレッドが動いている状態でforkしないようにspawnで起動する
+            executor = ProcessPoolExecutor(
+                max_workers=self.parse_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.parse_workers, thread_name_prefix='pipeline-parse')
+
+        pending = {}
+
+        def drain(return_when):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                race = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    results, seconds = future.result()
+                    self.metrics.record('parse', seconds)
+                    self._put(parsed, 'parsed', (race, results, None), stop)
+                else:
+                    self._put(parsed, 'parsed', (race, None, error), stop)
+
+        with executor:
+            while True:
+                item = self._get(fetched, stop)
+                if item is _DONE:
+                    break
+                race, content, error = item
+                if error is not None:
+                    self._put(parsed, 'parsed', (race, None, error), stop)
+                    continue
+
+                pending[executor.submit(_timed_parse, content, race['race_id'], race['race_date'])] = race
+                # プロセスに渡したまま溜め込まないように上限を設ける
+                while len(pending) >= self.parse_workers * 2:
+                    drain(FIRST_COMPLETED)
+
+            while pending:
+                drain(FIRST_COMPLETED)
+        self._put(parsed, 'parsed', _DONE, stop)
+
+    def _write_stage(self, total, fetched, parsed, stop):
+        """書き込み段: 結果をまとめて保存し、保存と失敗をジャーナルに記録（このスレッドだけが書き込む）"""
+        progress = ProgressReporter(total, self.logger)
+        stored = failed = 0
+        retry = []
+
+        with self.scraper.db.bulk_writer(self.batch_size, on_flush=self.scraper.journal.mark_stored) as writer:
+            while True:
+                item = self._get(parsed, stop)
+                if item is _DONE:
+                    break
+                race, results, error = item
+
+                start = time.perf_counter()
+                if results:
+                    writer.add(results)
+                    stored += 1
+                else:
+                    if error is not None:
+                        self.logger.error(f"レース結果取得エラー: {race['race_id']} - {error}")
+                    # 次回の--resumeで取り直す
+                    self.scraper.journal.mark_failed(race['race_id'], error)
+                    failed += 1
+                    if error is not None and is_retryable(error):
+                        retry.append(race)
+                self.metrics.record('write', time.perf_counter() - start)
+
+                progress.update(
+                    f"{race['race_name']} (取得済み待ち {fetched.qsize()} / 保存待ち {parsed.qsize()})"
+                )
+
+        return {
+            'races': total,
+            'stored': stored,
+            'failed': failed,
+            'retry': retry,
+            'inserted': writer.counts['inserted'],
+            'replaced': writer.counts['replaced'],
+        }
+
+    def _put(self, target, name, item, stop):
+        """上限付きキューに入れる（満杯なら空くまで待つ）"""
+        while True:
+            if stop.is_set():
+                raise PipelineStopped()
+            try:
+                target.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            self.metrics.sample(name, target.qsize())
+            return
+
+    def _get(self, source, stop):
+        while True:
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    raise PipelineStopped()
+
+    def _log_metrics(self, metrics):
+        for name, stats in metrics['queues'].items():
+            self.logger.info(f"キュー {name}: 平均 {stats['avg_depth']:.1f} / 最大 {stats['max_depth']}")
+        for name, stats in metrics['stages'].items():
+            self.logger.info(f"段 {name}: {stats['items']}件 / 処理時間 {stats['seconds']:.1f}秒")
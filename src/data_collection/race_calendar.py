@@ -0,0 +1,148 @@
+"""
+開催日カレンダー
+月ごとの開催カレンダーを取得して大井の開催日をデータベースに保存し、
+レース一覧の取得を実際の開催日だけに絞る
+"""
+import re
+from calendar import monthrange
+from datetime import datetime, timedelta
+
+from bs4 import BeautifulSoup
+
+from config.settings import NETKEIBA_BASE_URL, OI_COURSE_CODE, RACE_CALENDAR_PATH, HTTP_CACHE_IMMUTABLE_AFTER_DAYS
+from src.data_collection.database import OiKeibaDatabase
+from src.utils.logger import setup_logger
+
+# カレンダー内の開催日へのリンク（?kaisai_date=YYYYMMDD または /race/list/CCYYYYMMDD/）
+KAISAI_DATE_PATTERN = re.compile(r'kaisai_date=(\d{8})')
+RACE_LIST_PATTERN = re.compile(r'/race/list/(\d{2})(\d{8})/')
+COURSE_PATTERN = re.compile(r'jyo_cd=(\d{2})')
+
+
+class RacingCalendar:
+    def __init__(self, db=None, fetcher=None, base_url=None):
+        self.db = db or OiKeibaDatabase()
+        self.fetcher = fetcher
+        self.base_url = base_url or NETKEIBA_BASE_URL
+        self.logger = setup_logger(__name__)
+
+    def meeting_days(self, start_date, end_date, record=True):
+        """期間内の開催日のリスト（カレンダーが取れなかった月は全日を返す、record=Falseでは保存しない）"""
+        months = self._months_between(start_date, end_date)
+        settled = self._settled_months(months)
+        to_fetch = [month for month in months if month not in settled]
+
+        failed = set()
+        fetched = {}
+        if to_fetch:
+            for (year, month), days, error in self.fetcher.map(lambda ym: self.fetch_month(*ym), to_fetch):
+                if error is not None:
+                    self.logger.warning(f"開催カレンダー取得エラー: {year}-{month:02d} - {error}（全日を対象にします）")
+                    failed.add((year, month))
+                    continue
+                if not days:
+                    # ページ構成が変わって読めていない可能性があるため取りこぼさないようにする
+                    self.logger.warning(f"開催日が見つかりません: {year}-{month:02d}（全日を対象にします）")
+                    failed.add((year, month))
+                    continue
+                fetched[f"{year:04d}-{month:02d}"] = days
+                if record:
+                    self.record_month(year, month, days)
+
+        # 取得した月は保存済みの記録ではなく取得した開催日を使う
+        days = {day for day in self._stored_days(start_date, end_date) if day[:7] not in fetched}
+        for month_days in fetched.values():
+            days.update(month_days)
+        for year, month in failed:
+            days.update(
+                datetime(year, month, day).strftime('%Y-%m-%d')
+                for day in range(1, monthrange(year, month)[1] + 1)
+            )
+
+        start, end = start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+        meeting_days = [
+            datetime.strptime(day, '%Y-%m-%d')
+            for day in sorted(days) if start <= day <= end
+        ]
+        self.logger.info(f"開催日: {len(meeting_days)}日 (期間 {(end_date - start_date).days + 1}日)")
+        return meeting_days
+
+    def fetch_month(self, year, month):
+        """1か月分の開催カレンダーを取得してパース"""
+        url = self.base_url + RACE_CALENDAR_PATH.format(year=year, month=month, course=OI_COURSE_CODE)
+        response = self.fetcher.get(url, immutable=self.is_settled(year, month))
+        return self.parse_calendar(response.content, year, month)
+
+    def parse_calendar(self, content, year, month):
+        """カレンダーページから大井の開催日を抽出"""
+        soup = BeautifulSoup(content, 'html.parser')
+        prefix = f"{year:04d}{month:02d}"
+        days = set()
+
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            list_match = RACE_LIST_PATTERN.search(href)
+            if list_match:
+                course, date = list_match.groups()
+            else:
+                date_match = KAISAI_DATE_PATTERN.search(href)
+                if not date_match:
+                    continue
+                date = date_match.group(1)
+                course_match = COURSE_PATTERN.search(href)
+                course = course_match.group(1) if course_match else OI_COURSE_CODE
+
+            # 他の競馬場の開催や前後の月の日付は除く
+            if course != OI_COURSE_CODE or not date.startswith(prefix):
+                continue
+            days.add(f"{date[:4]}-{date[4:6]}-{date[6:]}")
+
+        return sorted(days)
+
+    def record_month(self, year, month, days):
+        """1か月分の開催日を保存（その月の以前の記録は置き換える）"""
+        key = f"{year:04d}-{month:02d}"
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM meeting_days WHERE month = ?", (key,))
+            conn.executemany(
+                "INSERT INTO meeting_days (race_date, month) VALUES (?, ?)",
+                [(day, key) for day in days]
+            )
+            conn.execute('''
+                INSERT INTO calendar_months (month, meeting_days, settled, fetched_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(month) DO UPDATE SET
+                    meeting_days = excluded.meeting_days,
+                    settled = excluded.settled,
+                    fetched_at = excluded.fetched_at
+            ''', (key, len(days), int(self.is_settled(year, month))))
+        self.logger.info(f"開催カレンダー: {key} ({len(days)}日)")
+
+    def is_settled(self, year, month):
+        """月が終わって開催日が今後変わらないとみなせるか"""
+        last_day = datetime(year, month, monthrange(year, month)[1])
+        return datetime.now() - last_day >= timedelta(days=HTTP_CACHE_IMMUTABLE_AFTER_DAYS)
+
+    def _settled_months(self, months):
+        """確定済みとして保存されている月"""
+        rows = self.db.get_connection().execute(
+            "SELECT month FROM calendar_months WHERE settled = 1"
+        ).fetchall()
+        stored = {row[0] for row in rows}
+        return {(year, month) for year, month in months if f"{year:04d}-{month:02d}" in stored}
+
+    def _stored_days(self, start_date, end_date):
+        rows = self.db.get_connection().execute(
+            "SELECT race_date FROM meeting_days WHERE race_date >= ? AND race_date <= ? ORDER BY race_date",
+            (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _months_between(start_date, end_date):
+        months = []
+        year, month = start_date.year, start_date.month
+        while (year, month) <= (end_date.year, end_date.month):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return months
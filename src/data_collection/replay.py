@@ -0,0 +1,216 @@
+"""
+スクレイパーのオフライン計測用の環境
+記録したページ（フィクスチャ）をディレクトリに保存し、netkeibaの代わりに
+ローカルHTTPサーバーから返す。応答の遅延やエラーを注入して、
+ネットワークに出ずに並行数やパーサーの変更の効果を測れるようにする
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from config.settings import OI_COURSE_CODE, RACE_CALENDAR_PATH
+from src.utils.logger import setup_logger
+
+RACE_LIST_DATE_PATTERN = re.compile(r'/race/list/\d{2}(\d{8})/')
+
+
+class FixtureStore:
+    """記録したページ（URLのパスとクエリ → 本文）のディレクトリ"""
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        index_path = self.root / self.INDEX_FILE
+        self.index = json.loads(index_path.read_text(encoding='utf-8')) if index_path.exists() else {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, url, content):
+        """ページを追加（同じパスのページは上書き）"""
+        path = self.path_of(url)
+        name = hashlib.sha1(path.encode('utf-8')).hexdigest() + '.html'
+        (self.root / name).write_bytes(content if isinstance(content, bytes) else content.encode('utf-8'))
+        self.index[path] = name
+        return path
+
+    def get(self, path):
+        name = self.index.get(path)
+        if name is None:
+            return None
+        try:
+            return (self.root / name).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def save(self):
+        """索引を保存（ページの追加後に呼ぶ）"""
+        (self.root / self.INDEX_FILE).write_text(
+            json.dumps(self.index, ensure_ascii=False, indent=1, sort_keys=True), encoding='utf-8'
+        )
+
+    def import_cache(self, cache, url_pattern=None):
+        """HttpCacheに保存済みのページを取り込み、件数を返す"""
+        count = 0
+        for url, content in cache.iter_bodies(url_pattern):
+            self.add(url, content)
+            count += 1
+        self.save()
+        return count
+
+    def meeting_dates(self):
+        """レース一覧ページのある日付（YYYYMMDD）"""
+        return sorted({
+            match.group(1) for match in map(RACE_LIST_DATE_PATTERN.search, self.index) if match
+        })
+
+    @staticmethod
+    def path_of(url):
+        parts = urlsplit(url)
+        return parts.path + (f'?{parts.query}' if parts.query else '')
+
+
+class ReplayServer:
+    """FixtureStoreのページを返すローカルHTTPサーバー
+
+    latency秒（±jitter）待ってから応答し、error_rateの割合でerror_statusを返す。
+    """
+
+    def __init__(self, store, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, seed=None):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'errors': 0, 'not_found': 0, 'bytes': 0}
+        self.logger = setup_logger(__name__)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='replay-server', daemon=True)
+        self._thread.start()
+        self.logger.info(f"フィクスチャサーバー起動: {self.base_url} ({len(self.store)}ページ)")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _respond(self, path):
+        """(ステータス, 本文) を決める"""
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            inject_error = self.random.random() < self.error_rate
+        time.sleep(delay)
+
+        if inject_error:
+            self._count('errors')
+            return self.error_status, None
+        content = self.store.get(path)
+        if content is None:
+            self._count('not_found')
+            return 404, None
+        self._count('bytes', len(content))
+        return 200, content
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, content = server._respond(self.path)
+                self.send_response(status)
+                if content is None:
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def synthetic_result_page(index, runners=16):
+    """計測用の結果ページ（実ページに近い大きさにするため装飾も入れる）"""
+    rows = ''.join(
+        f'<tr><td class="txt_r">{position}</td><td><span>{(position + 1) // 2}</span></td>'
+        f'<td class="txt_r">{position}</td><td><a href="/horse/{index}{position:02d}/">馬{index}-{position}</a></td>'
+        f'<td>{470 + position}({position - 8:+d})</td><td class="txt_r">{position * 1.7:.1f}</td>'
+        f'<td><a href="/jockey/{position}/">騎手{position}</a></td><td><a href="/trainer/{position}/">調教師{position}</a></td>'
+        f'<td>1:{12 + position // 10}.{position % 10}</td><td>{"クビ" if position > 1 else ""}</td></tr>'
+        for position in range(1, runners + 1)
+    )
+    padding = '<div class="nav"><ul>' + '<li><a href="/">menu</a></li>' * 200 + '</ul></div>'
+    return (
+        '<html><head><meta charset="utf-8"><title>レース結果</title></head><body>'
+        f'{padding}<h1>第{index}回 ベンチマーク特別</h1>'
+        '<p class="racedata fc"><span>ダ右1200m / 天候:晴 / ダート:良</span></p>'
+        f'<table class="race_table_01 nk_tb_common"><tr><th>着順</th></tr>{rows}</table>'
+        f'{padding}</body></html>'
+    ).encode('utf-8')
+
+
+def build_synthetic_site(store, start_date, days, races_per_day=12, runners=14):
+    """開催カレンダー・レース一覧・結果ページを生成してstoreに追加（毎日開催として作る）"""
+    dates = [start_date + timedelta(days=offset) for offset in range(days)]
+    by_month = {}
+    for date in dates:
+        by_month.setdefault((date.year, date.month), []).append(date)
+
+    for (year, month), month_dates in by_month.items():
+        links = ''.join(
+            f'<a href="/top/race_list.html?kaisai_date={date:%Y%m%d}&jyo_cd={OI_COURSE_CODE}">{date.day}</a>'
+            for date in month_dates
+        )
+        store.add(
+            RACE_CALENDAR_PATH.format(year=year, month=month, course=OI_COURSE_CODE),
+            f'<html><body>{links}</body></html>'
+        )
+
+    for day, date in enumerate(dates):
+        race_ids = [f"{date:%Y}{OI_COURSE_CODE}{date:%m%d}{number:02d}" for number in range(1, races_per_day + 1)]
+        links = ''.join(f'<a href="/race/{race_id}/">{race_id[-2:]}R 計測特別</a>' for race_id in race_ids)
+        store.add(f"/race/list/{OI_COURSE_CODE}{date:%Y%m%d}/", f'<html><body>{links}</body></html>')
+        for number, race_id in enumerate(race_ids):
+            store.add(f"/race/{race_id}/", synthetic_result_page(day * races_per_day + number, runners))
+
+    store.save()
+    return len(dates) * races_per_day
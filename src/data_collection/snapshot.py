@@ -0,0 +1,201 @@
+"""
+レース履歴のParquetスナップショット
+SQLiteのテーブルを月単位で分割したParquetファイルに書き出し、
+訓練やバックテストではメモリマップで列・期間を絞って読み込む
+"""
+import json
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from pathlib import Path
+
+from config.settings import SNAPSHOT_DIR
+from src.data_collection.database import OiKeibaDatabase, RACE_DATA_COLUMNS
+from src.utils.logger import setup_logger
+
+# 月単位で分割するテーブル（テーブル名: 日付列）
+PARTITIONED_TABLES = {
+    'race_results': 'race_date',
+}
+# 変更の検出に使うテーブル（race_resultsはビューでrowidがないため出走行のテーブルを見る）
+SIGNATURE_TABLES = {
+    'race_results': 'race_entries',
+}
+# 件数が少ないため毎回まるごと書き出すテーブル
+FULL_TABLES = ['horses', 'jra_horse_records', 'jockey_trainer_stats']
+
+# パーティション間で型がぶれないようにrace_resultsのスキーマを固定する
+# （ここに無い列は文字列）
+RACE_RESULTS_TYPES = {
+    'course_length': pa.int64(),
+    'finish_position': pa.int64(),
+    'horse_weight': pa.int64(),
+    'popularity': pa.int64(),
+    'odds': pa.float64(),
+    'horse_id': pa.int64(),
+    'jockey_id': pa.int64(),
+    'trainer_id': pa.int64(),
+}
+RACE_RESULTS_SCHEMA = pa.schema([
+    (column, RACE_RESULTS_TYPES.get(column, pa.string())) for column in RACE_DATA_COLUMNS
+])
+TABLE_SCHEMAS = {
+    'race_results': RACE_RESULTS_SCHEMA,
+}
+
+PARTITION_COLUMN = 'month'
+MANIFEST_FILE = '_manifest.json'
+UNKNOWN_PARTITION = 'unknown'
+
+
+class RaceHistorySnapshot:
+    def __init__(self, db=None, snapshot_dir=None):
+        self.db = db or OiKeibaDatabase()
+        self.snapshot_dir = Path(snapshot_dir or SNAPSHOT_DIR)
+        self.logger = setup_logger(__name__)
+
+    def export(self, tables=None):
+        """スナップショットを書き出し（変更のあった月のパーティションだけを書き直す）"""
+        tables = tables or list(PARTITIONED_TABLES) + FULL_TABLES
+        summary = {}
+
+        for table in tables:
+            if not self._table_exists(table):
+                self.logger.warning(f"テーブルが存在しません: {table}")
+                continue
+
+            if table in PARTITIONED_TABLES:
+                summary[table] = self._export_partitioned(table, PARTITIONED_TABLES[table])
+            else:
+                summary[table] = self._export_full(table)
+
+        return summary
+
+    def load(self, table='race_results', columns=None, start_date=None, end_date=None):
+        """スナップショットを読み込み（列の絞り込みと期間指定をParquet側で適用）"""
+        table_dir = self.snapshot_dir / table
+        if not table_dir.exists():
+            raise FileNotFoundError(f"スナップショットがありません: {table_dir}")
+
+        # メモリマップで読み込み、ページキャッシュをそのまま利用する
+        filesystem = pafs.LocalFileSystem(use_mmap=True)
+        date_column = PARTITIONED_TABLES.get(table)
+
+        if date_column is None:
+            return pq.read_table(
+                str(table_dir / 'part-0.parquet'), columns=columns, filesystem=filesystem
+            ).to_pandas()
+
+        dataset = ds.dataset(
+            str(table_dir), format='parquet', partitioning='hive',
+            filesystem=filesystem, schema=self._dataset_schema(table)
+        )
+
+        # 月パーティションで読み飛ばしてから日付列で絞り込む
+        condition = None
+        if start_date is not None:
+            start_date = str(start_date)
+            condition = self._and(condition, (ds.field(PARTITION_COLUMN) >= start_date[:7]) &
+                                  (ds.field(date_column) >= start_date))
+        if end_date is not None:
+            end_date = str(end_date)
+            condition = self._and(condition, (ds.field(PARTITION_COLUMN) <= end_date[:7]) &
+                                  (ds.field(date_column) <= end_date))
+
+        columns = list(columns) if columns else [
+            name for name in dataset.schema.names if name != PARTITION_COLUMN
+        ]
+        return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+    def _export_partitioned(self, table, date_column):
+        """月単位のパーティションを差分で書き出し"""
+        table_dir = self.snapshot_dir / table
+        table_dir.mkdir(parents=True, exist_ok=True)
+
+        manifest_path = table_dir / MANIFEST_FILE
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+        # 月ごとの件数・最終更新・着順の合計で変更を検出する
+        # （保存し直された行はrowidとcreated_atが新しくなる。created_atは秒単位なのでrowidも見る）
+        conn = self.db.get_connection()
+        signatures = {
+            month or UNKNOWN_PARTITION: {'rows': rows, 'rowid': rowid, 'updated': updated, 'positions': positions}
+            for month, rows, rowid, updated, positions in conn.execute(f'''
+                SELECT substr({date_column}, 1, 7), COUNT(*), MAX(rowid), MAX(created_at), TOTAL(finish_position)
+                FROM {SIGNATURE_TABLES.get(table, table)}
+                GROUP BY substr({date_column}, 1, 7)
+            ''')
+        }
+
+        written = []
+        for month, signature in sorted(signatures.items()):
+            if manifest.get(month) == signature:
+                continue
+
+            if month == UNKNOWN_PARTITION:
+                query = f"SELECT * FROM {table} WHERE {date_column} IS NULL"
+                params = []
+            else:
+                # 'YYYY-MM-DD' 形式の文字列比較で月の範囲を指定する
+                query = f"SELECT * FROM {table} WHERE {date_column} >= ? AND {date_column} <= ?"
+                params = [f"{month}-00", f"{month}-99"]
+
+            df = pd.read_sql_query(query, conn, params=params)
+            self._write_parquet(df, table, table_dir / f"{PARTITION_COLUMN}={month}" / 'part-0.parquet')
+            manifest[month] = signature
+            written.append(month)
+
+        # データベースから消えた月のパーティションを削除
+        removed = [month for month in manifest if month not in signatures]
+        for month in removed:
+            shutil.rmtree(table_dir / f"{PARTITION_COLUMN}={month}", ignore_errors=True)
+            del manifest[month]
+
+        self._write_text(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True))
+        self.logger.info(
+            f"{table}: {len(written)}パーティションを書き出し "
+            f"(変更なし {len(signatures) - len(written)} / 削除 {len(removed)})"
+        )
+        return {'written': written, 'removed': removed, 'partitions': len(signatures)}
+
+    def _export_full(self, table):
+        """テーブル全体を1ファイルに書き出し"""
+        df = pd.read_sql_query(f"SELECT * FROM {table}", self.db.get_connection())
+        self._write_parquet(df, table, self.snapshot_dir / table / 'part-0.parquet')
+        self.logger.info(f"{table}: {len(df)}件を書き出し")
+        return {'rows': len(df)}
+
+    def _write_parquet(self, df, table, path):
+        """一時ファイルに書いてから置き換える（読み込み中のプロセスに途中のファイルを見せない）"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        schema = TABLE_SCHEMAS.get(table)
+        if schema is not None:
+            df = df.reindex(columns=schema.names)
+        arrow_table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+        temp_path = path.with_suffix('.tmp')
+        pq.write_table(arrow_table, str(temp_path), compression='zstd')
+        os.replace(temp_path, path)
+
+    def _write_text(self, path, text):
+        temp_path = path.with_suffix('.tmp')
+        temp_path.write_text(text, encoding='utf-8')
+        os.replace(temp_path, path)
+
+    def _dataset_schema(self, table):
+        """パーティション列を含むデータセットのスキーマ"""
+        return TABLE_SCHEMAS[table].append(pa.field(PARTITION_COLUMN, pa.string()))
+
+    def _table_exists(self, table):
+        row = self.db.get_connection().execute(
+            "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,)
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _and(condition, other):
+        return other if condition is None else condition & other
@@ -0,0 +1 @@
+# Feature engineering package
@@ -0,0 +1,90 @@
+"""
+カテゴリカル変数のエンコーダー
+訓練時に出現したカテゴリの索引（ハッシュ表）を作り、列全体をget_indexerで一度に整数へ変換する。
+0は未知・欠損・出現回数の少ないカテゴリ用に予約し、既知のカテゴリは1から順に割り当てる
+"""
+import json
+import numpy as np
+import pandas as pd
+
+from src.utils.logger import setup_logger
+
+# 未知のカテゴリのコード
+UNKNOWN_CODE = 0
+# 保存形式のバージョン
+ENCODER_FORMAT_VERSION = 1
+
+
+class CategoryEncoder:
+    """1列分のエンコーダー（categoriesの位置 + offset がコード）"""
+
+    def __init__(self, min_count=1, categories=None, offset=1):
+        self.min_count = min_count
+        self.categories = pd.Index(categories if categories is not None else [], dtype='object')
+        # 既知のカテゴリの最初のコード（以前のLabelEncoderから変換したものは0）
+        self.offset = offset
+
+    def __len__(self):
+        """未知を含めたコードの数"""
+        return len(self.categories) + self.offset
+
+    def fit(self, values):
+        """出現回数がmin_count以上のカテゴリを覚える（欠損は数えない）"""
+        counts = pd.Series(values).value_counts(dropna=True)
+        if self.min_count > 1:
+            counts = counts[counts >= self.min_count]
+        self.categories = pd.Index(sorted(counts.index.astype(str)), dtype='object')
+        return self
+
+    def transform(self, values):
+        """列全体を整数のコードに変換（未知・欠損はUNKNOWN_CODE）"""
+        values = pd.Series(values)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # category型はカテゴリの種類だけ索引を引き、行ごとのコードはtakeで展開する
+            lookup = self._codes(values.cat.categories.astype(str))
+            codes = values.cat.codes.to_numpy()
+            return np.where(codes >= 0, lookup[codes], UNKNOWN_CODE).astype('int32')
+        return self._codes(values.astype(object).where(values.notna(), None))
+
+    def fit_transform(self, values):
+        return self.fit(values).transform(values)
+
+    def _codes(self, values):
+        positions = self.categories.get_indexer(values)
+        return np.where(positions >= 0, positions + self.offset, UNKNOWN_CODE).astype('int32')
+
+    def to_dict(self):
+        return {'min_count': self.min_count, 'offset': self.offset, 'categories': self.categories.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(min_count=data['min_count'], categories=data['categories'], offset=data.get('offset', 1))
+
+    @classmethod
+    def from_label_encoder(cls, label_encoder):
+        """以前のLabelEncoderと同じコードを返すエンコーダー（未知は以前と同じ0）"""
+        return cls(categories=[str(value) for value in label_encoder.classes_], offset=0)
+
+
+def save_encoders(encoders, path, native_categorical=False):
+    """エンコーダーをJSONで保存（カテゴリ名の一覧だけを持つ）"""
+    data = {
+        'version': ENCODER_FORMAT_VERSION,
+        'native_categorical': native_categorical,
+        'encoders': {column: encoder.to_dict() for column, encoder in encoders.items()},
+    }
+    path.write_text(json.dumps(data, ensure_ascii=False, separators=(',', ':')), encoding='utf-8')
+
+
+def load_encoders(path):
+    """(列 → エンコーダー, ネイティブのカテゴリカル特徴量を使うか) を読み込み"""
+    data = json.loads(path.read_text(encoding='utf-8'))
+    encoders = {column: CategoryEncoder.from_dict(item) for column, item in data['encoders'].items()}
+    return encoders, data.get('native_categorical', False)
+
+
+def convert_label_encoders(label_encoders):
+    """以前の形式（LabelEncoderの辞書）を変換"""
+    logger = setup_logger(__name__)
+    logger.warning("以前の形式のエンコーダーを変換しました（未知のカテゴリは既知の0と区別されません。再訓練を推奨します）")
+    return {column: CategoryEncoder.from_label_encoder(encoder) for column, encoder in label_encoders.items()}
@@ -0,0 +1,282 @@
+"""
+レースごとの特徴量ストア
+(race_id, horse_name) ごとの特徴量（開催日時点の成績と元の列）を月単位のParquetに保存する。
+特徴量セットの定義のハッシュごとにディレクトリを分け、定義を変えたら別のストアを作り直す。
+update()はデータベースの変わった月とそれ以降の月だけを計算し直し、
+それより前の月は保存した状態（エンティティごとの累計）から続けて数える
+"""
+import hashlib
+import json
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from pathlib import Path
+
+from config.settings import FEATURE_STORE_DIR
+from src.data_collection.database import OiKeibaDatabase
+from src.feature_engineering.point_in_time import (
+    AsOfFeatureEngine, AS_OF_COLUMNS, ENTITIES, STATE_COLUMNS
+)
+from src.utils.logger import setup_logger
+
+# 特徴量の計算方法を変えたら上げる（列の定義と合わせてバージョンのハッシュになる）
+FEATURE_LOGIC_VERSION = 1
+
+KEY_COLUMNS = ('race_id', 'horse_name')
+# データベースの列をそのまま持つもの
+SOURCE_COLUMNS = (
+    'race_date', 'jockey_name', 'trainer_name', 'course_length', 'horse_weight',
+    'odds', 'popularity', 'weather', 'track_condition', 'finish_position'
+)
+# 開催日時点の成績は名前で数える（予測する出走表には名前しかない）
+ENTITY_KEY_COLUMNS = {entity: f'{entity}_name' for entity in ENTITIES}
+RAW_COLUMNS = KEY_COLUMNS + SOURCE_COLUMNS
+FEATURE_COLUMNS = RAW_COLUMNS + AS_OF_COLUMNS
+
+# パーティション間で型がぶれないようにスキーマを固定する（ここに無い列は文字列）
+FEATURE_TYPES = {
+    'course_length': pa.int64(),
+    'horse_weight': pa.int64(),
+    'popularity': pa.int64(),
+    'finish_position': pa.int64(),
+    'odds': pa.float64(),
+    **{column: pa.int64() if column.endswith('_starts') else pa.float64() for column in AS_OF_COLUMNS},
+}
+FEATURE_SCHEMA = pa.schema([
+    (column, FEATURE_TYPES.get(column, pa.string())) for column in FEATURE_COLUMNS
+])
+
+PARTITION_COLUMN = 'month'
+MANIFEST_FILE = '_manifest.json'
+# '_'で始まるファイル・ディレクトリはデータセットとして読み込まれない
+STATE_DIR = '_state'
+
+
+def feature_set_version():
+    """特徴量セットの定義のハッシュ（列・キー・計算方法のどれかが変われば変わる）"""
+    definition = json.dumps({
+        'logic': FEATURE_LOGIC_VERSION,
+        'columns': FEATURE_COLUMNS,
+        'keys': ENTITY_KEY_COLUMNS,
+    }, sort_keys=True)
+    return hashlib.sha1(definition.encode('utf-8')).hexdigest()[:12]
+
+
+class FeatureStore:
+    def __init__(self, db=None, store_dir=None):
+        self.db = db or OiKeibaDatabase()
+        self.version = feature_set_version()
+        self.store_dir = Path(store_dir or FEATURE_STORE_DIR) / f"v-{self.version}"
+        self.logger = setup_logger(__name__)
+        # 読み込んだ月のパーティション（月 → (シグネチャ, DataFrame)）
+        self._partitions = {}
+        # 保存済みのレースの索引（マニフェストの更新時刻, レースID → 月, 月 → シグネチャ）
+        self._races = None
+
+    def update(self, full=False):
+        """データベースの変更を反映（full=Trueでは全ての月を計算し直す）"""
+        manifest = self._read_manifest()
+        known = manifest.get('months', {})
+        previous = {} if full else known
+        signatures = self._month_signatures()
+
+        changed = sorted(month for month, signature in signatures.items() if previous.get(month) != signature)
+        removed = sorted(month for month in known if month not in signatures)
+        if not changed and not removed:
+            self.logger.info(f"特徴量ストアは最新です: {self.store_dir.name}")
+            return {'written': [], 'removed': [], 'rows': 0, 'incremental': True}
+
+        # 前回の最後の月以降だけが変わったなら、保存した状態から続けて数える
+        last_month = manifest.get('last_month')
+        start_month = changed[0]
+        initial = None
+        if not full and not removed and last_month is not None:
+            if start_month > last_month:
+                initial = self._read_state('end')
+            elif start_month == last_month:
+                initial = self._read_state('base')
+        incremental = initial is not None
+
+        df = self.db.get_race_data(
+            columns=list(RAW_COLUMNS),
+            start_date=f"{start_month}-01" if incremental else None,
+            ascending=True
+        )
+        df = df[df['race_date'].notna()]
+        engine = AsOfFeatureEngine(key_columns=ENTITY_KEY_COLUMNS)
+
+        written = []
+        state = initial
+        base = initial
+        for month, rows in df.groupby(df['race_date'].str[:7], sort=True):
+            base = state
+            features = engine.fit_transform(rows, initial=state)
+            state = dict(engine.state)
+            self._write_parquet(
+                pd.concat([rows, features], axis=1),
+                self.store_dir / f"{PARTITION_COLUMN}={month}" / 'part-0.parquet'
+            )
+            written.append(month)
+
+        for month in removed:
+            shutil.rmtree(self.store_dir / f"{PARTITION_COLUMN}={month}", ignore_errors=True)
+
+        if written:
+            self._write_state('base', base)
+            self._write_state('end', state)
+        months = {month: signature for month, signature in known.items() if month in signatures}
+        months.update({month: signatures[month] for month in written})
+        self._write_text(self.store_dir / MANIFEST_FILE, json.dumps({
+            'version': self.version,
+            'columns': list(FEATURE_COLUMNS),
+            'months': months,
+            'last_month': max(months) if months else None,
+        }, ensure_ascii=False, indent=2, sort_keys=True))
+        self._partitions.clear()
+        self._races = None
+
+        self.logger.info(
+            f"特徴量ストアを更新しました: {len(written)}か月 / {len(df)}行 "
+            f"({'差分' if incremental else '全体'}, 削除 {len(removed)}か月)"
+        )
+        return {'written': written, 'removed': removed, 'rows': len(df), 'incremental': incremental}
+
+    def update_quietly(self):
+        """update()の失敗を警告にとどめる（データ収集の後に呼び、収集した結果は残す）"""
+        try:
+            return self.update()
+        except Exception as e:
+            self.logger.warning(f"特徴量ストアの更新に失敗しました（次回の更新で反映されます）: {e}")
+            return None
+
+    def load(self, columns=None, start_date=None, end_date=None):
+        """保存済みの特徴量を読み込み（最新にするには先にupdate()を呼ぶ）"""
+        if not (self.store_dir / MANIFEST_FILE).exists():
+            return pd.DataFrame(columns=list(columns or FEATURE_COLUMNS))
+
+        # メモリマップで読み込み、月パーティションで読み飛ばしてから日付で絞り込む
+        dataset = ds.dataset(
+            str(self.store_dir), format='parquet', partitioning='hive',
+            filesystem=pafs.LocalFileSystem(use_mmap=True),
+            schema=FEATURE_SCHEMA.append(pa.field(PARTITION_COLUMN, pa.string()))
+        )
+        condition = None
+        if start_date is not None:
+            start_date = str(start_date)
+            condition = self._and(condition, (ds.field(PARTITION_COLUMN) >= start_date[:7]) &
+                                  (ds.field('race_date') >= start_date))
+        if end_date is not None:
+            end_date = str(end_date)
+            condition = self._and(condition, (ds.field(PARTITION_COLUMN) <= end_date[:7]) &
+                                  (ds.field('race_date') <= end_date))
+        return dataset.to_table(columns=list(columns or FEATURE_COLUMNS), filter=condition).to_pandas()
+
+    def contains(self, race_ids):
+        """全てのレースがストアに保存されているか"""
+        race_months, _ = self._race_index()
+        return all(race_id in race_months for race_id in race_ids)
+
+    def lookup(self, race_ids):
+        """レースの出走馬の特徴量（保存されていないレースは含まない）"""
+        race_ids = list(dict.fromkeys(race_ids))
+        race_months, months = self._race_index()
+        # これから走るレースはまだストアにないので、ファイルもデータベースも読まない
+        wanted = sorted({race_months[race_id] for race_id in race_ids if race_id in race_months})
+        if not wanted:
+            return pd.DataFrame(columns=list(FEATURE_COLUMNS))
+
+        frames = []
+        for month in wanted:
+            partition = self._partition(month, months[month])
+            frames.append(partition[partition['race_id'].isin(race_ids)])
+        return pd.concat(frames, ignore_index=True)
+
+    def _race_index(self):
+        """保存済みのレースID → 月と、月ごとのシグネチャ（マニフェストが書き換わったら読み直す）"""
+        path = self.store_dir / MANIFEST_FILE
+        if not path.exists():
+            return {}, {}
+        stamp = path.stat().st_mtime_ns
+        if self._races is None or self._races[0] != stamp:
+            months = self._read_manifest().get('months', {})
+            race_months = {}
+            for month in months:
+                table = pq.read_table(
+                    str(self.store_dir / f"{PARTITION_COLUMN}={month}" / 'part-0.parquet'), columns=['race_id']
+                )
+                race_months.update(dict.fromkeys(table.column('race_id').unique().to_pylist(), month))
+            self._races = (stamp, race_months, months)
+        return self._races[1], self._races[2]
+
+    def _partition(self, month, signature):
+        """月のパーティションを読み込み（同じ内容なら前回読み込んだものを使う）"""
+        cached = self._partitions.get(month)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        df = pq.read_table(str(self.store_dir / f"{PARTITION_COLUMN}={month}" / 'part-0.parquet')).to_pandas()
+        self._partitions[month] = (signature, df)
+        return df
+
+    def _month_signatures(self):
+        """月ごとの件数・最終更新・着順の合計（保存し直された行はrowidとcreated_atが新しくなる）"""
+        rows = self.db.get_connection().execute('''
+            SELECT substr(race_date, 1, 7), COUNT(*), MAX(rowid), MAX(created_at), TOTAL(finish_position)
+            FROM race_entries
+            WHERE race_date IS NOT NULL
+            GROUP BY substr(race_date, 1, 7)
+        ''').fetchall()
+        return {
+            month: {'rows': count, 'rowid': rowid, 'updated': updated, 'positions': positions}
+            for month, count, rowid, updated, positions in rows
+        }
+
+    def _read_manifest(self):
+        path = self.store_dir / MANIFEST_FILE
+        return json.loads(path.read_text(encoding='utf-8')) if path.exists() else {}
+
+    def _read_state(self, name):
+        """保存した状態（'base': 最後の月の前まで, 'end': 最後の月まで）"""
+        state = {}
+        for entity in ENTITIES:
+            path = self.store_dir / STATE_DIR / f"{name}-{entity}.parquet"
+            if not path.exists():
+                return None
+            state[entity] = pq.read_table(str(path)).to_pandas().set_index('key')
+            state[entity].index.name = None
+        return state
+
+    def _write_state(self, name, state):
+        for entity in ENTITIES:
+            frame = pd.DataFrame(columns=list(STATE_COLUMNS), dtype='int64')
+            if state is not None and entity in state:
+                frame = state[entity]
+            table = pa.Table.from_pandas(
+                frame.rename_axis('key').reset_index().astype({'key': 'string'}), preserve_index=False
+            )
+            self._write_table(table, self.store_dir / STATE_DIR / f"{name}-{entity}.parquet")
+
+    def _write_parquet(self, df, path):
+        table = pa.Table.from_pandas(df.reindex(columns=FEATURE_SCHEMA.names), schema=FEATURE_SCHEMA,
+                                     preserve_index=False)
+        self._write_table(table, path)
+
+    def _write_table(self, table, path):
+        """一時ファイルに書いてから置き換える（読み込み中のプロセスに途中のファイルを見せない）"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix('.tmp')
+        pq.write_table(table, str(temp_path), compression='zstd')
+        os.replace(temp_path, path)
+
+    def _write_text(self, path, text):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix('.tmp')
+        temp_path.write_text(text, encoding='utf-8')
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _and(condition, other):
+        return other if condition is None else condition & other
@@ -0,0 +1,136 @@
+"""
+開催日時点の通算成績（ポイントインタイム特徴量）
+履歴を一度だけ (エンティティ, 開催日) で並べ、groupbyのcumsumで
+各レースの開催日より前の出走数・勝利数・3着内数・平均着順を全行まとめて計算する。
+同じ日の他のレースの結果は含めない（DBのas_of集計と同じ条件）。
+最後の状態（全履歴の合計）は予測時の特徴量にそのまま使う
+"""
+import numpy as np
+import pandas as pd
+
+from src.utils.logger import setup_logger
+
+# 集計するエンティティ（キーの候補は整数IDの列を優先）
+ENTITIES = ('horse', 'jockey', 'trainer')
+# エンティティごとの累計値
+STATE_COLUMNS = ('starts', 'wins', 'top3', 'position_sum')
+# 開催日時点の成績の列（'{entity}_{name}'）
+RATE_COLUMNS = ('starts', 'avg_position', 'win_rate', 'place_rate')
+AS_OF_COLUMNS = tuple(f'{entity}_{name}' for entity in ENTITIES for name in RATE_COLUMNS)
+
+
+def entity_key(df, entity):
+    """集計に使うキー列（整数IDが揃っていればIDを使う）"""
+    id_column = f'{entity}_id'
+    if id_column in df.columns and df[id_column].notna().all():
+        return id_column
+    return f'{entity}_name'
+
+
+def rate_values(starts, wins, top3, position_sum):
+    """累計値の配列から率の配列を計算（出走がなければ平均着順はNaN、率は0）"""
+    total = np.asarray(starts, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'starts': starts,
+            'avg_position': np.where(total > 0, position_sum / total, np.nan),
+            'win_rate': np.where(total > 0, wins / total, 0.0),
+            'place_rate': np.where(total > 0, top3 / total, 0.0),
+        }
+
+
+def rates(state, prefix):
+    """累計値のDataFrameから率の特徴量を計算"""
+    values = rate_values(*(state[column] for column in STATE_COLUMNS))
+    return pd.DataFrame({f'{prefix}{name}': values[name] for name in RATE_COLUMNS}, index=state.index)
+
+
+class AsOfFeatureEngine:
+    """馬・騎手・調教師の開催日時点の成績を一括で計算する"""
+
+    def __init__(self, entities=ENTITIES, key_columns=None):
+        self.entities = tuple(entities)
+        # エンティティごとのキー列（指定がなければentity_keyで選ぶ）
+        self.key_columns = dict(key_columns or {})
+        # エンティティごとの最後の状態（キー → 全履歴の累計）
+        self.state = {}
+        self.keys = {}
+        self.logger = setup_logger(__name__)
+
+    def fit_transform(self, df, initial=None):
+        """各行の開催日より前の成績をdfと同じインデックスで返し、最後の状態を保持する
+
+        列名は '{entity}_starts', '{entity}_avg_position', '{entity}_win_rate', '{entity}_place_rate'。
+        initialにdfより前の履歴の状態（エンティティ → 累計）を渡すと、その続きから数える。
+        """
+        indicators = self._indicators(df)
+        frames = []
+        for entity in self.entities:
+            key = self.key_columns.get(entity) or entity_key(df, entity)
+            start = None if initial is None else initial.get(entity)
+            before, state = self._accumulate(df[key], df['race_date'], indicators, start)
+            self.keys[entity] = key
+            self.state[entity] = state
+            frames.append(rates(before, f'{entity}_'))
+        return pd.concat(frames, axis=1)
+
+    def transform_latest(self, df):
+        """保持している最後の状態から、これから走るレースの特徴量を作る（未出走はデフォルト値）"""
+        frames = []
+        for entity in self.entities:
+            key = self.keys.get(entity) or self.key_columns.get(entity) or entity_key(df, entity)
+            state = self.state.get(entity)
+            if state is None or key not in df.columns:
+                state = pd.DataFrame(0, index=df.index, columns=list(STATE_COLUMNS))
+            else:
+                state = state.reindex(df[key].to_numpy()).fillna(0).set_axis(df.index)
+            frames.append(rates(state, f'{entity}_'))
+        return pd.concat(frames, axis=1)
+
+    def latest(self, entity, keys):
+        """エンティティの最後の状態（keysの順、未出走は0）"""
+        state = self.state.get(entity)
+        if state is None:
+            return pd.DataFrame(0, index=pd.Index(keys), columns=list(STATE_COLUMNS))
+        return state.reindex(keys).fillna(0)
+
+    @staticmethod
+    def _indicators(df):
+        """行ごとの出走・勝利・3着内・着順（着順がない行は集計しない）"""
+        position = pd.to_numeric(df['finish_position'], errors='coerce').to_numpy(dtype='float64')
+        valid = ~np.isnan(position)
+        position = np.where(valid, position, 0)
+        return pd.DataFrame({
+            'starts': valid.astype('int64'),
+            'wins': (valid & (position == 1)).astype('int64'),
+            'top3': (valid & (position <= 3)).astype('int64'),
+            'position_sum': position.astype('int64'),
+        }, index=df.index)
+
+    @staticmethod
+    def _accumulate(keys, dates, indicators, start=None):
+        """(キー, 開催日) ごとに合計し、キー内の累計からその日の分を引いて「前日まで」の値にする
+
+        戻り値は (行ごとの前日までの累計, キーごとの全履歴の累計)。startはそれより前の履歴の累計。
+        """
+        frame = indicators.assign(_key=keys.to_numpy(), _date=dates.to_numpy())
+        grouped = frame.groupby(['_key', '_date'], sort=True, observed=True)
+        # sort=Trueなのでグループ番号は日次集計の行の並びと一致する（キーや日付が欠けた行はNaN）
+        group_ids = grouped.ngroup().to_numpy()
+        daily = grouped[list(STATE_COLUMNS)].sum()
+
+        cumulative = daily.groupby(level=0, sort=False).cumsum()
+        # 末尾に0の行を足し、キーが欠けた行は過去の成績なしとして扱う
+        prior = np.vstack([(cumulative - daily).to_numpy(), np.zeros((1, len(STATE_COLUMNS)), dtype='int64')])
+        group_ids = np.where(np.isnan(group_ids), len(daily), group_ids).astype('int64')
+        before = pd.DataFrame(prior[group_ids], index=indicators.index, columns=list(STATE_COLUMNS))
+
+        # 各キーの最後の日の累計が全履歴の合計
+        state = cumulative.groupby(level=0, sort=False).tail(1).droplevel(1)
+        state.index.name = None
+
+        if start is not None and len(start):
+            # 前の履歴の累計を足す（キーが欠けた行はreindexでNaNになり0のまま）
+            before += start.reindex(keys.to_numpy()).fillna(0).to_numpy(dtype='int64')
+            state = start.add(state, fill_value=0).astype('int64')
+        return before, state
@@ -0,0 +1,151 @@
+"""
+特徴量グループの宣言的な登録と実行計画
+各グループは入力列と出力列を宣言し、プランナーは要求された列（モデルの特徴量名）に
+必要なグループだけを依存順に並べる。実行時はグループの出力を1回の実行の中で使い回し、
+グループごとの処理時間と出力のメモリ使用量を記録する。
+
+列の解決のしかた:
+- 要求された列はそれを出力するグループがあればそのグループ、なければ入力のDataFrameの列
+- グループの入力列は入力のDataFrameにあればその列、なければそれを出力するグループ
+（カテゴリ列のエンコードのように入力と同じ名前を出力するグループがあっても、
+他のグループは元の列を読む。特徴量ストアから読み込んだ列があれば計算を省ける）
+
+入力列はグループが読む列を全て宣言する。inputsは常に必要な列、training_inputsは訓練時だけ
+必要な列（着順など予測する出走表にない列）、optional_inputsはあれば読む列。
+"""
+import time
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class FeatureGroup:
+    name: str
+    inputs: tuple
+    outputs: tuple
+    compute: object
+    categorical: bool = False
+    training_inputs: tuple = ()
+    optional_inputs: tuple = ()
+
+    @property
+    def reads(self):
+        """宣言した全ての入力列"""
+        return self.inputs + self.training_inputs + self.optional_inputs
+
+    def required(self, is_training):
+        """必ず必要な入力列"""
+        return self.inputs + self.training_inputs if is_training else self.inputs
+
+
+@dataclass
+class FeaturePlan:
+    """要求された列を作るためのグループの実行順"""
+    columns: list
+    groups: list
+    # 要求された列 → 出力するグループ名（入力の列をそのまま使うものはNone）
+    sources: dict
+    # 実行ごとの記録（グループ名, 秒, 行数, MB）
+    report: list = field(default_factory=list)
+
+    @property
+    def categorical_columns(self):
+        categorical = {group.name for group in self.groups if group.categorical}
+        return [column for column in self.columns if self.sources[column] in categorical]
+
+    def run(self, frame, *args):
+        """グループを順に実行し、要求された列のDataFrameを返す（argsは各グループのcomputeに渡す）"""
+        self.report = []
+        outputs = {}
+        for group in self.groups:
+            # 入力のDataFrameにない入力列だけを前のグループの出力から足す
+            produced = {
+                column: outputs[column] for column in group.reads
+                if column not in frame.columns and column in outputs
+            }
+            if not produced:
+                group_frame = frame
+            elif not any(column in frame.columns for column in group.reads):
+                group_frame = pd.DataFrame(produced, index=frame.index)
+            else:
+                group_frame = frame.assign(**produced)
+
+            start = time.perf_counter()
+            result = group.compute(group_frame, *args)
+            elapsed = time.perf_counter() - start
+
+            missing = [column for column in group.outputs if column not in result.columns]
+            if missing:
+                raise ValueError(f"特徴量グループ {group.name} が列を出力しませんでした: {missing}")
+            for column in group.outputs:
+                outputs[column] = result[column].values
+            self.report.append({
+                'group': group.name,
+                'seconds': elapsed,
+                'rows': len(result),
+                # 出力の配列のバイト数（特徴量は数値とコードなのでdeepな計測はしない）
+                'memory_mb': sum(outputs[column].nbytes for column in group.outputs) / 1024 ** 2,
+            })
+
+        return pd.DataFrame({
+            column: outputs[column] if self.sources[column] is not None else frame[column].values
+            for column in self.columns
+        }, index=frame.index)
+
+
+class FeatureRegistry:
+    def __init__(self):
+        self.groups = {}
+        self.producers = {}
+
+    def group(self, name, inputs, outputs, categorical=False, training_inputs=(), optional_inputs=()):
+        """特徴量グループを登録するデコレーター（compute(frame, *args) は出力列を持つDataFrameを返す）"""
+        def register(compute):
+            for column in outputs:
+                if column in self.producers:
+                    raise ValueError(f"列 {column} は既に {self.producers[column]} が出力します")
+            self.groups[name] = FeatureGroup(
+                name, tuple(inputs), tuple(outputs), compute, categorical,
+                tuple(training_inputs), tuple(optional_inputs)
+            )
+            self.producers.update(dict.fromkeys(outputs, name))
+            return compute
+        return register
+
+    def plan(self, columns, available, is_training=False):
+        """要求された列に必要なグループだけを依存順に並べる（availableは入力のDataFrameの列）"""
+        available = set(available)
+        order = []
+        visiting = set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"特徴量グループの依存が循環しています: {name}")
+            visiting.add(name)
+            group = self.groups[name]
+            required = group.required(is_training)
+            for column in group.reads:
+                if column in available:
+                    continue
+                producer = self.producers.get(column)
+                if producer is None:
+                    if column in required:
+                        raise ValueError(f"特徴量グループ {name} の入力列がありません: {column}")
+                    continue
+                visit(producer)
+            visiting.discard(name)
+            order.append(name)
+
+        sources = {}
+        for column in columns:
+            producer = self.producers.get(column)
+            if producer is None and column not in available:
+                raise ValueError(f"特徴量を作れません: {column}")
+            sources[column] = producer
+            if producer is not None:
+                visit(producer)
+
+        return FeaturePlan(list(columns), [self.groups[name] for name in order], sources)
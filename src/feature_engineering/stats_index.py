@@ -0,0 +1,70 @@
+"""
+予測時に使う馬・騎手・調教師の通算成績のメモリ上の索引
+集計テーブル（horse_stats・jockey_stats・trainer_stats）を一度だけ読み込み、
+名前 → 行番号の辞書と累計値の配列で持つ。出走馬ごとの検索は辞書を引くだけで、
+データベースが書き換わったとき（data_versionの変化）だけ読み込み直す
+"""
+import threading
+import numpy as np
+
+from src.data_collection.database import ENTITY_STATS_TABLES
+from src.feature_engineering.point_in_time import STATE_COLUMNS
+from src.utils.logger import setup_logger
+
+
+class EntityStatsTable:
+    """1エンティティ分の索引（末尾に未出走用の0の行を持つ）"""
+
+    def __init__(self, names, values):
+        self.positions = {name: row for row, name in enumerate(names)}
+        self.values = np.vstack([values, np.zeros((1, len(STATE_COLUMNS)), dtype='int64')])
+
+    def __len__(self):
+        return len(self.positions)
+
+    def lookup(self, names):
+        """namesの順の累計（STATE_COLUMNSの順の2次元配列、未出走は0）"""
+        # 見つからない名前は-1で末尾の0の行を指す
+        rows = np.fromiter((self.positions.get(name, -1) for name in names), dtype='int64', count=len(names))
+        return self.values[rows]
+
+
+class EntityStatsIndex:
+    def __init__(self, db):
+        self.db = db
+        self.logger = setup_logger(__name__)
+        self.tables = {}
+        self.version = None
+        self._lock = threading.Lock()
+
+    def lookup(self, entity, names):
+        """エンティティの名前ごとの累計（データベースが変わっていれば先に読み込み直す）"""
+        self.refresh()
+        return self.tables[entity].lookup(list(names))
+
+    def refresh(self, force=False):
+        """データのバージョンが変わったときだけ集計テーブルを読み込み直す"""
+        version = self.db.connections.data_version()
+        if not force and version == self.version:
+            return False
+
+        with self._lock:
+            if not force and version == self.version:
+                return False
+            conn = self.db.get_connection()
+            tables = {}
+            for entity, (table, name_column) in ENTITY_STATS_TABLES.items():
+                rows = conn.execute(
+                    f"SELECT {name_column}, {', '.join(STATE_COLUMNS)} FROM {table}"
+                ).fetchall()
+                values = np.array([row[1:] for row in rows], dtype='int64').reshape(len(rows), len(STATE_COLUMNS))
+                tables[entity] = EntityStatsTable([row[0] for row in rows], values)
+            # 読み込み中の検索は古い索引を使い、揃ってから差し替える
+            self.tables = tables
+            self.version = version
+
+        self.logger.debug(
+            "通算成績の索引を読み込みました: "
+            + ' / '.join(f"{entity} {len(table)}件" for entity, table in self.tables.items())
+        )
+        return True
@@ -5,297 +5,189 @@ import pandas as pd
 import numpy as np
 import lightgbm as lgb
 from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, classification_report
 import joblib
 from pathlib import Path
 
-from config.settings import MODEL_DIR, LIGHTGBM_PARAMS
-from src.data_collection.database import OiKeibaDatabase
+from config.settings import MODEL_DIR, LIGHTGBM_PARAMS, CATEGORICAL_MIN_COUNTS, LIGHTGBM_NATIVE_CATEGORICAL
+from src.data_collection.database import OiKeibaDatabase, compact_race_data
+from src.feature_engineering.encoders import (
+    CategoryEncoder, UNKNOWN_CODE, save_encoders, load_encoders, convert_label_encoders
+)
+from src.feature_engineering.feature_store import FeatureStore
+from src.feature_engineering.point_in_time import (
+    AsOfFeatureEngine, AS_OF_COLUMNS, ENTITIES, RATE_COLUMNS, STATE_COLUMNS, rate_values
+)
+from src.feature_engineering.registry import FeatureRegistry
+from src.feature_engineering.stats_index import EntityStatsIndex
 from src.utils.logger import setup_logger
 
+# 訓練時にデータベースから取得する列
+TRAINING_COLUMNS = [
+    'race_id', 'race_date', 'horse_name', 'jockey_name', 'trainer_name',
+    'horse_id', 'jockey_id', 'trainer_id',
+    'course_length', 'horse_weight', 'odds', 'popularity',
+    'weather', 'track_condition', 'finish_position'
+]
+
+# 基本特徴量（数値の列をそのまま使う）
+BASE_FEATURE_COLUMNS = ('course_length', 'horse_weight', 'odds', 'popularity')
+# 馬の開催日時点の成績（モデルの特徴量名: AsOfFeatureEngineの列名）
+HORSE_FORM_COLUMNS = {
+    'avg_position': 'horse_avg_position',
+    'win_rate': 'horse_win_rate',
+    'place_rate': 'horse_place_rate',
+}
+# 騎手・調教師の開催日時点の成績（AsOfFeatureEngineの列名のまま使う）
+CONNECTION_FORM_COLUMNS = ('jockey_win_rate', 'trainer_win_rate')
+# レース単位の属性（同じレースの出走行は同じ値を持つ）
+RACE_LEVEL_CATEGORICAL_COLUMNS = ('weather', 'track_condition')
+ENTITY_CATEGORICAL_COLUMNS = ('jockey_name', 'trainer_name')
+
+# カテゴリカル変数（エンコーダーで整数のコードに変換する列）
+CATEGORICAL_COLUMNS = RACE_LEVEL_CATEGORICAL_COLUMNS + ENTITY_CATEGORICAL_COLUMNS
+# 訓練時に作る特徴量（予測時は保存したモデルの特徴量名に必要なグループだけを計算する）
+DEFAULT_FEATURE_COLUMNS = (
+    BASE_FEATURE_COLUMNS + tuple(HORSE_FORM_COLUMNS) + CONNECTION_FORM_COLUMNS + CATEGORICAL_COLUMNS
+)
+
+# 特徴量グループ（訓練時と予測時で同じ定義から計画を作る）
+FEATURE_GROUPS = FeatureRegistry()
+
+
+@FEATURE_GROUPS.group('base', inputs=BASE_FEATURE_COLUMNS, outputs=BASE_FEATURE_COLUMNS)
+def base_features(frame, model, is_training):
+    """レース・出走馬の数値の列"""
+    return frame[list(BASE_FEATURE_COLUMNS)]
+
+
+@FEATURE_GROUPS.group(
+    'as_of', inputs=('horse_name', 'jockey_name', 'trainer_name'), outputs=AS_OF_COLUMNS,
+    # 訓練時は開催日と着順から数え、整数IDが揃っていればIDで数える（entity_key）
+    training_inputs=('race_date', 'finish_position'), optional_inputs=('horse_id', 'jockey_id', 'trainer_id')
+)
+def as_of_features(frame, model, is_training):
+    """馬・騎手・調教師の開催日時点の成績"""
+    if all(column in frame.columns for column in AS_OF_COLUMNS):
+        # 特徴量ストアから読み込んだ成績をそのまま使う
+        return frame[list(AS_OF_COLUMNS)]
+    if is_training:
+        # 各レースの開催日より前の成績だけを使う（自分の結果や未来のレースを含めない）
+        return model.feature_engine.fit_transform(frame)
+    return model.create_as_of_features_prediction(frame)
+
+
+@FEATURE_GROUPS.group('horse_form', inputs=tuple(HORSE_FORM_COLUMNS.values()), outputs=tuple(HORSE_FORM_COLUMNS))
+def horse_form_features(frame, model, is_training):
+    """馬の平均着順・勝率・3着内率"""
+    return frame[list(HORSE_FORM_COLUMNS.values())].set_axis(list(HORSE_FORM_COLUMNS), axis=1)
+
+
+@FEATURE_GROUPS.group('race_conditions', inputs=RACE_LEVEL_CATEGORICAL_COLUMNS,
+                      outputs=RACE_LEVEL_CATEGORICAL_COLUMNS, categorical=True, optional_inputs=('race_id',))
+def race_condition_features(frame, model, is_training):
+    """天候・馬場状態のコード（レースごとに1回だけエンコードして各出走行に展開する）"""
+    if 'race_id' not in frame.columns:
+        return pd.DataFrame({
+            col: model._encode_categorical(frame[col], col, is_training) for col in RACE_LEVEL_CATEGORICAL_COLUMNS
+        }, index=frame.index)
+    
+    races = frame.drop_duplicates('race_id')
+    positions = pd.Index(races['race_id']).get_indexer(frame['race_id'])
+    return pd.DataFrame({
+        col: model._encode_categorical(races[col], col, is_training)[positions]
+        for col in RACE_LEVEL_CATEGORICAL_COLUMNS
+    }, index=frame.index)
+
+
+@FEATURE_GROUPS.group('entity_codes', inputs=ENTITY_CATEGORICAL_COLUMNS,
+                      outputs=ENTITY_CATEGORICAL_COLUMNS, categorical=True)
+def entity_code_features(frame, model, is_training):
+    """騎手・調教師の名前のコード"""
+    return pd.DataFrame({
+        col: model._encode_categorical(frame[col], col, is_training) for col in ENTITY_CATEGORICAL_COLUMNS
+    }, index=frame.index)
+
+
 class LightGBMModel:
-    def __init__(self, model_name='oi_keiba_lightgbm'):
+    def __init__(self, model_name='oi_keiba_lightgbm', native_categorical=None):
         self.model_name = model_name
         self.model = None
-        self.label_encoders = {}
+        self.encoders = {}
         self.feature_names = []
+        self.categorical_features = []
+        # 直前のprepare_featuresの特徴量グループごとの処理時間・メモリ
+        self.feature_report = []
+        # カテゴリ列をLightGBMのカテゴリカル特徴量として渡すか（Falseでは整数のコードを数値として扱う）
+        self.native_categorical = LIGHTGBM_NATIVE_CATEGORICAL if native_categorical is None else native_categorical
+        self.feature_engine = AsOfFeatureEngine()
         self.db = OiKeibaDatabase()
+        self._feature_store = None
+        self.stats_index = EntityStatsIndex(self.db)
         self.logger = setup_logger(__name__)
         
         # モデルディレクトリを作成
         MODEL_DIR.mkdir(exist_ok=True)
     
+    @property
+    def feature_store(self):
+        """self.dbの特徴量ストア（dbを差し替えたら作り直す）"""
+        if self._feature_store is None or self._feature_store.db is not self.db:
+            self._feature_store = FeatureStore(db=self.db)
+        return self._feature_store
+    
     def prepare_features(self, df, is_training=True):
-        """特徴量を作成"""
-        features_df = df.copy()
-        
-        # 基本特徴量
-        feature_columns = [
-            'course_length', 'horse_weight', 'odds', 'popularity'
-        ]
-        
-        # 馬の過去成績特徴量を先に作成（エンコード前）
-        if is_training:
-            horse_stats = self.create_horse_features_training(features_df)
-        else:
-            horse_stats = self.create_horse_features_prediction(features_df)
-            
-        if horse_stats is not None:
-            features_df = features_df.merge(horse_stats, on='horse_name', how='left')
-            feature_columns.extend(['avg_position', 'win_rate', 'place_rate'])
-        
-        # 騎手・調教師特徴量を先に作成（エンコード前）
-        if is_training:
-            jockey_stats = self.create_jockey_trainer_features_training(features_df)
-        else:
-            jockey_stats = self.create_jockey_trainer_features_prediction(features_df)
-            
-        if jockey_stats is not None:
-            features_df = features_df.merge(jockey_stats, on=['jockey_name', 'trainer_name'], how='left')
-            feature_columns.extend(['jockey_win_rate', 'trainer_win_rate'])
-        
-        # カテゴリカル変数のエンコード（特徴量作成後）
-        categorical_columns = ['weather', 'track_condition', 'jockey_name', 'trainer_name']
-        
-        for col in categorical_columns:
-            if col in features_df.columns:
-                if is_training:
-                    # 訓練時：新しいエンコーダーを作成
-                    if col not in self.label_encoders:
-                        self.label_encoders[col] = LabelEncoder()
-                    features_df[col] = self.label_encoders[col].fit_transform(features_df[col].fillna('unknown'))
-                else:
-                    # 予測時：既存のエンコーダーを使用
-                    if col in self.label_encoders:
-                        try:
-                            # fillnaで欠損値を埋めてからtransform
-                            features_df[col] = features_df[col].fillna('unknown')
-                            features_df[col] = self.label_encoders[col].transform(features_df[col])
-                        except ValueError as e:
-                            # 未知のラベルがある場合
-                            self.logger.warning(f"未知のラベルを検出: {col}")
-                            # 各値を個別に処理
-                            encoded_values = []
-                            for value in features_df[col]:
-                                if value in self.label_encoders[col].classes_:
-                                    encoded_values.append(self.label_encoders[col].transform([value])[0])
-                                else:
-                                    encoded_values.append(0)  # 未知の値は0
-                            features_df[col] = encoded_values
-                    else:
-                        # エンコーダーがない場合は0で初期化
-                        features_df[col] = 0
-                
-                feature_columns.append(col)
+        """特徴量を作成（予測時はモデルの特徴量名に必要なグループだけを計算する）"""
+        columns = DEFAULT_FEATURE_COLUMNS if is_training or not self.feature_names else self.feature_names
+        plan = FEATURE_GROUPS.plan(columns, df.columns, is_training)
         
         # 欠損値を埋める
-        features_df[feature_columns] = features_df[feature_columns].fillna(0)
-        
-        self.feature_names = feature_columns
-        return features_df[feature_columns]
-    
-    def create_horse_features_training(self, df):
-        """訓練時の馬の過去成績特徴量を作成"""
-        try:
-            # 馬ごとの統計を計算
-            horse_stats = df.groupby('horse_name').agg({
-                'finish_position': ['mean', 'count'],
-            }).round(2)
-            
-            horse_stats.columns = ['avg_position', 'total_races']
-            horse_stats = horse_stats.reset_index()
-            
-            # 勝率、連対率を計算
-            wins = df[df['finish_position'] == 1].groupby('horse_name').size()
-            places = df[df['finish_position'] <= 3].groupby('horse_name').size()
-            
-            horse_stats = horse_stats.merge(wins.to_frame('wins'), left_on='horse_name', right_index=True, how='left')
-            horse_stats = horse_stats.merge(places.to_frame('places'), left_on='horse_name', right_index=True, how='left')
-            
-            horse_stats['wins'] = horse_stats['wins'].fillna(0)
-            horse_stats['places'] = horse_stats['places'].fillna(0)
-            
-            horse_stats['win_rate'] = (horse_stats['wins'] / horse_stats['total_races']).fillna(0)
-            horse_stats['place_rate'] = (horse_stats['places'] / horse_stats['total_races']).fillna(0)
-            
-            return horse_stats[['horse_name', 'avg_position', 'win_rate', 'place_rate']]
+        X = plan.run(df, self, is_training).fillna(0)
+        self.feature_report = plan.report
         
-        except Exception as e:
-            self.logger.error(f"馬特徴量作成エラー: {e}")
-            return None
+        if is_training:
+            self.feature_names = list(plan.columns)
+            self.categorical_features = plan.categorical_columns
+        return X
     
-    def create_horse_features_prediction(self, df):
-        """予測時の馬の過去成績特徴量を作成"""
-        try:
-            # データベースから過去のレース結果を取得
-            past_races = self.db.get_race_data()
-            
-            # デフォルト値のDataFrameを作成
-            unique_horses = df['horse_name'].unique()
-            default_stats = pd.DataFrame({
-                'horse_name': unique_horses,
-                'avg_position': 0.0,
-                'win_rate': 0.0,
-                'place_rate': 0.0
-            })
-            
-            if past_races.empty:
-                return default_stats
-            
-            # 馬ごとの統計を計算
-            horse_stats = past_races.groupby('horse_name').agg({
-                'finish_position': ['mean', 'count'],
-            }).round(2)
-            
-            horse_stats.columns = ['avg_position', 'total_races']
-            horse_stats = horse_stats.reset_index()
-            
-            # 勝率、連対率を計算
-            wins = past_races[past_races['finish_position'] == 1].groupby('horse_name').size()
-            places = past_races[past_races['finish_position'] <= 3].groupby('horse_name').size()
-            
-            horse_stats = horse_stats.merge(wins.to_frame('wins'), left_on='horse_name', right_index=True, how='left')
-            horse_stats = horse_stats.merge(places.to_frame('places'), left_on='horse_name', right_index=True, how='left')
-            
-            horse_stats['wins'] = horse_stats['wins'].fillna(0)
-            horse_stats['places'] = horse_stats['places'].fillna(0)
-            
-            horse_stats['win_rate'] = (horse_stats['wins'] / horse_stats['total_races']).fillna(0)
-            horse_stats['place_rate'] = (horse_stats['places'] / horse_stats['total_races']).fillna(0)
-            
-            # 現在のレースの馬の情報とマージ（過去データがない馬も含む）
-            result = default_stats.merge(
-                horse_stats[['horse_name', 'avg_position', 'win_rate', 'place_rate']], 
-                on='horse_name', 
-                how='left',
-                suffixes=('', '_past')
-            )
-            
-            # 過去データがある場合は使用、ない場合はデフォルト値
-            for col in ['avg_position', 'win_rate', 'place_rate']:
-                past_col = f'{col}_past'
-                if past_col in result.columns:
-                    result[col] = result[past_col].fillna(result[col])
-                    result = result.drop(columns=[past_col])
-            
-            return result
-        
-        except Exception as e:
-            self.logger.error(f"予測時の馬特徴量作成エラー: {e}")
-            # エラー時はデフォルト値を返す
-            return pd.DataFrame({
-                'horse_name': df['horse_name'].unique(),
-                'avg_position': 0.0,
-                'win_rate': 0.0,
-                'place_rate': 0.0
-            })
+    def _encode_categorical(self, values, col, is_training):
+        """カテゴリカル変数を整数に変換（訓練時はエンコーダーを作成、未知・欠損はUNKNOWN_CODE）"""
+        if is_training:
+            # 訓練時：出現回数の少ない名前は未知として扱うエンコーダーを作成
+            self.encoders[col] = CategoryEncoder(min_count=CATEGORICAL_MIN_COUNTS.get(col, 1))
+            return self.encoders[col].fit_transform(values)
+        
+        # 予測時：既存のエンコーダーを使用
+        if col not in self.encoders:
+            # エンコーダーがない場合は全て未知
+            return np.full(len(values), UNKNOWN_CODE, dtype='int32')
+        return self.encoders[col].transform(values)
     
-    def create_jockey_trainer_features_training(self, df):
-        """訓練時の騎手・調教師の特徴量を作成"""
-        try:
-            # 騎手統計
-            jockey_stats = df.groupby('jockey_name').agg({
-                'finish_position': 'count'
-            })
-            jockey_wins = df[df['finish_position'] == 1].groupby('jockey_name').size()
-            jockey_stats = jockey_stats.merge(jockey_wins.to_frame('wins'), left_index=True, right_index=True, how='left')
-            jockey_stats['wins'] = jockey_stats['wins'].fillna(0)
-            jockey_stats['jockey_win_rate'] = (jockey_stats['wins'] / jockey_stats['finish_position']).fillna(0)
-            
-            # 調教師統計
-            trainer_stats = df.groupby('trainer_name').agg({
-                'finish_position': 'count'
-            })
-            trainer_wins = df[df['finish_position'] == 1].groupby('trainer_name').size()
-            trainer_stats = trainer_stats.merge(trainer_wins.to_frame('wins'), left_index=True, right_index=True, how='left')
-            trainer_stats['wins'] = trainer_stats['wins'].fillna(0)
-            trainer_stats['trainer_win_rate'] = (trainer_stats['wins'] / trainer_stats['finish_position']).fillna(0)
-            
-            # 結合
-            result = df[['jockey_name', 'trainer_name']].drop_duplicates()
-            result = result.merge(jockey_stats[['jockey_win_rate']], left_on='jockey_name', right_index=True, how='left')
-            result = result.merge(trainer_stats[['trainer_win_rate']], left_on='trainer_name', right_index=True, how='left')
-            
-            return result
-        
-        except Exception as e:
-            self.logger.error(f"騎手・調教師特徴量作成エラー: {e}")
-            return None
+    def create_as_of_features_prediction(self, df):
+        """予測時の馬・騎手・調教師の成績特徴量を作成（通算成績の索引から引き、訓練時と同じ列で返す）"""
+        columns = {}
+        for entity in ENTITIES:
+            try:
+                state = self.stats_index.lookup(entity, df[f'{entity}_name'])
+            except Exception as e:
+                self.logger.error(f"予測時の{entity}特徴量作成エラー: {e}")
+                # エラー時は過去データがない場合と同じデフォルト値
+                state = np.zeros((len(df), len(STATE_COLUMNS)), dtype='int64')
+            values = rate_values(*state.T)
+            columns.update({f'{entity}_{name}': values[name] for name in RATE_COLUMNS})
+        return pd.DataFrame(columns, index=df.index)
     
-    def create_jockey_trainer_features_prediction(self, df):
-        """予測時の騎手・調教師の特徴量を作成"""
-        try:
-            # データベースから過去のレース結果を取得
-            past_races = self.db.get_race_data()
-            
-            # デフォルト値のDataFrameを作成
-            result = df[['jockey_name', 'trainer_name']].drop_duplicates()
-            result['jockey_win_rate'] = 0.0
-            result['trainer_win_rate'] = 0.0
-            
-            if past_races.empty:
-                return result
-            
-            # 騎手統計
-            jockey_stats = past_races.groupby('jockey_name').agg({
-                'finish_position': 'count'
-            })
-            jockey_wins = past_races[past_races['finish_position'] == 1].groupby('jockey_name').size()
-            jockey_stats = jockey_stats.merge(jockey_wins.to_frame('wins'), left_index=True, right_index=True, how='left')
-            jockey_stats['wins'] = jockey_stats['wins'].fillna(0)
-            jockey_stats['jockey_win_rate'] = (jockey_stats['wins'] / jockey_stats['finish_position']).fillna(0)
-            jockey_stats = jockey_stats.reset_index()
-            
-            # 調教師統計
-            trainer_stats = past_races.groupby('trainer_name').agg({
-                'finish_position': 'count'
-            })
-            trainer_wins = past_races[past_races['finish_position'] == 1].groupby('trainer_name').size()
-            trainer_stats = trainer_stats.merge(trainer_wins.to_frame('wins'), left_index=True, right_index=True, how='left')
-            trainer_stats['wins'] = trainer_stats['wins'].fillna(0)
-            trainer_stats['trainer_win_rate'] = (trainer_stats['wins'] / trainer_stats['finish_position']).fillna(0)
-            trainer_stats = trainer_stats.reset_index()
-            
-            # 結合（過去データがない騎手・調教師も含む）
-            result = result.merge(
-                jockey_stats[['jockey_name', 'jockey_win_rate']], 
-                on='jockey_name', 
-                how='left',
-                suffixes=('', '_past')
-            )
-            result = result.merge(
-                trainer_stats[['trainer_name', 'trainer_win_rate']], 
-                on='trainer_name', 
-                how='left',
-                suffixes=('', '_past')
-            )
-            
-            # 過去データがある場合は使用、ない場合はデフォルト値
-            if 'jockey_win_rate_past' in result.columns:
-                result['jockey_win_rate'] = result['jockey_win_rate_past'].fillna(result['jockey_win_rate'])
-                result = result.drop(columns=['jockey_win_rate_past'])
-                
-            if 'trainer_win_rate_past' in result.columns:
-                result['trainer_win_rate'] = result['trainer_win_rate_past'].fillna(result['trainer_win_rate'])
-                result = result.drop(columns=['trainer_win_rate_past'])
-            
-            return result
+    def train(self, test_size=0.2, random_state=42, compact=True, source='db'):
+        """モデルを訓練
         
-        except Exception as e:
-            self.logger.error(f"予測時の騎手・調教師特徴量作成エラー: {e}")
-            # エラー時はデフォルト値を返す
-            result = df[['jockey_name', 'trainer_name']].drop_duplicates()
-            result['jockey_win_rate'] = 0.0
-            result['trainer_win_rate'] = 0.0
-            return result
-    
-    def train(self, test_size=0.2, random_state=42):
-        """モデルを訓練"""
+        compact=Trueでは省メモリな型でデータを読み込む。
+        source='store'では特徴量ストアを差分で更新し、計算済みの特徴量を読み込む。
+        source='db'・'snapshot'ではSQLite・Parquetスナップショットの生データから特徴量を計算する。
+        """
         self.logger.info("モデル訓練を開始します")
         
-        # データを取得
-        df = self.db.get_race_data()
+        # 特徴量作成に必要な列だけを取得
+        df = self.load_training_data(compact=compact, source=source)
         if df.empty:
             self.logger.error("訓練データがありません")
             return
@@ -305,14 +197,22 @@ class LightGBMModel:
         # 特徴量を作成（訓練モード）
         X = self.prepare_features(df, is_training=True)
         y = df['finish_position'] - 1  # 0ベースに変換
+        for item in self.feature_report:
+            self.logger.info(
+                f"特徴量グループ {item['group']}: {item['seconds']:.2f}秒 / {item['memory_mb']:.1f}MB"
+            )
         
-        # 訓練・テストデータに分割
+        # 訓練・テストデータに分割（1件しかない着順があると層化できないので、そのときは層化しない）
+        stratify = y if y.value_counts().min() >= 2 else None
+        if stratify is None:
+            self.logger.warning("件数が1件の着順があるため、層化せずに分割します")
         X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=test_size, random_state=random_state, stratify=y
+            X, y, test_size=test_size, random_state=random_state, stratify=stratify
         )
         
-        # LightGBMデータセットを作成
-        train_data = lgb.Dataset(X_train, label=y_train)
+        # LightGBMデータセットを作成（ネイティブのカテゴリカル特徴量ではカテゴリ列を指定する）
+        categorical_feature = self.categorical_features if self.native_categorical else 'auto'
+        train_data = lgb.Dataset(X_train, label=y_train, categorical_feature=categorical_feature)
         valid_data = lgb.Dataset(X_test, label=y_test, reference=train_data)
         
         # モデル訓練
@@ -336,6 +236,21 @@ class LightGBMModel:
         
         return accuracy
     
+    def load_training_data(self, compact=True, source='db'):
+        """訓練データを取得（source: 'store'・'db'・'snapshot'）"""
+        if source == 'store':
+            self.feature_store.update()
+            df = self.feature_store.load()
+            return compact_race_data(df) if compact else df
+        
+        if source == 'snapshot':
+            from src.data_collection.snapshot import RaceHistorySnapshot
+            
+            df = RaceHistorySnapshot(db=self.db).load('race_results', columns=TRAINING_COLUMNS)
+            return compact_race_data(df) if compact else df
+        
+        return self.db.get_race_data(columns=TRAINING_COLUMNS, compact=compact)
+    
     def predict(self, race_data):
         """予想を実行"""
         if self.model is None:
@@ -345,14 +260,13 @@ class LightGBMModel:
             self.logger.error("モデルが読み込まれていません")
             return None
         
-        # 特徴量を作成（予測モード）
-        X = self.prepare_features(race_data, is_training=False)
-        
-        # 特徴量の数を確認
-        if len(X.columns) != len(self.feature_names):
-            self.logger.error(f"特徴量の数が一致しません: 期待={len(self.feature_names)}, 実際={len(X.columns)}")
+        # 特徴量を作成（予測モード、特徴量ストアにあるレースは保存済みの特徴量を使う）
+        try:
+            X = self.prepare_features(self.attach_stored_features(race_data), is_training=False)
+        except ValueError as e:
+            # モデルの特徴量に必要な列が出走表にない
+            self.logger.error(f"特徴量を作成できません: {e}")
             self.logger.error(f"期待される特徴量: {self.feature_names}")
-            self.logger.error(f"実際の特徴量: {list(X.columns)}")
             return None
         
         # 予想実行
@@ -360,9 +274,9 @@ class LightGBMModel:
         
         # 結果を整形
         results = []
-        for i, pred in enumerate(predictions):
+        for horse_name, pred in zip(race_data['horse_name'].tolist(), predictions):
             results.append({
-                'horse_name': race_data.iloc[i]['horse_name'],
+                'horse_name': horse_name,
                 'predicted_position': np.argmax(pred) + 1,
                 'confidence': np.max(pred),
                 'probabilities': pred.tolist()
@@ -370,17 +284,35 @@ class LightGBMModel:
         
         return results
     
+    def attach_stored_features(self, race_data):
+        """特徴量ストアにある出走馬の開催日時点の成績を付ける（全頭揃わなければそのまま返す）"""
+        if 'race_id' not in race_data.columns or race_data['race_id'].isna().any():
+            return race_data
+        
+        race_ids = race_data['race_id'].astype(str).unique()
+        if not self.feature_store.contains(race_ids):
+            return race_data
+        
+        sources = list(AS_OF_COLUMNS)
+        stored = self.feature_store.lookup(race_ids).set_index(['race_id', 'horse_name'])[sources]
+        keys = pd.MultiIndex.from_arrays([race_data['race_id'].astype(str), race_data['horse_name'].astype(str)])
+        if not keys.isin(stored.index).all():
+            return race_data
+        
+        race_data = race_data.drop(columns=[column for column in sources if column in race_data.columns])
+        return race_data.assign(**{column: stored[column].reindex(keys).values for column in sources})
+    
     def save_model(self):
         """モデルを保存"""
         model_path = MODEL_DIR / f"{self.model_name}.txt"
-        encoders_path = MODEL_DIR / f"{self.model_name}_encoders.pkl"
+        encoders_path = MODEL_DIR / f"{self.model_name}_encoders.json"
         features_path = MODEL_DIR / f"{self.model_name}_features.pkl"
         
         # LightGBMモデルを保存
         self.model.save_model(str(model_path))
         
-        # エンコーダーを保存
-        joblib.dump(self.label_encoders, encoders_path)
+        # エンコーダーを保存（カテゴリ名の一覧だけのJSON）
+        save_encoders(self.encoders, encoders_path, self.native_categorical)
         
         # 特徴量名を保存
         joblib.dump(self.feature_names, features_path)
@@ -390,15 +322,19 @@ class LightGBMModel:
     def load_model(self):
         """モデルを読み込み"""
         model_path = MODEL_DIR / f"{self.model_name}.txt"
-        encoders_path = MODEL_DIR / f"{self.model_name}_encoders.pkl"
+        encoders_path = MODEL_DIR / f"{self.model_name}_encoders.json"
+        legacy_encoders_path = MODEL_DIR / f"{self.model_name}_encoders.pkl"
         features_path = MODEL_DIR / f"{self.model_name}_features.pkl"
         
         try:
             # LightGBMモデルを読み込み
             self.model = lgb.Booster(model_file=str(model_path))
             
-            # エンコーダーを読み込み
-            self.label_encoders = joblib.load(encoders_path)
+            # エンコーダーを読み込み（以前のLabelEncoderの形式は同じコードになるように変換）
+            if encoders_path.exists():
+                self.encoders, self.native_categorical = load_encoders(encoders_path)
+            else:
+                self.encoders = convert_label_encoders(joblib.load(legacy_encoders_path))
             
             # 特徴量名を読み込み
             self.feature_names = joblib.load(features_path)
@@ -76,17 +76,18 @@ class OiKeibaPredictor:
         
         return recommendations
     
-    def analyze_prediction_accuracy(self, start_date: str, end_date: str) -> Dict:
-        """予想精度を分析"""
+    def analyze_prediction_accuracy(self, start_date: str, end_date: str, source: str = 'db') -> Dict:
+        """予想精度を分析（source='snapshot'ではParquetスナップショットから読み込む）"""
         try:
             # 期間内のレース結果を取得
-            query = f"""
-            SELECT * FROM race_results 
-            WHERE race_date BETWEEN '{start_date}' AND '{end_date}'
-            ORDER BY race_date, race_id
-            """
-            
-            df = pd.read_sql_query(query, self.db.db_path)
+            if source == 'snapshot':
+                from src.data_collection.snapshot import RaceHistorySnapshot
+                
+                df = RaceHistorySnapshot(db=self.db).load(
+                    'race_results', start_date=start_date, end_date=end_date
+                )
+            else:
+                df = self.db.get_race_data(start_date=start_date, end_date=end_date, ascending=True)
             
             if df.empty:
                 return {'error': '対象期間のデータがありません'}
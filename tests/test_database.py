@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+データベースのテスト
+"""
+import unittest
+import tempfile
+import threading
+from pathlib import Path
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.data_collection.database import OiKeibaDatabase, QueryCache, MIGRATIONS, ENTITY_STATS_MANY_COLUMNS
+
+
+def make_results(race_id, race_date, horses):
+    """テスト用のレース結果を作成"""
+    return [
+        {
+            'race_id': race_id,
+            'race_date': race_date,
+            'race_name': 'テストレース',
+            'course_length': 1200,
+            'course_type': 'ダート',
+            'weather': '晴',
+            'track_condition': '良',
+            'horse_name': horse,
+            'finish_position': position,
+            'jockey_name': f'騎手{position}',
+            'trainer_name': f'調教師{position}',
+            'horse_weight': 480,
+            'odds': 2.5 * position,
+            'popularity': position,
+            'time_result': '1:12.3',
+            'margin': ''
+        }
+        for position, horse in enumerate(horses, start=1)
+    ]
+
+
+class TestOiKeibaDatabase(unittest.TestCase):
+    def setUp(self):
+        """テストセットアップ"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = OiKeibaDatabase(Path(self.temp_dir) / 'test.db')
+    
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        import shutil
+        self.db.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_wal_and_pragmas(self):
+        """WALモードとPRAGMAが適用されているか"""
+        conn = self.db.get_connection()
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+    
+    def test_connection_is_reused_per_thread(self):
+        """同じスレッドでは接続が再利用され、別スレッドでは別接続になるか"""
+        conn = self.db.get_connection()
+        self.assertIs(conn, self.db.get_connection())
+        
+        # 同じDBファイルを指す別インスタンスも接続を共有する
+        other = OiKeibaDatabase(self.db.db_path)
+        self.assertIs(conn, other.get_connection())
+        
+        other_conns = []
+        thread = threading.Thread(target=lambda: other_conns.append(self.db.get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(conn, other_conns[0])
+    
+    def test_transaction_rollback(self):
+        """例外発生時にロールバックされるか"""
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B']))
+                raise RuntimeError('abort')
+        
+        self.assertTrue(self.db.get_race_data().empty)
+    
+    def test_save_and_read(self):
+        """保存したレース結果と馬の統計が取得できるか"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B', '馬C']))
+        self.db.save_race_results(make_results('R002', '2024-01-08', ['馬B', '馬A']))
+        
+        df = self.db.get_race_data()
+        self.assertEqual(len(df), 5)
+        self.assertEqual(df.iloc[0]['race_date'], '2024-01-08')
+        
+        stats = self.db.get_horse_stats('馬A')
+        self.assertEqual(stats['total_races'], 2)
+        self.assertEqual(stats['wins'], 1)
+        
+        # 名前がない・出走のない馬は出走数0の行
+        for name in (None, '新馬'):
+            stats = self.db.get_horse_stats(name)
+            self.assertListEqual(list(stats.index), list(ENTITY_STATS_MANY_COLUMNS))
+            self.assertEqual(stats['total_races'], 0)
+            self.assertEqual(stats['wins'], 0)
+    
+    def test_get_race_data_filters(self):
+        """列・期間・エンティティの絞り込みとチャンク取得"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B', '馬C']))
+        self.db.save_race_results(make_results('R002', '2024-02-01', ['馬A', '馬B']))
+        self.db.save_race_results(make_results('R003', '2024-03-01', ['馬C']))
+        
+        df = self.db.get_race_data(
+            columns=['race_id', 'horse_name'],
+            start_date='2024-01-15',
+            horse_names=['馬A', '馬C']
+        )
+        self.assertListEqual(list(df.columns), ['race_id', 'horse_name'])
+        self.assertListEqual(df['race_id'].tolist(), ['R003', 'R002'])
+        
+        df = self.db.get_race_data(end_date='2024-02-01', ascending=True)
+        self.assertListEqual(df['race_id'].unique().tolist(), ['R001', 'R002'])
+        
+        self.assertTrue(self.db.get_race_data(horse_names=[]).empty)
+        
+        chunks = list(self.db.get_race_data(columns=['race_id'], chunksize=2))
+        self.assertListEqual([len(chunk) for chunk in chunks], [2, 2, 2])
+        
+        with self.assertRaises(ValueError):
+            self.db.get_race_data(columns=['race_id; DROP TABLE race_results'])
+    
+    def test_get_race_data_compact(self):
+        """compact=Trueで省メモリな型が返されるか"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B', '馬C']))
+        
+        df = self.db.get_race_data(compact=True)
+        self.assertEqual(df['horse_name'].dtype, 'category')
+        self.assertEqual(df['weather'].dtype, 'category')
+        self.assertEqual(df['finish_position'].dtype, 'int8')
+        self.assertEqual(df['horse_weight'].dtype, 'int16')
+        self.assertEqual(df['odds'].dtype, 'float32')
+        self.assertTrue(str(df['race_date'].dtype).startswith('datetime64'))
+    
+    def test_bulk_save_counts(self):
+        """一括保存で新規件数と置換件数が返されるか"""
+        import pandas as pd
+        
+        rows = make_results('R001', '2024-01-01', ['馬A', '馬B', '馬C'])
+        counts = self.db.bulk_save_race_results(pd.DataFrame(rows), batch_size=2)
+        self.assertEqual(counts, {'inserted': 3, 'replaced': 0})
+        
+        rows = make_results('R001', '2024-01-01', ['馬A']) + make_results('R002', '2024-01-08', ['馬D'])
+        counts = self.db.bulk_save_race_results(iter(rows))
+        self.assertEqual(counts, {'inserted': 1, 'replaced': 1})
+        self.assertEqual(len(self.db.get_race_data()), 4)
+    
+    def test_bulk_writer_buffers_across_races(self):
+        """ライターが複数レースをバッファリングして書き込むか"""
+        with self.db.bulk_writer(batch_size=5) as writer:
+            writer.add(make_results('R001', '2024-01-01', ['馬A', '馬B', '馬C']))
+            self.assertTrue(self.db.get_race_data().empty)
+            writer.add(make_results('R002', '2024-01-08', ['馬A', '馬B', '馬C']))
+            self.assertEqual(len(self.db.get_race_data()), 6)
+            writer.add(make_results('R003', '2024-01-15', ['馬A']))
+        
+        self.assertEqual(len(self.db.get_race_data()), 7)
+        self.assertEqual(writer.counts, {'inserted': 7, 'replaced': 0})
+    
+    def test_bulk_writer_reports_flushed_races(self):
+        """ライターは書き込みを確定したレースIDをon_flushに渡し、収集ジャーナルは更新しないか"""
+        from src.data_collection.journal import CollectionJournal
+        journal = CollectionJournal(self.db)
+        journal.record_listing('2024-01-01', [
+            {'race_id': race_id, 'race_name': '', 'race_url': '', 'race_date': '2024-01-01'}
+            for race_id in ('R001', 'R002')
+        ])
+        
+        flushed = []
+        with self.db.bulk_writer(batch_size=2, on_flush=flushed.append) as writer:
+            writer.add(make_results('R001', '2024-01-01', ['馬A', '馬B']))
+            writer.add(make_results('R002', '2024-01-01', ['馬C']))
+        self.assertEqual(flushed, [['R001'], ['R002']])
+        self.assertEqual(journal.progress('2024-01-01', '2024-01-01')['pending'], 2)
+        
+        journal.mark_stored([race_id for race_ids in flushed for race_id in race_ids])
+        self.assertEqual(journal.progress('2024-01-01', '2024-01-01')['stored'], 2)
+    
+    def test_migration_upgrades_existing_db(self):
+        """旧スキーマのDBがデータを保ったまま最新バージョンに更新されるか"""
+        import sqlite3
+        
+        legacy_path = Path(self.temp_dir) / 'legacy.db'
+        conn = sqlite3.connect(legacy_path)
+        conn.execute('''
+            CREATE TABLE race_results (
+                race_id TEXT, race_date TEXT, race_name TEXT, course_length INTEGER,
+                course_type TEXT, weather TEXT, track_condition TEXT, horse_name TEXT,
+                finish_position INTEGER, jockey_name TEXT, trainer_name TEXT,
+                horse_weight INTEGER, odds REAL, popularity INTEGER, time_result TEXT,
+                margin TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (race_id, horse_name)
+            )
+        ''')
+        conn.executemany(
+            "INSERT INTO race_results (race_id, race_date, race_name, weather, horse_name, finish_position) "
+            "VALUES ('R001', '2024-01-01', 'テストレース', '晴', ?, ?)",
+            [('馬A', 1), ('馬B', 2)]
+        )
+        conn.commit()
+        conn.close()
+        
+        legacy = OiKeibaDatabase(legacy_path)
+        try:
+            self.assertEqual(legacy.get_schema_version(), MIGRATIONS[-1][0])
+            df = legacy.get_race_data()
+            self.assertEqual(len(df), 2)
+            self.assertEqual(set(df['race_name']), {'テストレース'})
+            # レース単位の属性はレースごとに1行
+            races = legacy.get_races()
+            self.assertEqual(races[['race_id', 'weather']].values.tolist(), [['R001', '晴']])
+            
+            # 2回目の起動では何も適用されない
+            legacy.migrate()
+            self.assertEqual(legacy.get_schema_version(), MIGRATIONS[-1][0])
+        finally:
+            legacy.close()
+    
+    def test_race_metadata_stored_once_per_race(self):
+        """レース単位の属性がracesに1行だけ保存され、ビューでは各出走行に展開されるか"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B', '馬C']))
+        self.db.save_race_results(make_results('R002', '2024-01-08', ['馬B', '馬A']))
+        
+        conn = self.db.get_connection()
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM races').fetchone()[0], 2)
+        entry_columns = {row[1] for row in conn.execute('PRAGMA table_info(race_entries)')}
+        self.assertFalse(entry_columns & {'race_name_id', 'course_length', 'weather', 'track_condition'})
+        
+        # 保存し直すとレースの属性も更新される
+        results = make_results('R002', '2024-01-08', ['馬B', '馬A'])
+        for result in results:
+            result['weather'] = '雨'
+        self.db.save_race_results(results)
+        
+        races = self.db.get_races(start_date='2024-01-08')
+        self.assertEqual(races[['race_id', 'race_name', 'weather']].values.tolist(), [['R002', 'テストレース', '雨']])
+        df = self.db.get_race_data(race_ids=['R002'])
+        self.assertEqual(set(df['weather']), {'雨'})
+        self.assertEqual(len(self.db.get_race_data()), 5)
+    
+    def test_missing_race_date_is_kept(self):
+        """開催日のない行も同じバッチの他の行と一緒に保存されるか（以前と同じくNULLのまま）"""
+        results = make_results('R001', '2024-01-01', ['馬A', '馬B']) + make_results('R002', None, ['馬C'])
+        counts = self.db.bulk_save_race_results(results)
+        
+        self.assertEqual(counts, {'inserted': 3, 'replaced': 0})
+        df = self.db.get_race_data(race_ids=['R002'])
+        self.assertEqual(df['horse_name'].tolist(), ['馬C'])
+        self.assertTrue(df['race_date'].isna().all())
+        races = self.db.get_races(race_ids=['R002'])
+        self.assertEqual(races['weather'].tolist(), ['晴'])
+    
+    def test_hot_queries_use_indexes(self):
+        """主要クエリがインデックスを使っているか"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B']))
+        
+        for name, report in self.db.check_query_plans().items():
+            self.assertTrue(report['uses_index'], f"{name}: {report['plan']}")
+    
+    def test_entity_stats_incremental_matches_rebuild(self):
+        """差分更新した集計テーブルが再集計の結果と一致するか"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B', '馬C']))
+        self.db.save_race_results(make_results('R002', '2024-01-08', ['馬B', '馬A']))
+        # 同じレースを着順を変えて保存し直す（置換分が差し引かれるか）
+        self.db.save_race_results(make_results('R002', '2024-01-08', ['馬A', '馬B']))
+        
+        horse = self.db.get_entity_stats('horse', ['馬A']).iloc[0]
+        self.assertEqual(horse['starts'], 2)
+        self.assertEqual(horse['wins'], 2)
+        self.assertEqual(horse['position_sum'], 2)
+        self.assertEqual(horse['last_race_date'], '2024-01-08')
+        
+        def load_stats(entity):
+            stats = self.db.get_entity_stats(entity)
+            return stats.sort_values(stats.columns[0]).reset_index(drop=True)
+        
+        incremental = {entity: load_stats(entity) for entity in ('horse', 'jockey', 'trainer')}
+        self.db.rebuild_entity_stats()
+        for entity, expected in incremental.items():
+            self.assertTrue(expected.equals(load_stats(entity)), entity)
+    
+    def test_entity_names_share_integer_ids(self):
+        """同じ名前は辞書テーブルの同じIDで保存されるか"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B']))
+        self.db.save_race_results(make_results('R002', '2024-01-08', ['馬B', '馬A']))
+        
+        conn = self.db.get_connection()
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM horse_names').fetchone()[0], 2)
+        
+        df = self.db.get_race_data(columns=['race_id', 'horse_name', 'horse_id'])
+        ids = df.groupby('horse_name')['horse_id'].nunique()
+        self.assertTrue((ids == 1).all())
+        self.assertEqual(df['horse_id'].nunique(), 2)
+    
+    def test_entity_stats_many(self):
+        """複数エンティティの成績をまとめて取得できるか（as_ofより前のレースのみ集計）"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B']))
+        self.db.save_race_results(make_results('R002', '2024-01-08', ['馬B', '馬A']))
+        
+        stats = self.db.get_horse_stats_many(['馬B', '馬A', '未出走馬'])
+        self.assertEqual(list(stats.index), ['馬B', '馬A', '未出走馬'])
+        self.assertEqual(stats.loc['馬A', 'total_races'], 2)
+        self.assertEqual(stats.loc['馬A', 'wins'], 1)
+        self.assertEqual(stats.loc['馬B', 'best_position'], 1)
+        self.assertEqual(stats.loc['未出走馬', 'total_races'], 0)
+        
+        as_of = self.db.get_horse_stats_many(['馬A', '馬B'], as_of='2024-01-08')
+        self.assertEqual(as_of.loc['馬A', 'total_races'], 1)
+        self.assertEqual(as_of.loc['馬B', 'wins'], 0)
+        
+        jockeys = self.db.get_jockey_stats_many(['騎手1', '騎手2'])
+        self.assertEqual(jockeys.loc['騎手1', 'wins'], 2)
+        self.assertTrue(self.db.get_trainer_stats_many([]).empty)
+        
+        # 1頭版も同じ結果を返す
+        self.assertEqual(self.db.get_horse_stats('馬A')['total_races'], 2)
+    
+    def test_query_cache_hits_and_invalidation(self):
+        """同じ読み取りはキャッシュから返り、書き込みで無効化されるか"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B']))
+        self.db.clear_query_cache()
+        
+        first = self.db.get_race_data(columns=['race_id', 'horse_name'])
+        first['horse_name'] = 'changed'  # 返り値を変更してもキャッシュには影響しない
+        second = self.db.get_race_data(columns=['race_id', 'horse_name'])
+        stats = self.db.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(set(second['horse_name']), {'馬A', '馬B'})
+        
+        self.db.save_race_results(make_results('R002', '2024-01-08', ['馬C']))
+        self.assertEqual(len(self.db.get_race_data(columns=['race_id', 'horse_name'])), 3)
+        self.assertEqual(self.db.cache_stats()['misses'], 2)
+        
+        # 別の接続（他プロセス相当）からの書き込みもPRAGMA data_versionで検出する
+        import sqlite3
+        other = sqlite3.connect(str(self.db.db_path))
+        other.execute("DELETE FROM race_entries WHERE race_id = 'R002'")
+        other.commit()
+        other.close()
+        self.assertEqual(len(self.db.get_race_data(columns=['race_id', 'horse_name'])), 2)
+    
+    def test_new_connection_keeps_query_cache(self):
+        """新しいスレッドの接続を作っただけではキャッシュが無効化されないか"""
+        import threading
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B']))
+        self.db.get_race_data(columns=['race_id', 'horse_name'])
+        before = self.db.connections.data_version()
+        
+        versions = []
+        worker = threading.Thread(target=lambda: versions.append(self.db.connections.data_version()))
+        worker.start()
+        worker.join()
+        self.assertEqual(versions, [before])
+        self.db.get_race_data(columns=['race_id', 'horse_name'])
+        self.assertEqual(self.db.cache_stats()['hits'], 1)
+    
+    def test_query_cache_evicts_by_size(self):
+        """上限サイズを超えたら古いエントリから追い出されるか"""
+        import pandas as pd
+        cache = QueryCache(max_mb=0)
+        cache.max_bytes = 2000
+        frame = pd.DataFrame({'value': range(100)})  # 約900バイト
+        cache.get('a', 1)  # バージョンを1に合わせる
+        for key in ('a', 'b', 'c'):
+            cache.put(key, 1, frame)
+        
+        self.assertIsNone(cache.get('a', 1))
+        self.assertIsNotNone(cache.get('c', 1))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        # バージョンが変わると全て破棄される
+        self.assertIsNone(cache.get('c', 2))
+    
+    def test_close_reconnects(self):
+        """close後も次回アクセス時に再接続されるか"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A']))
+        self.db.close()
+        self.assertEqual(len(self.db.get_race_data()), 1)
+
+
+class TestRaceHistorySnapshot(unittest.TestCase):
+    def setUp(self):
+        """テストセットアップ"""
+        from src.data_collection.snapshot import RaceHistorySnapshot
+        
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = OiKeibaDatabase(Path(self.temp_dir) / 'test.db')
+        self.db.save_race_results(make_results('R001', '2024-01-05', ['馬A', '馬B']))
+        self.db.save_race_results(make_results('R002', '2024-01-20', ['馬A', '馬C']))
+        self.db.save_race_results(make_results('R003', '2024-02-03', ['馬B', '馬C']))
+        self.snapshot = RaceHistorySnapshot(db=self.db, snapshot_dir=Path(self.temp_dir) / 'snapshot')
+    
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        import shutil
+        self.db.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_export_is_incremental(self):
+        """変更のあった月だけが書き直されるか"""
+        summary = self.snapshot.export(['race_results'])
+        self.assertListEqual(summary['race_results']['written'], ['2024-01', '2024-02'])
+        
+        summary = self.snapshot.export(['race_results'])
+        self.assertListEqual(summary['race_results']['written'], [])
+        
+        self.db.save_race_results(make_results('R004', '2024-02-10', ['馬A']))
+        summary = self.snapshot.export(['race_results'])
+        self.assertListEqual(summary['race_results']['written'], ['2024-02'])
+    
+    def test_export_detects_same_second_replace(self):
+        """件数の変わらない置き換えを同じ秒のうちに行っても検出されるか"""
+        self.snapshot.export(['race_results'])
+        
+        results = make_results('R003', '2024-02-03', ['馬C', '馬B'])
+        self.db.save_race_results(results)
+        summary = self.snapshot.export(['race_results'])
+        self.assertListEqual(summary['race_results']['written'], ['2024-02'])
+        
+        df = self.snapshot.load('race_results', start_date='2024-02-01')
+        self.assertEqual(df.set_index('horse_name')['finish_position'].to_dict(), {'馬C': 1, '馬B': 2})
+    
+    def test_load_with_columns_and_dates(self):
+        """列の絞り込みと期間指定で読み込めるか"""
+        self.snapshot.export()
+        
+        df = self.snapshot.load('race_results', columns=['race_id', 'horse_name'],
+                                start_date='2024-01-10', end_date='2024-02-28')
+        self.assertListEqual(list(df.columns), ['race_id', 'horse_name'])
+        self.assertListEqual(sorted(df['race_id'].unique()), ['R002', 'R003'])
+        
+        full = self.snapshot.load('race_results')
+        self.assertEqual(len(full), 6)
+        self.assertEqual(full['finish_position'].dtype, 'int64')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+開催日時点の成績特徴量のテスト
+"""
+import unittest
+import tempfile
+import shutil
+from pathlib import Path
+import sys
+import pandas as pd
+import numpy as np
+
+# プロジェクトルートをパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.data_collection.database import OiKeibaDatabase
+from src.feature_engineering.encoders import CategoryEncoder, UNKNOWN_CODE, save_encoders, load_encoders
+from src.feature_engineering.feature_store import FeatureStore, ENTITY_KEY_COLUMNS
+from src.feature_engineering.point_in_time import AsOfFeatureEngine, ENTITIES, entity_key
+from src.feature_engineering.registry import FeatureRegistry
+from src.feature_engineering.stats_index import EntityStatsIndex
+from tests.test_database import make_results
+
+
+def naive_as_of(history):
+    """行ごとに同じエンティティのその日より前の出走を絞り込んで集計（比較用）"""
+    records = []
+    for _, row in history.iterrows():
+        record = {}
+        for entity in ENTITIES:
+            key = f'{entity}_id'
+            past = history[(history[key] == row[key]) & (history['race_date'] < row['race_date'])]
+            positions = past['finish_position']
+            record[f'{entity}_starts'] = len(past)
+            record[f'{entity}_avg_position'] = positions.mean() if len(past) else np.nan
+            record[f'{entity}_win_rate'] = (positions == 1).mean() if len(past) else 0.0
+            record[f'{entity}_place_rate'] = (positions <= 3).mean() if len(past) else 0.0
+        records.append(record)
+    return pd.DataFrame(records, index=history.index)
+
+
+class TestAsOfFeatureEngine(unittest.TestCase):
+    def setUp(self):
+        """テストセットアップ"""
+        self.history = pd.DataFrame({
+            'race_id': ['R1', 'R1', 'R2', 'R2', 'R3', 'R3'],
+            'race_date': ['2024-01-01', '2024-01-01', '2024-01-01', '2024-01-01', '2024-01-08', '2024-01-08'],
+            'horse_name': ['馬A', '馬B', '馬C', '馬D', '馬A', '馬C'],
+            'jockey_name': ['騎手X', '騎手Y', '騎手X', '騎手Y', '騎手X', '騎手Y'],
+            'trainer_name': ['調教師P'] * 6,
+            'finish_position': [1, 2, 1, 2, 2, 1],
+        })
+
+    def test_excludes_same_day_and_future(self):
+        """同じ日の他のレースや未来のレースを含めない"""
+        features = AsOfFeatureEngine().fit_transform(self.history)
+
+        # 初日は騎手Xが2勝しているが、同じ日のレースには反映されない
+        self.assertTrue((features.loc[:3, 'jockey_starts'] == 0).all())
+        self.assertTrue(features.loc[:3, 'horse_avg_position'].isna().all())
+        self.assertTrue((features.loc[:3, 'trainer_win_rate'] == 0).all())
+
+        # 2日目は初日の成績だけ
+        self.assertEqual(features.loc[4, 'horse_starts'], 1)
+        self.assertEqual(features.loc[4, 'horse_avg_position'], 1.0)
+        self.assertEqual(features.loc[4, 'jockey_starts'], 2)
+        self.assertEqual(features.loc[4, 'jockey_win_rate'], 1.0)
+        self.assertEqual(features.loc[5, 'jockey_win_rate'], 0.0)
+        self.assertEqual(features.loc[5, 'trainer_starts'], 4)
+        self.assertEqual(features.loc[5, 'trainer_place_rate'], 1.0)
+
+    def test_row_order_does_not_matter(self):
+        """入力の並び順に関係なく同じ値をインデックスに揃えて返す"""
+        expected = AsOfFeatureEngine().fit_transform(self.history)
+        shuffled = self.history.sample(frac=1, random_state=1)
+        features = AsOfFeatureEngine().fit_transform(shuffled)
+
+        pd.testing.assert_frame_equal(features.sort_index(), expected)
+
+    def test_latest_state(self):
+        """最後の状態は全履歴の合計で、予測時の特徴量に使える"""
+        engine = AsOfFeatureEngine()
+        engine.fit_transform(self.history)
+
+        state = engine.latest('horse', ['馬A', '馬E'])
+        self.assertEqual(state.loc['馬A', 'starts'], 2)
+        self.assertEqual(state.loc['馬A', 'wins'], 1)
+        self.assertEqual(state.loc['馬E', 'starts'], 0)
+
+        race = pd.DataFrame({
+            'horse_name': ['馬A', '馬E'],
+            'jockey_name': ['騎手X', '騎手Z'],
+            'trainer_name': ['調教師P', '調教師P'],
+        })
+        features = engine.transform_latest(race)
+        self.assertEqual(features.loc[0, 'horse_avg_position'], 1.5)
+        self.assertEqual(features.loc[0, 'jockey_win_rate'], 2 / 3)
+        self.assertTrue(np.isnan(features.loc[1, 'horse_avg_position']))
+        self.assertEqual(features.loc[1, 'jockey_starts'], 0)
+        self.assertEqual(features.loc[1, 'trainer_starts'], 6)
+
+    def test_missing_values(self):
+        """着順がない行は集計せず、キーが欠けた行は過去の成績なしとして扱う"""
+        history = self.history.copy()
+        history['finish_position'] = history['finish_position'].astype('object')
+        history.loc[0, 'finish_position'] = None
+        history.loc[1, 'horse_name'] = None
+
+        features = AsOfFeatureEngine().fit_transform(history)
+        self.assertEqual(features.loc[4, 'horse_starts'], 0)
+        self.assertEqual(features.loc[4, 'jockey_starts'], 1)
+        self.assertEqual(features.loc[1, 'horse_starts'], 0)
+        self.assertEqual(len(features), len(history))
+
+    def test_entity_key_prefers_ids(self):
+        """整数IDが揃っていればIDをキーにする"""
+        history = self.history.assign(horse_id=[1, 2, 3, 4, 1, 3])
+        self.assertEqual(entity_key(history, 'horse'), 'horse_id')
+        self.assertEqual(entity_key(history, 'jockey'), 'jockey_name')
+
+        history.loc[0, 'horse_id'] = None
+        self.assertEqual(entity_key(history, 'horse'), 'horse_name')
+
+    def test_matches_naive_implementation(self):
+        """行ごとに過去のレースを絞り込む素朴な実装と一致する"""
+        rng = np.random.default_rng(3)
+        rows = 600
+        history = pd.DataFrame({
+            'race_date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 30, rows), unit='D'),
+            'horse_id': rng.integers(0, 40, rows),
+            'jockey_id': rng.integers(0, 10, rows),
+            'trainer_id': rng.integers(0, 8, rows),
+            'finish_position': rng.integers(1, 13, rows),
+        })
+        history['race_date'] = history['race_date'].dt.strftime('%Y-%m-%d')
+
+        expected = naive_as_of(history)
+        actual = AsOfFeatureEngine().fit_transform(history)[expected.columns]
+        np.testing.assert_allclose(
+            actual.to_numpy(dtype='float64'), expected.to_numpy(dtype='float64'), equal_nan=True
+        )
+
+
+class TestCategoryEncoder(unittest.TestCase):
+    def test_unknown_code_is_reserved(self):
+        """既知のカテゴリは1から、未知と欠損は予約した0になる"""
+        encoder = CategoryEncoder().fit(pd.Series(['騎手B', '騎手A', '騎手B', None]))
+        self.assertEqual(len(encoder), 3)
+
+        codes = encoder.transform(pd.Series(['騎手A', '騎手B', '新人騎手', None]))
+        np.testing.assert_array_equal(codes, [1, 2, UNKNOWN_CODE, UNKNOWN_CODE])
+
+    def test_min_count(self):
+        """出現回数の少ないカテゴリは訓練時から未知として扱う"""
+        values = pd.Series(['騎手A'] * 3 + ['騎手B'])
+        codes = CategoryEncoder(min_count=2).fit_transform(values)
+        np.testing.assert_array_equal(codes, [1, 1, 1, UNKNOWN_CODE])
+
+    def test_categorical_dtype(self):
+        """category型でもobject型と同じコードを返す"""
+        values = pd.Series(['良', '重', None, '不良', '良'])
+        encoder = CategoryEncoder().fit(values.iloc[:2])
+        np.testing.assert_array_equal(
+            encoder.transform(values.astype('category')), encoder.transform(values)
+        )
+
+    def test_save_and_load(self):
+        """JSONに保存して読み込んでも同じコードになる"""
+        encoder = CategoryEncoder(min_count=1).fit(pd.Series(['晴', '曇', '雨']))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / 'encoders.json'
+            save_encoders({'weather': encoder}, path, native_categorical=True)
+            encoders, native_categorical = load_encoders(path)
+
+        self.assertTrue(native_categorical)
+        values = pd.Series(['雨', '雪', '晴'])
+        np.testing.assert_array_equal(encoders['weather'].transform(values), encoder.transform(values))
+
+
+class TestFeatureStore(unittest.TestCase):
+    def setUp(self):
+        """テストセットアップ"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = OiKeibaDatabase(Path(self.temp_dir) / 'test.db')
+        self.store = FeatureStore(db=self.db, store_dir=Path(self.temp_dir) / 'features')
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def expected(self):
+        """データベースの全履歴から一度に計算した特徴量"""
+        df = self.db.get_race_data(ascending=True)
+        features = AsOfFeatureEngine(key_columns=ENTITY_KEY_COLUMNS).fit_transform(df)
+        return pd.concat([df[['race_id', 'horse_name']], features], axis=1)
+
+    def assert_matches_full_history(self):
+        stored = self.store.load()
+        expected = self.expected()
+        merged = expected.merge(stored, on=['race_id', 'horse_name'], suffixes=('', '_stored'))
+        self.assertEqual(len(merged), len(expected))
+        for column in expected.columns[2:]:
+            np.testing.assert_allclose(
+                merged[f'{column}_stored'].astype(float), merged[column].astype(float), equal_nan=True
+            )
+
+    def test_incremental_update(self):
+        """新しいレースの月だけを計算し、全履歴から計算した場合と一致する"""
+        self.db.save_race_results(make_results('R001', '2024-01-05', ['馬A', '馬B', '馬C']))
+        result = self.store.update()
+        self.assertFalse(result['incremental'])
+        self.assertEqual(result['written'], ['2024-01'])
+
+        # 同じ月に後から追加されたレース
+        self.db.save_race_results(make_results('R002', '2024-01-20', ['馬B', '馬A']))
+        result = self.store.update()
+        self.assertTrue(result['incremental'])
+        self.assertEqual(result['rows'], 5)
+
+        # 次の月のレースは前の月を読み直さない
+        self.db.save_race_results(make_results('R003', '2024-02-03', ['馬A', '馬C']))
+        result = self.store.update()
+        self.assertTrue(result['incremental'])
+        self.assertEqual(result['written'], ['2024-02'])
+        self.assertEqual(result['rows'], 2)
+
+        self.assertEqual(self.store.update()['written'], [])
+        self.assert_matches_full_history()
+
+        row = self.store.lookup(['R003']).set_index('horse_name').loc['馬A']
+        self.assertEqual(row['horse_starts'], 2)
+        self.assertEqual(row['horse_avg_position'], 1.5)
+
+    def test_backfill_recomputes_later_months(self):
+        """前の月にレースが追加されたら、それ以降の月も計算し直す"""
+        self.db.save_race_results(make_results('R001', '2024-01-05', ['馬A', '馬B']))
+        self.db.save_race_results(make_results('R003', '2024-03-01', ['馬A', '馬B']))
+        self.store.update()
+
+        self.db.save_race_results(make_results('R002', '2024-02-01', ['馬B', '馬A']))
+        result = self.store.update()
+        self.assertEqual(result['written'], ['2024-01', '2024-02', '2024-03'])
+        self.assert_matches_full_history()
+
+        # 結果が保存し直されたときも計算し直す
+        self.db.save_race_results(make_results('R002', '2024-02-01', ['馬A', '馬B']))
+        self.assertIn('2024-03', self.store.update()['written'])
+        self.assert_matches_full_history()
+
+    def test_versioned_directory(self):
+        """特徴量セットのバージョンごとにディレクトリを分ける"""
+        self.assertEqual(self.store.store_dir.name, f'v-{self.store.version}')
+        self.assertTrue(self.store.load().empty)
+        self.assertTrue(self.store.lookup(['R001']).empty)
+
+    def test_update_quietly_keeps_going(self):
+        """update_quietly()は更新の失敗を例外にしない"""
+        self.db.save_race_results(make_results('R001', '2024-01-05', ['馬A', '馬B']))
+        self.assertEqual(self.store.update_quietly()['written'], ['2024-01'])
+
+        # ストアのディレクトリがファイルになっていて書き込めない
+        blocked = Path(self.temp_dir) / 'blocked'
+        blocked.write_text('')
+        store = FeatureStore(db=self.db, store_dir=blocked)
+        with self.assertRaises(OSError):
+            store.update()
+        self.assertIsNone(store.update_quietly())
+
+
+class TestEntityStatsIndex(unittest.TestCase):
+    def setUp(self):
+        """テストセットアップ"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = OiKeibaDatabase(Path(self.temp_dir) / 'test.db')
+        self.index = EntityStatsIndex(self.db)
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_lookup_matches_stats_tables(self):
+        """名前の順に集計テーブルと同じ累計を返し、未出走は0"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B', '馬C']))
+        self.db.save_race_results(make_results('R002', '2024-01-08', ['馬B', '馬A']))
+
+        values = self.index.lookup('horse', ['馬B', '新馬', '馬A'])
+        # (starts, wins, top3, position_sum)
+        np.testing.assert_array_equal(values, [[2, 1, 2, 3], [0, 0, 0, 0], [2, 1, 2, 3]])
+
+        expected = self.db.get_entity_stats('jockey').set_index('jockey_name')
+        values = self.index.lookup('jockey', expected.index)
+        np.testing.assert_array_equal(values, expected[['starts', 'wins', 'top3', 'position_sum']].to_numpy())
+
+    def test_refresh_on_database_change(self):
+        """データベースが書き換わったときだけ読み込み直す"""
+        self.db.save_race_results(make_results('R001', '2024-01-01', ['馬A', '馬B']))
+        self.assertEqual(self.index.lookup('horse', ['馬A'])[0, 0], 1)
+        self.assertFalse(self.index.refresh())
+
+        self.db.save_race_results(make_results('R002', '2024-01-08', ['馬A']))
+        self.assertEqual(self.index.lookup('horse', ['馬A'])[0, 0], 2)
+
+        # 同じファイルの別のインスタンスからの書き込みも反映する
+        other = OiKeibaDatabase(Path(self.temp_dir) / 'test.db')
+        other.save_race_results(make_results('R003', '2024-01-15', ['馬A']))
+        self.assertEqual(self.index.lookup('horse', ['馬A'])[0, 0], 3)
+
+
+class TestFeatureRegistry(unittest.TestCase):
+    def setUp(self):
+        """テストセットアップ（totalを共有する2つのグループと無関係なグループ）"""
+        self.calls = []
+        self.registry = FeatureRegistry()
+
+        @self.registry.group('total', inputs=('a', 'b'), outputs=('total',))
+        def total(frame):
+            self.calls.append('total')
+            return pd.DataFrame({'total': frame['a'] + frame['b']})
+
+        @self.registry.group('double', inputs=('total',), outputs=('double',))
+        def double(frame):
+            self.calls.append('double')
+            return pd.DataFrame({'double': frame['total'] * 2})
+
+        @self.registry.group('share', inputs=('a', 'total'), outputs=('share',))
+        def share(frame):
+            self.calls.append('share')
+            return pd.DataFrame({'share': frame['a'] / frame['total']})
+
+        @self.registry.group('unused', inputs=('b',), outputs=('unused',))
+        def unused(frame):
+            self.calls.append('unused')
+            return pd.DataFrame({'unused': frame['b']})
+
+        self.frame = pd.DataFrame({'a': [1.0, 2.0], 'b': [3.0, 6.0]}, index=[10, 20])
+
+    def test_plan_only_needed_groups(self):
+        """要求された列に必要なグループだけを依存順に実行し、共有する中間結果は1回だけ計算する"""
+        plan = self.registry.plan(['double', 'a', 'share'], self.frame.columns)
+        self.assertEqual([group.name for group in plan.groups], ['total', 'double', 'share'])
+
+        result = plan.run(self.frame)
+        self.assertEqual(self.calls, ['total', 'double', 'share'])
+        self.assertListEqual(list(result.columns), ['double', 'a', 'share'])
+        self.assertListEqual(list(result.index), [10, 20])
+        np.testing.assert_allclose(result['double'], [8.0, 16.0])
+        np.testing.assert_allclose(result['share'], [0.25, 0.25])
+
+        self.assertEqual([item['group'] for item in plan.report], ['total', 'double', 'share'])
+        for item in plan.report:
+            self.assertEqual(item['rows'], 2)
+            self.assertGreaterEqual(item['seconds'], 0.0)
+            self.assertGreater(item['memory_mb'], 0.0)
+
+    def test_input_columns_skip_producers(self):
+        """入力のDataFrameにある列は計算済みとして使い、それを出力するグループは実行しない"""
+        frame = self.frame.assign(total=[100.0, 200.0])
+        result = self.registry.plan(['double'], frame.columns).run(frame)
+        self.assertEqual(self.calls, ['double'])
+        np.testing.assert_allclose(result['double'], [200.0, 400.0])
+
+    def test_training_and_optional_inputs(self):
+        """訓練時だけ必要な入力列は訓練時の計画で確認し、あれば読む入力列はなくてもよい"""
+        @self.registry.group('score', inputs=('a',), outputs=('score',),
+                             training_inputs=('label',), optional_inputs=('weight',))
+        def score(frame):
+            weight = frame['weight'] if 'weight' in frame.columns else 1.0
+            return pd.DataFrame({'score': frame['a'] * weight})
+
+        with self.assertRaises(ValueError):
+            self.registry.plan(['score'], self.frame.columns, is_training=True)
+        result = self.registry.plan(['score'], self.frame.columns).run(self.frame)
+        np.testing.assert_allclose(result['score'], [1.0, 2.0])
+
+        frame = self.frame.assign(label=[1, 0], weight=[2.0, 3.0])
+        result = self.registry.plan(['score'], frame.columns, is_training=True).run(frame)
+        np.testing.assert_allclose(result['score'], [2.0, 6.0])
+
+    def test_missing_columns(self):
+        """作れない列・入力列のない計画はエラー"""
+        with self.assertRaises(ValueError):
+            self.registry.plan(['unknown'], self.frame.columns)
+        with self.assertRaises(ValueError):
+            self.registry.plan(['double'], ['a'])
+        with self.assertRaises(ValueError):
+            self.registry.group('other', inputs=('a',), outputs=('total',))(lambda frame: frame)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,7 @@ from unittest.mock import Mock, patch
 sys.path.append(str(Path(__file__).parent.parent))
 
 from src.models.lightgbm_model import LightGBMModel
+from src.data_collection.database import compact_race_data
 
 class TestLightGBMModel(unittest.TestCase):
     def setUp(self):
@@ -60,6 +61,20 @@ class TestLightGBMModel(unittest.TestCase):
         # 欠損値がないか確認
         self.assertEqual(features.isnull().sum().sum(), 0)
     
+    def test_prepare_features_with_compact_dtypes(self):
+        """省メモリ型のデータでも同じ特徴量が作成されるか"""
+        compact_data = compact_race_data(self.sample_data)
+        self.assertEqual(compact_data['horse_name'].dtype, 'category')
+        self.assertEqual(compact_data['finish_position'].dtype, np.int8)
+        
+        expected = self.model.prepare_features(self.sample_data)
+        actual = LightGBMModel(model_name='test_model').prepare_features(compact_data)
+        
+        self.assertListEqual(list(expected.columns), list(actual.columns))
+        pd.testing.assert_frame_equal(
+            expected.astype(float), actual.astype(float), check_exact=False, rtol=1e-5
+        )
+    
     def test_create_horse_features(self):
         """馬の特徴量作成のテスト"""
         horse_features = self.model.create_horse_features(self.sample_data)
@@ -167,6 +182,36 @@ class TestLightGBMModel(unittest.TestCase):
             self.assertGreaterEqual(pred['confidence'], 0.0)
             self.assertLessEqual(pred['confidence'], 1.0)
     
+    def test_prediction_uses_training_plan(self):
+        """予測時はモデルの特徴量名に必要なグループだけを計算し、訓練時と同じ列を返す"""
+        training = self.model.prepare_features(self.sample_data)
+        self.assertListEqual(self.model.categorical_features, ['weather', 'track_condition', 'jockey_name', 'trainer_name'])
+        
+        race = self.sample_data.drop(columns=['finish_position']).head(3)
+        with patch.object(self.model.stats_index, 'lookup', return_value=np.zeros((3, 4), dtype='int64')):
+            features = self.model.prepare_features(race, is_training=False)
+        self.assertListEqual(list(features.columns), list(training.columns))
+        self.assertEqual(features.isnull().sum().sum(), 0)
+        
+        self.model.feature_names = ['odds', 'jockey_name']
+        features = self.model.prepare_features(race, is_training=False)
+        self.assertListEqual(list(features.columns), ['odds', 'jockey_name'])
+        self.assertListEqual([item['group'] for item in self.model.feature_report], ['base', 'entity_codes'])
+        np.testing.assert_array_equal(features['jockey_name'], training['jockey_name'].head(3))
+    
+    def test_training_plan_requires_declared_inputs(self):
+        """訓練時の計画は開催日・着順のない入力を受け付けず、予測時の計画はそれらを必要としない"""
+        from src.models.lightgbm_model import FEATURE_GROUPS, DEFAULT_FEATURE_COLUMNS
+        
+        for column in ('race_date', 'finish_position'):
+            with self.assertRaises(ValueError):
+                FEATURE_GROUPS.plan(DEFAULT_FEATURE_COLUMNS, self.sample_data.drop(columns=[column]).columns,
+                                    is_training=True)
+        
+        race = self.sample_data.drop(columns=['race_date', 'finish_position'])
+        plan = FEATURE_GROUPS.plan(DEFAULT_FEATURE_COLUMNS, race.columns)
+        self.assertIn('as_of', [group.name for group in plan.groups])
+    
     def test_label_encoder_consistency(self):
         """ラベルエンコーダーの一貫性テスト"""
         # 初回の特徴量作成
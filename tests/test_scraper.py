@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+"""
+スクレイパーと並行取得エンジンのテスト（ローカルHTTPサーバーを使用）
+"""
+import unittest
+import hashlib
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import sys
+
+import requests
+
+# プロジェクトルートをパスに追加
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.data_collection import parsers
+from src.data_collection.database import OiKeibaDatabase
+from src.data_collection.fetcher import ConcurrentFetcher, TokenBucket, HostRateLimiter, CircuitBreaker
+from src.data_collection.http_cache import HttpCache
+from src.data_collection.journal import CollectionJournal
+from src.data_collection.page_archive import PageArchive, ArchiveReparser
+from src.data_collection.pipeline import CollectionPipeline
+from src.data_collection.replay import FixtureStore, ReplayServer, build_synthetic_site
+from src.data_collection.scraper import OiKeibaScraper
+
+
+def race_list_page(race_ids):
+    """テスト用のレース一覧ページ"""
+    links = ''.join(f'<a href="/race/{race_id}/">{race_id[-2:]}R テスト特別</a>' for race_id in race_ids)
+    return f'<html><body>{links}</body></html>'
+
+
+def calendar_page(dates, course='30'):
+    """テスト用の開催カレンダーページ（dates: YYYYMMDD）"""
+    links = ''.join(
+        f'<a href="/top/race_list.html?kaisai_date={date}&jyo_cd={course}">{date[-2:]}</a>' for date in dates
+    )
+    return f'<html><body>{links}</body></html>'
+
+
+CALENDAR_2024_01 = '/top/calendar.html?year=2024&month=1&jyo_cd=30'
+
+
+def race_result_page(horses):
+    """テスト用のレース結果ページ"""
+    rows = ''.join(
+        f'<tr><td>{position}</td><td>1</td><td>{position}</td><td>{horse}</td><td>480(+2)</td>'
+        f'<td>{position * 2.5}</td><td>騎手{position}</td><td>調教師{position}</td>'
+        f'<td>1:12.{position}</td><td></td></tr>'
+        for position, horse in enumerate(horses, start=1)
+    )
+    return (
+        '<html><body><h1>テスト特別</h1>'
+        '<p class="racedata">ダ1200m / 天候:晴 / 馬場:良</p>'
+        f'<table class="race_table_01"><tr><th>着順</th></tr>{rows}</table>'
+        '</body></html>'
+    )
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """netkeibaの代わりに固定のページを返すハンドラ"""
+    pages = {}
+    latency = 0.0
+    requests = []
+    not_modified = 0
+    # パスごとに先頭の何回を503にするか
+    failures = {}
+
+    def do_GET(self):
+        StubHandler.requests.append(self.path)
+        time.sleep(StubHandler.latency)
+        if StubHandler.failures.get(self.path, 0) > 0:
+            StubHandler.failures[self.path] -= 1
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        body = StubHandler.pages.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = body.encode('utf-8')
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            StubHandler.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubHandler.pages = {}
+        StubHandler.latency = 0.0
+        StubHandler.requests = []
+        StubHandler.not_modified = 0
+        StubHandler.failures = {}
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_spaces_requests_by_rate(self):
+        """バーストを使い切った後はrateの間隔で待たされるか"""
+        now = [0.0]
+        sleeps = []
+        bucket = TokenBucket(rate=2, burst=2, clock=lambda: now[0], sleep=sleeps.append)
+
+        delays = [bucket.acquire() for _ in range(4)]
+        self.assertEqual(delays, [0.0, 0.0, 0.5, 1.0])
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+
+class TestAdaptivePacing(unittest.TestCase):
+    def test_rate_follows_latency_and_throttling(self):
+        """応答が速ければレートを上げ、遅い応答や429/5xxでは下げるか"""
+        limiter = HostRateLimiter(rate=1.0, min_rate=0.25, max_rate=1.5, target_latency=1.0)
+        url = 'http://example.com/race/1/'
+
+        for _ in range(20):
+            limiter.on_response(url, 0.1)
+        self.assertAlmostEqual(limiter.current_rate(url), 1.5)
+
+        limiter.on_response(url, 0.1, throttled=True)
+        self.assertAlmostEqual(limiter.current_rate(url), 0.75)
+
+        for _ in range(20):
+            limiter.on_response(url, 5.0)
+        self.assertAlmostEqual(limiter.current_rate(url), 0.25)
+        # 他のホストには影響しない
+        self.assertAlmostEqual(limiter.current_rate('http://example.org/'), 1.0)
+
+    def test_default_rate_never_exceeds_base(self):
+        """上限を指定しなければ、応答が速くても基準レートを超えないか"""
+        limiter = HostRateLimiter(rate=1.0, target_latency=1.0)
+        url = 'http://example.com/race/1/'
+
+        limiter.on_response(url, 0.1, throttled=True)
+        for _ in range(20):
+            limiter.on_response(url, 0.1)
+        self.assertAlmostEqual(limiter.current_rate(url), 1.0)
+
+    def test_circuit_breaker_pauses_and_probes(self):
+        """エラー率が閾値を超えたら止め、待機後の1件が成功すれば再開するか"""
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        breaker = CircuitBreaker(window=4, threshold=0.5, cooldown=30, clock=lambda: now[0], sleep=sleep)
+        for success in (True, False, False, False):
+            self.assertEqual(breaker.wait(), 0.0)
+            breaker.record(success)
+        self.assertEqual(breaker.state, 'open')
+
+        # 止めている間は待たされ、試しの1件だけ通る
+        self.assertGreaterEqual(breaker.wait(), 30)
+        self.assertEqual(breaker.state, 'half_open')
+        breaker.record(True)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(breaker.wait(), 0.0)
+
+    def test_probe_error_releases_circuit_breaker(self):
+        """試しの1件が再試行しないエラーで終わっても、ブレーカーが待ち続けないか"""
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        breaker = CircuitBreaker(window=2, threshold=0.0, cooldown=30, clock=lambda: now[0], sleep=sleep)
+        breaker.record(False)
+        breaker.record(False)
+        self.assertEqual(breaker.state, 'open')
+
+        def broken_get(url, **kwargs):
+            raise requests.exceptions.ChunkedEncodingError()
+
+        session = requests.Session()
+        session.get = broken_get
+        fetcher = ConcurrentFetcher(max_workers=1, rate=0, max_retries=0, breaker=breaker)
+        fetcher._local.session = session
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            fetcher.send('http://example.com/race/1/')
+
+        # 試しの1件が失敗したのでもう一度止め、待機後に次の1件を通す
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(breaker.opened, 2)
+        self.assertGreaterEqual(breaker.wait(), 30)
+        self.assertEqual(breaker.state, 'half_open')
+
+
+class TestParsers(unittest.TestCase):
+    def test_lxml_matches_beautifulsoup(self):
+        """lxml版のパース結果がBeautifulSoup版と一致するか"""
+        euc_page = race_result_page(['馬A', '馬B']).replace(
+            '<html>', '<html><head><meta http-equiv="Content-Type" content="text/html; charset=EUC-JP"></head>'
+        ).encode('euc_jp')
+        pages = [
+            race_result_page(['馬A', '馬B', '馬C']).encode('utf-8'),
+            euc_page,
+            # 列が足りない行や結果表のないページ
+            b'<html><body><table class="race_table_01"><tr><th>x</th></tr><tr><td>1</td></tr></table></body></html>',
+            b'<html><body><h1>no table</h1></body></html>',
+            b'',
+        ]
+        for content in pages:
+            self.assertEqual(
+                parsers.parse_race_result(content, 'R1', '2024-01-01'),
+                parsers.parse_race_result_bs4(content, 'R1', '2024-01-01')
+            )
+
+        list_page = race_list_page(['202430010101', '202430010101', '202430010102']).encode('utf-8')
+        self.assertEqual(
+            parsers.parse_race_list(list_page, '2024-01-01', 'https://db.netkeiba.com'),
+            parsers.parse_race_list_bs4(list_page, '2024-01-01', 'https://db.netkeiba.com')
+        )
+        self.assertEqual(parsers.parse_race_result(euc_page, 'R1', '2024-01-01')[0]['horse_name'], '馬A')
+
+    def test_number_helpers(self):
+        """数値変換が従来どおりか"""
+        self.assertEqual(parsers.safe_int('12(降)'), 12)
+        self.assertEqual(parsers.safe_int('中止'), 0)
+        self.assertEqual(parsers.safe_float('3.5倍'), 3.5)
+        self.assertEqual(parsers.safe_float(''), 0.0)
+        self.assertEqual(parsers.extract_horse_weight('482(-4)'), 482)
+        self.assertEqual(parsers.extract_horse_weight('計不'), 0)
+
+
+class TestConcurrentFetcher(StubServerTestCase):
+    def test_overlaps_slow_requests(self):
+        """遅いレスポンスを並行して待てるか"""
+        StubHandler.latency = 0.2
+        StubHandler.pages = {f'/page/{i}': 'ok' for i in range(8)}
+        fetcher = ConcurrentFetcher(max_workers=8, rate=0)
+
+        start = time.monotonic()
+        results = list(fetcher.map(lambda i: fetcher.get(f"{self.base_url}/page/{i}").text, range(8)))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(sorted(item for item, _, _ in results), list(range(8)))
+        self.assertTrue(all(text == 'ok' and error is None for _, text, error in results))
+        # 逐次なら1.6秒かかる
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(fetcher.stats['requests'], 8)
+
+    def test_respects_per_host_rate(self):
+        """並行数が多くてもホストごとのレートを超えないか"""
+        StubHandler.pages = {f'/page/{i}': 'ok' for i in range(5)}
+        fetcher = ConcurrentFetcher(max_workers=5, rate=10, burst=1)
+
+        start = time.monotonic()
+        list(fetcher.map(lambda i: fetcher.get(f"{self.base_url}/page/{i}"), range(5)))
+        # 1件目は即時、残り4件は0.1秒間隔
+        self.assertGreaterEqual(time.monotonic() - start, 0.35)
+
+    def test_reports_errors(self):
+        """HTTPエラーは例外として結果と一緒に返るか"""
+        fetcher = ConcurrentFetcher(max_workers=2, rate=0)
+        results = list(fetcher.map(lambda path: fetcher.get(f"{self.base_url}{path}"), ['/missing']))
+
+        self.assertIsNotNone(results[0][2])
+        self.assertEqual(fetcher.stats['errors'], 1)
+
+
+    def test_retries_transient_errors(self):
+        """503は間隔を空けて再試行し、404は再試行しないか"""
+        StubHandler.pages = {'/race/1/': 'ok'}
+        StubHandler.failures = {'/race/1/': 2}
+        fetcher = ConcurrentFetcher(max_workers=2, rate=0, max_retries=3, backoff_base=0.01)
+
+        self.assertEqual(fetcher.get(f"{self.base_url}/race/1/").text, 'ok')
+        self.assertEqual(fetcher.stats['retries'], 2)
+        self.assertEqual(fetcher.stats['requests'], 3)
+
+        with self.assertRaises(requests.HTTPError):
+            fetcher.get(f"{self.base_url}/race/missing/")
+        self.assertEqual(StubHandler.requests.count('/race/missing/'), 1)
+
+    def test_gives_up_after_max_retries(self):
+        """再試行の上限を超えたらエラーにするか"""
+        StubHandler.pages = {'/race/1/': 'ok'}
+        StubHandler.failures = {'/race/1/': 5}
+        fetcher = ConcurrentFetcher(max_workers=2, rate=0, max_retries=2, backoff_base=0.01)
+
+        with self.assertRaises(requests.HTTPError):
+            fetcher.get(f"{self.base_url}/race/1/")
+        self.assertEqual(StubHandler.requests.count('/race/1/'), 3)
+
+
+class TestHttpCache(StubServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = HttpCache(Path(self.temp_dir) / 'http')
+        self.fetcher = ConcurrentFetcher(max_workers=2, rate=0, cache=self.cache)
+        StubHandler.pages = {'/race/1/': race_result_page(['馬A']), '/race/2/': race_result_page(['馬B'])}
+
+    def tearDown(self):
+        import shutil
+        self.cache.connections.close_all()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_immutable_pages_are_not_refetched(self):
+        """確定済みページは2回目以降ネットワークに出ないか"""
+        first = self.fetcher.get(f"{self.base_url}/race/1/", immutable=True)
+        second = self.fetcher.get(f"{self.base_url}/race/1/", immutable=True)
+
+        self.assertEqual(first.text, second.text)
+        self.assertEqual(len(StubHandler.requests), 1)
+        self.assertEqual(self.fetcher.stats['requests'], 1)
+        self.assertEqual(self.cache.summary()['hits'], 1)
+
+    def test_revalidates_with_etag(self):
+        """未確定ページはETagで条件付きGETし、304ならキャッシュの本文を返すか"""
+        first = self.fetcher.get(f"{self.base_url}/race/1/")
+        second = self.fetcher.get(f"{self.base_url}/race/1/")
+
+        self.assertEqual(len(StubHandler.requests), 2)
+        self.assertEqual(StubHandler.not_modified, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.cache.summary()['revalidated'], 1)
+
+    def test_provisional_pages_are_revalidated_once_settled(self):
+        """確定前に保存したページは、確定後の初回に再検証して新しい本文を取り、以降は再利用するか"""
+        url = f"{self.base_url}/race/1/"
+        self.fetcher.get(url)
+        StubHandler.pages['/race/1/'] = race_result_page(['馬A', '馬B'])
+
+        settled = self.fetcher.get(url, immutable=True)
+        self.assertIn('馬B', settled.text)
+        again = self.fetcher.get(url, immutable=True)
+        self.assertEqual(again.text, settled.text)
+        self.assertEqual(StubHandler.requests, ['/race/1/', '/race/1/'])
+
+    def test_provisional_pages_upgrade_on_not_modified(self):
+        """確定後の再検証が304なら保存済みの本文を確定済みにするか"""
+        url = f"{self.base_url}/race/1/"
+        self.fetcher.get(url)
+        self.fetcher.get(url, immutable=True)
+        self.fetcher.get(url, immutable=True)
+
+        self.assertEqual(StubHandler.not_modified, 1)
+        self.assertEqual(len(StubHandler.requests), 2)
+
+    def test_evicts_least_recently_used(self):
+        """上限を超えたら最終利用が古いものから削除されるか"""
+        self.fetcher.get(f"{self.base_url}/race/1/", immutable=True)
+        self.cache.max_bytes = self.cache.summary()['size_mb'] * 1024 * 1024 * 1.5
+        self.fetcher.get(f"{self.base_url}/race/2/", immutable=True)
+
+        summary = self.cache.summary()
+        self.assertEqual(summary['evicted'], 1)
+        self.assertEqual(summary['entries'], 1)
+        # 残っているのは新しい方
+        self.fetcher.get(f"{self.base_url}/race/2/", immutable=True)
+        self.assertEqual(StubHandler.requests, ['/race/1/', '/race/2/'])
+
+
+class TestOiKeibaScraper(StubServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = OiKeibaDatabase(Path(self.temp_dir) / 'test.db')
+        fetcher = ConcurrentFetcher(max_workers=4, rate=0)
+        self.scraper = OiKeibaScraper(db=self.db, fetcher=fetcher, base_url=self.base_url)
+
+    def tearDown(self):
+        import shutil
+        self.db.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_get_race_list_keeps_date_order(self):
+        """並行取得しても日付順のレース一覧になるか"""
+        StubHandler.latency = 0.05
+        StubHandler.pages = {
+            CALENDAR_2024_01: calendar_page(['20240101', '20240103']),
+            '/race/list/3020240101/': race_list_page(['202430010101', '202430010102']),
+            '/race/list/3020240103/': race_list_page(['202430010301']),
+        }
+
+        races = self.scraper.get_race_list(datetime(2024, 1, 1), datetime(2024, 1, 3))
+        self.assertEqual([race['race_id'] for race in races], ['202430010101', '202430010102', '202430010301'])
+        self.assertEqual(races[-1]['race_date'], '2024-01-03')
+        # カレンダー1件と開催日の一覧2件（開催のない1/2は取得しない）
+        self.assertEqual(len(StubHandler.requests), 3)
+        self.assertNotIn('/race/list/3020240102/', StubHandler.requests)
+
+    def test_run_scraping_saves_results(self):
+        """一覧取得から結果の保存まで通して動くか"""
+        StubHandler.pages = {
+            CALENDAR_2024_01: calendar_page(['20240101']),
+            '/race/list/3020240101/': race_list_page(['202430010101', '202430010102']),
+            '/race/202430010101/': race_result_page(['馬A', '馬B']),
+            '/race/202430010102/': race_result_page(['馬C', '馬D', '馬E']),
+        }
+
+        race_list = self.scraper.get_race_list(datetime(2024, 1, 1), datetime(2024, 1, 1))
+        CollectionPipeline(self.scraper, use_processes=False).run(race_list)
+
+        df = self.db.get_race_data(ascending=True)
+        self.assertEqual(len(df), 5)
+        first = df[df['horse_name'] == '馬A'].iloc[0]
+        self.assertEqual(first['course_length'], 1200)
+        self.assertEqual(first['course_type'], 'ダート')
+        self.assertEqual(first['horse_weight'], 480)
+        self.assertEqual(first['jockey_name'], '騎手1')
+
+
+    def test_get_race_list_without_record_writes_nothing(self):
+        """ドライラン（record=False）ではジャーナルにも開催カレンダーにも保存しないか"""
+        StubHandler.pages = {
+            CALENDAR_2024_01: calendar_page(['20240101', '20240103']),
+            '/race/list/3020240101/': race_list_page(['202430010101']),
+            '/race/list/3020240103/': race_list_page(['202430010301']),
+        }
+
+        races = self.scraper.get_race_list(datetime(2024, 1, 1), datetime(2024, 1, 3), record=False)
+        self.assertEqual([race['race_id'] for race in races], ['202430010101', '202430010301'])
+        conn = self.db.get_connection()
+        for table in ('collection_dates', 'collection_races', 'calendar_months', 'meeting_days'):
+            self.assertEqual(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], 0, table)
+
+    def test_race_links_are_deduplicated(self):
+        """同じレースへの重複リンクは1件にまとめられるか"""
+        StubHandler.pages = {
+            CALENDAR_2024_01: calendar_page(['20240101']),
+            '/race/list/3020240101/': race_list_page(['202430010101', '202430010101', '202430010102']),
+        }
+
+        races = self.scraper.get_race_list(datetime(2024, 1, 1), datetime(2024, 1, 1))
+        self.assertEqual([race['race_id'] for race in races], ['202430010101', '202430010102'])
+
+    def test_resume_fetches_only_missing_races(self):
+        """--resume相当では一覧取得済みの日付と保存済みのレースを取り直さないか"""
+        StubHandler.pages = {
+            CALENDAR_2024_01: calendar_page(['20240101', '20240102']),
+            '/race/list/3020240101/': race_list_page(['202430010101', '202430010102']),
+            '/race/list/3020240102/': race_list_page([]),
+            '/race/202430010101/': race_result_page(['馬A', '馬B']),
+        }
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 2)
+
+        race_list = self.scraper.plan_races(start, end)
+        CollectionPipeline(self.scraper, use_processes=False).run(race_list)
+
+        progress = self.scraper.journal.progress(start, end)
+        self.assertEqual((progress['stored'], progress['failed']), (1, 1))
+
+        # 2回目は確定済みの月のカレンダーも一覧ページも取得せず、失敗したレースだけが対象になる
+        StubHandler.requests = []
+        race_list = self.scraper.plan_races(start, end, resume=True)
+        self.assertEqual([race['race_id'] for race in race_list], ['202430010102'])
+        self.assertEqual(StubHandler.requests, [])
+
+    def test_pipeline_parses_in_processes(self):
+        """パイプラインがプロセスプールでパースして保存し、失敗したレースを記録するか"""
+        StubHandler.pages = {
+            CALENDAR_2024_01: calendar_page(['20240101']),
+            '/race/list/3020240101/': race_list_page(['202430010101', '202430010102', '202430010103']),
+            '/race/202430010101/': race_result_page(['馬A', '馬B']),
+            '/race/202430010102/': race_result_page(['馬C', '馬D', '馬E']),
+        }
+        start = end = datetime(2024, 1, 1)
+
+        race_list = self.scraper.plan_races(start, end)
+        summary = CollectionPipeline(self.scraper, parse_workers=2, queue_size=1).run(race_list)
+
+        self.assertEqual((summary['stored'], summary['failed'], summary['inserted']), (2, 1, 5))
+        self.assertEqual(len(self.db.get_race_data()), 5)
+        self.assertEqual(summary['metrics']['stages']['parse']['items'], 2)
+        self.assertLessEqual(summary['metrics']['queues']['fetched']['max_depth'], 1)
+
+        progress = self.scraper.journal.progress(start, end)
+        self.assertEqual((progress['stored'], progress['failed']), (2, 1))
+
+    def test_pipeline_retries_failed_races(self):
+        """一時的なエラーで失敗したレースを最後に取り直すか（404は取り直さない）"""
+        StubHandler.pages = {
+            CALENDAR_2024_01: calendar_page(['20240101']),
+            '/race/list/3020240101/': race_list_page(['202430010101', '202430010102', '202430010103']),
+            '/race/202430010101/': race_result_page(['馬A', '馬B']),
+            '/race/202430010102/': race_result_page(['馬C']),
+        }
+        StubHandler.failures = {'/race/202430010102/': 1}
+        self.scraper.fetcher.max_retries = 0
+        start = end = datetime(2024, 1, 1)
+
+        race_list = self.scraper.plan_races(start, end)
+        summary = CollectionPipeline(self.scraper, parse_workers=2, use_processes=False).run(race_list)
+
+        self.assertEqual((summary['stored'], summary['failed'], summary['retried']), (2, 1, 1))
+        self.assertEqual(StubHandler.requests.count('/race/202430010103/'), 1)
+        progress = self.scraper.journal.progress(start, end)
+        self.assertEqual((progress['stored'], progress['failed']), (2, 1))
+
+    def test_calendar_parses_only_oi_meeting_days(self):
+        """カレンダーから大井の当月の開催日だけを抽出するか"""
+        content = calendar_page(['20240105', '20240106', '20231231']) + calendar_page(['20240107'], course='44')
+        days = self.scraper.calendar.parse_calendar(content, 2024, 1)
+        self.assertEqual(days, ['2024-01-05', '2024-01-06'])
+
+    def test_calendar_falls_back_to_every_day(self):
+        """カレンダーが取得できない月は全日を対象にするか"""
+        days = self.scraper.calendar.meeting_days(datetime(2024, 1, 30), datetime(2024, 2, 2))
+        self.assertEqual([day.strftime('%m-%d') for day in days], ['01-30', '01-31', '02-01', '02-02'])
+
+
+
+
+class TestPageArchive(StubServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.archive = PageArchive(Path(self.temp_dir) / 'pages', segment_mb=0.001)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_appends_versions_and_rolls_segments(self):
+        """同じ内容は追記せず、変わった内容は最新版として読めるか（セグメントは上限で分かれる）"""
+        url = 'https://db.netkeiba.com/race/202430010101/'
+        self.assertTrue(self.archive.append(url, race_result_page(['馬A']).encode('utf-8')))
+        self.assertFalse(self.archive.append(url, race_result_page(['馬A']).encode('utf-8')))
+        self.assertTrue(self.archive.append(url, race_result_page(['馬B'] * 50).encode('utf-8')))
+        self.archive.append('https://db.netkeiba.com/race/list/3020240101/', race_list_page(['202430010101']).encode('utf-8'))
+
+        self.assertIn('馬B', self.archive.get_race('202430010101').decode('utf-8'))
+        self.assertIsNone(self.archive.get_race('missing'))
+        summary = self.archive.summary()
+        self.assertEqual((summary['pages'], summary['races']), (3, 1))
+        self.assertGreater(len(list(Path(self.temp_dir, 'pages').glob('segment-*'))), 1)
+
+        # 開き直しても読める
+        reopened = PageArchive(Path(self.temp_dir) / 'pages')
+        self.assertEqual(reopened.get(url), self.archive.get(url))
+
+    def test_fetcher_archives_network_pages(self):
+        """ネットワークから取得したページだけがアーカイブされるか"""
+        StubHandler.pages = {'/race/202430010101/': race_result_page(['馬A'])}
+        cache = HttpCache(Path(self.temp_dir) / 'http')
+        fetcher = ConcurrentFetcher(max_workers=2, rate=0, cache=cache, archive=self.archive)
+        url = f"{self.base_url}/race/202430010101/"
+
+        fetcher.get(url, immutable=True)
+        fetcher.get(url, immutable=True)
+        self.assertEqual(self.archive.summary()['pages'], 1)
+        self.assertEqual(self.archive.get(url), race_result_page(['馬A']).encode('utf-8'))
+
+    def test_reparse_upserts_results(self):
+        """アーカイブから並列に再パースして保存し直すか"""
+        db = OiKeibaDatabase(Path(self.temp_dir) / 'test.db')
+        races = [
+            {'race_id': race_id, 'race_name': '', 'race_url': '', 'race_date': '2024-01-01'}
+            for race_id in ('202430010101', '202430010102')
+        ]
+        CollectionJournal(db).record_listing('2024-01-01', races)
+        self.archive.append('http://x/race/202430010101/', race_result_page(['馬A', '馬B']).encode('utf-8'))
+        self.archive.append('http://x/race/202430010102/', race_result_page(['馬C']).encode('utf-8'))
+        self.archive.append('http://x/race/202430019999/', race_result_page(['馬D']).encode('utf-8'))
+
+        result = ArchiveReparser(self.archive, db, workers=2).run()
+        self.assertEqual((result['parsed'], result['skipped'], result['inserted']), (2, 1, 3))
+        self.assertEqual(CollectionJournal(db).progress('2024-01-01', '2024-01-01')['stored'], 2)
+
+        result = ArchiveReparser(self.archive, db, workers=2, use_processes=False).run(race_ids=['202430010101'])
+        self.assertEqual((result['inserted'], result['replaced']), (0, 2))
+        self.assertEqual(len(db.get_race_data()), 3)
+        db.close()
+
+class TestReplayHarness(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = FixtureStore(Path(self.temp_dir) / 'fixtures')
+        build_synthetic_site(self.store, datetime(2024, 1, 1), days=2, races_per_day=3, runners=4)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_fixture_store_round_trip(self):
+        """記録したページと索引を読み直せるか"""
+        store = FixtureStore(Path(self.temp_dir) / 'fixtures')
+        self.assertEqual(len(store), len(self.store))
+        self.assertEqual(store.meeting_dates(), ['20240101', '20240102'])
+        self.assertIn(b'race_table_01', store.get('/race/202430010101/'))
+        self.assertIsNone(store.get('/race/unknown/'))
+
+    def test_scraper_runs_against_replay_server(self):
+        """ローカルサーバーのフィクスチャで一覧取得から保存まで通るか"""
+        db = OiKeibaDatabase(Path(self.temp_dir) / 'replay.db')
+        with ReplayServer(self.store, latency=0.01) as server:
+            fetcher = ConcurrentFetcher(max_workers=4, rate=0)
+            scraper = OiKeibaScraper(db=db, fetcher=fetcher, base_url=server.base_url)
+            race_list = scraper.plan_races(datetime(2024, 1, 1), datetime(2024, 1, 2))
+            summary = CollectionPipeline(scraper, parse_workers=2, use_processes=False).run(race_list)
+            # カレンダー1件 + 一覧2件 + 結果6件
+            self.assertEqual(server.stats['requests'], 9)
+        self.assertEqual((summary['stored'], summary['inserted']), (6, 24))
+        db.close()
+
+    def test_injects_errors(self):
+        """指定した割合でエラーを返すか"""
+        with ReplayServer(self.store, error_rate=1.0) as server:
+            fetcher = ConcurrentFetcher(max_workers=1, rate=0, max_retries=0)
+            with self.assertRaises(requests.HTTPError) as context:
+                fetcher.get(f"{server.base_url}/race/202430010101/")
+            self.assertEqual(context.exception.response.status_code, 503)
+            self.assertEqual(server.stats['errors'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -55,7 +55,7 @@ if page == "ダッシュボード":
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_races = len(db.get_race_data())
+        total_races = len(db.get_race_data(columns=['race_id']))
         st.metric("総レース数", total_races)
     
     with col2:
@@ -97,9 +97,7 @@ if page == "ダッシュボード":
 elif page == "データ分析":
     st.title("📊 データ分析")
     
-    data = db.get_race_data()
-    
-    if data.empty:
+    if db.get_race_data(limit=1, columns=['race_id']).empty:
         st.warning("分析するデータがありません。")
     else:
         # 期間選択
@@ -109,11 +107,12 @@ elif page == "データ分析":
         with col2:
             end_date = st.date_input("終了日", value=datetime.now())
         
-        # フィルタリング
-        filtered_data = data[
-            (pd.to_datetime(data['race_date']) >= pd.to_datetime(start_date)) &
-            (pd.to_datetime(data['race_date']) <= pd.to_datetime(end_date))
-        ]
+        # 期間内の分析に必要な列だけを取得
+        filtered_data = db.get_race_data(
+            columns=['race_id', 'race_date', 'horse_name', 'jockey_name', 'finish_position', 'popularity'],
+            start_date=start_date.strftime('%Y-%m-%d'),
+            end_date=end_date.strftime('%Y-%m-%d')
+        )
         
         st.markdown(f"**分析期間**: {start_date} ～ {end_date}")
         st.markdown(f"**対象レース数**: {filtered_data['race_id'].nunique()}件")